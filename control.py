@@ -688,6 +688,28 @@ def start_threads(settings, cam_desc):
     channel_accum.cs.add_source("show",src=process_thread,tag="frames/new/show",sync=True,kind="show")
     image_saver=controller.sync_controller(save_thread)
     image_saver.ca.setup_queue_ram(settings.get("saving/max_queue_ram",4*2**30))
+    image_saver.ca.setup_overload(policy=settings.get("saving/overload/policy","drop"),threshold=settings.get("saving/overload/threshold",0.75),
+        recover=settings.get("saving/overload/recover",0.5),decimation=settings.get("saving/overload/decimation",2),
+        roi=settings.get("saving/overload/roi",None),compression_level=settings.get("saving/overload/compression_level",1))
+    image_saver.ca.setup_preprocessing(rois=settings.get("saving/preprocess/rois",[]),binning=settings.get("saving/preprocess/binning",1),
+        bin_mode=settings.get("saving/preprocess/bin_mode","mean"),decimation=settings.get("saving/preprocess/decimation",1),
+        pack_bits=settings.get("saving/preprocess/pack_bits",0))
+    image_saver.ca.setup_checksums(algorithm=settings.get("saving/checksums/algorithm","none"),
+        block_size=int(settings.get("saving/checksums/block_size",16)*2**20),max_inflight=settings.get("saving/checksums/max_inflight",8))
+    for name,sink in settings.get("saving/sinks",{}).items():
+        image_saver.ca.setup_sink(name,path=sink.get("path",None),format=sink.get("format","tiff"),decimation=sink.get("decimation",1),
+            roi=sink.get("roi",None),max_rate=sink.get("max_rate",None))
+    image_saver.ca.setup_streaming(writer_threads=settings.get("saving/writer_threads",0),max_inflight_chunks=settings.get("saving/max_inflight_chunks",4),
+        raw_preallocate=settings.get("saving/raw/preallocate",True),raw_drop_cache=settings.get("saving/raw/drop_cache",False),
+        hdf5_chunk_frames=settings.get("saving/hdf5/chunk_frames",0),hdf5_compression=settings.get("saving/hdf5/compression","none"),
+        hdf5_compression_opts=settings.get("saving/hdf5/compression_opts",None),
+        compression_codec=settings.get("saving/compression/codec","zlib"),compression_level=settings.get("saving/compression/level",1),
+        compression_shuffle=settings.get("saving/compression/shuffle","byte"),compression_threads=settings.get("saving/compression/threads",2),
+        frame_info_format=settings.get("saving/frame_info_format","text"),
+        adaptive_chunking=settings.get("saving/chunking/adaptive",True),chunk_period=settings.get("saving/chunking/period",0.2),
+        chunk_target_size=int(settings.get("saving/chunking/target_size",8)*2**20),chunk_max_size=int(settings.get("saving/chunking/max_size",128)*2**20),
+        stripe_folders=settings.get("saving/stripes/folders",[]),stripe_size=int(settings.get("saving/stripes/size",8)*2**20),
+        journal_period=settings.get("saving/journal_period",1.))
 
 _displayed_forms=[]  # against garbage collection
 @controller.exsafe
@@ -349,22 +349,26 @@ class IRingMultiFrameFilter(IFrameFilter):
             self.reshape_buffer(frame_shape=frames.shape[1:],frame_dtype=frames.dtype)
         start=self.buffer_step-self._buffer_step_part-1
         self._buffer_step_part=(len(frames)+self._buffer_step_part)%self.buffer_step
-        frames=frames[start::self.buffer_step]
-        if len(frames)>=len(self.buffer):
-            self.buffer[:]=frames[-len(self.buffer):]
-            self.end_pos=0
-            self.filled=True
-        elif len(frames)+self.end_pos>=len(self.buffer):
-            frames_left=len(self.buffer)-self.end_pos
-            self.buffer[self.end_pos:]=frames[:frames_left]
-            self.buffer[:len(frames)-frames_left]=frames[frames_left:]
-            self.end_pos=len(frames)-frames_left
-            self.filled=True
-        else:
-            self.buffer[self.end_pos:self.end_pos+len(frames)]=frames
-            self.end_pos+=len(frames)
+        frames=frames[start::self.buffer_step][-len(self.buffer):]
+        while len(frames):
+            nadd=min(len(frames),len(self.buffer)-self.end_pos)
+            self.update_buffer(frames[:nadd],self.end_pos)
+            self.buffer[self.end_pos:self.end_pos+nadd]=frames[:nadd]
+            self.end_pos+=nadd
+            if self.end_pos==len(self.buffer):
+                self.end_pos=0
+                self.filled=True
+            frames=frames[nadd:]
         if "buff_accum" in self.p:
             self.p["buff_accum"]="{} / {}".format(len(self.buffer) if self.filled else self.end_pos,len(self.buffer))
+    def update_buffer(self, frames, pos):
+        """
+        Called right before new `frames` are written into the buffer starting from position `pos`.
+
+        At this point the buffer still holds the previous frames, so the frames which are about to be evicted are ``self.buffer[pos:pos+len(frames)]``
+        (they are only valid if ``self.filled`` is ``True``); the written block never wraps around the buffer end.
+        Can be used to implement incremental processing (e.g., running sums); any accumulated state should then be reset in :meth:`reshape_buffer`.
+        """
     def generate_frame(self):
         if self.process_incomplete and not self.filled:
             return self.process_buffer(self.buffer,0,self.end_pos)
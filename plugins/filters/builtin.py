@@ -105,65 +105,229 @@ def _movavg(buffer):
             for j in range(c):
                 result[i,j]+=buffer[k][i,j]
     return result/n
+def _get_sum_dtype(dtype):
+    """Get dtype of a running frame sum: ``int64`` for integer frames (exact), ``float64`` (or ``complex128``) otherwise"""
+    dtype=np.dtype(dtype)
+    return np.dtype("int64") if dtype.kind in "iub" else np.result_type(dtype,np.float64)
+def _ring_sum(buffer, start, count, dtype):
+    """Sum `count` frames of the ring `buffer` starting from position `start` (possibly wrapping around the buffer end)"""
+    start%=len(buffer)
+    stop=start+count
+    result=buffer[start:min(stop,len(buffer))].sum(axis=0,dtype=dtype)
+    if stop>len(buffer):
+        result+=buffer[:stop-len(buffer)].sum(axis=0,dtype=dtype)
+    return result
 class FastMovingAverageFilter(base.IRingMultiFrameFilter):
     """
     Filter that generates moving average (averages last ``self.p["length"]`` received frames)
 
     Faster version of :class:`MovingAverageFilter`.
+    In the incremental mode keeps a running sum of the buffer frames (``int64`` for integer frames, ``float64`` otherwise),
+    so the cost of generating a frame does not depend on the window length.
     """
     _class_name="moving_avg"
     _class_caption="Moving average"
     _class_description="Averages a given number of consecutive frames into a single frame. Frames are averaged within a sliding window."
-    def setup(self):
+    def setup(self, incremental=True, resum_period=None):
+        """
+        Setup the filter.
+
+        Args:
+            incremental: if ``True``, keep a running sum updated on every received frame; otherwise, sum the whole buffer on every generated frame
+            resum_period: number of added frames between exact buffer resummations, which bound the floating point drift of a float running sum
+                (integer sums are exact and never resummed); ``None`` means once per buffer length
+        """
         super().setup(process_incomplete=True)
         self.add_parameter("length",label="Number of frames",kind="int",limit=(1,None),default=20)
         self.add_parameter("period",label="Frame step",kind="int",limit=(1,None),default=1)
+        self.incremental=incremental
+        self.resum_period=resum_period
+        self._sum=None
+        self._sum_updates=0
     def set_parameter(self, name, value):
         super().set_parameter(name,value)
         buffer_size=value if name=="length" else None
         buffer_step=value if name=="period" else None
         self.reshape_buffer(buffer_size,buffer_step)
+    def reshape_buffer(self, buffer_size=None, buffer_step=None, frame_shape=None, frame_dtype=None):
+        super().reshape_buffer(buffer_size=buffer_size,buffer_step=buffer_step,frame_shape=frame_shape,frame_dtype=frame_dtype)
+        self._sum=None
+    def update_buffer(self, frames, pos):
+        if self._sum is None:
+            return
+        if len(frames)==len(self.buffer): # whole buffer is replaced; cheaper to resum it on the next generated frame
+            self._sum=None
+            return
+        self._sum+=frames.sum(axis=0,dtype=self._sum.dtype)
+        if self.filled:
+            self._sum-=self.buffer[pos:pos+len(frames)].sum(axis=0,dtype=self._sum.dtype)
+        self._sum_updates+=len(frames)
+    def _resum_buffer(self, buffer, filled):
+        self._sum=buffer[:filled].sum(axis=0,dtype=_get_sum_dtype(buffer.dtype))
+        self._sum_updates=0
     def process_buffer(self, buffer, start, filled):
         if not filled:
             return None
+        if self.incremental:
+            if self._sum is None:
+                self._resum_buffer(buffer,filled)
+            elif self._sum.dtype.kind!="i":
+                resum_period=len(buffer) if self.resum_period is None else self.resum_period
+                if self._sum_updates>=resum_period:
+                    self._resum_buffer(buffer,filled)
+            return self._sum/filled
         if buffer.ndim>3:
             return np.concatenate([self.process_buffer(buffer[...,ch],start,filled)[...,None] for ch in range(buffer.shape[-1])],axis=-1)
         return _movavg(buffer[:filled])
 
 
 
-class MovingAccumulatorFilter(base.IMultiFrameFilter):
+@nb.njit(fastmath=True,parallel=False,nogil=True)
+def _sorted_window_update(window, count, new, old):
+    """
+    Update per-pixel sorted windows with a new frame.
+
+    `window` is a 2D array with one sorted row per pixel, of which the first `count` elements are valid,
+    `new` is the flattened new frame, and `old` is the flattened removed frame (``None`` if the window is still filling up).
+    """
+    for i in range(window.shape[0]):
+        row=window[i]
+        v=new[i]
+        if old is None:
+            k=count
+            while k>0 and row[k-1]>v:
+                row[k]=row[k-1]
+                k-=1
+        else:
+            k=np.searchsorted(row[:count],old[i])
+            while k+1<count and row[k+1]<v:
+                row[k]=row[k+1]
+                k+=1
+            while k>0 and row[k-1]>v:
+                row[k]=row[k-1]
+                k-=1
+        row[k]=v
+class MovingAccumulatorFilter(base.IRingMultiFrameFilter):
     """
     Filter that does per-pixel accumulation of several frames in a row.
 
     Extension of :class:`MovingAverageFilter` (identical when ``self.p["kind"]=="mean"``).
+    Mean and standard deviation are updated incrementally (Welford algorithm) on every received frame.
+    The median is exact: each pixel keeps a sorted copy of its window values, where the removed value is replaced by the new one on every received frame,
+    so the median is simply read out of the middle of the sorted window.
+    Min and max are calculated over blocks of about ``sqrt(length)`` frames, which are only recalculated when they are overwritten,
+    so the whole buffer is never rescanned.
     """
     _class_name="moving_acc"
     _class_caption="Moving accumulator"
     _class_description="Combine a given number of consecutive frames into a single frame using the given method. Frames are combined within a sliding window."
-    def setup(self):
+    def setup(self, resum_period=None):
+        """
+        Setup the filter.
+
+        Args:
+            resum_period: number of added frames between exact recalculations of the running mean and variance, which bound the floating point drift;
+                ``None`` means once per buffer length
+        """
         super().setup(process_incomplete=True)
         self.add_parameter("length",label="Number of frames",kind="int",limit=(1,None),default=20)
         self.add_parameter("period",label="Frame step",kind="int",limit=(1,None),default=1)
         self.add_parameter("kind",label="Combination method",kind="select",options={"mean":"Mean","median":"Median","min":"Min","max":"Max","std":"Std dev"})
+        self.resum_period=resum_period
+        self._reset_accumulators()
     def set_parameter(self, name, value):
         super().set_parameter(name,value)
-        buffer_size=value if name=="length" else None
-        buffer_step=value if name=="period" else None
-        self.reshape_buffer(buffer_size,buffer_step)
-    def process_buffer(self, buffer):
-        if not buffer:
+        if name in ["length","period"]:
+            buffer_size=value if name=="length" else None
+            buffer_step=value if name=="period" else None
+            self.reshape_buffer(buffer_size,buffer_step)
+        elif name=="kind":
+            self._reset_accumulators()
+    def reshape_buffer(self, buffer_size=None, buffer_step=None, frame_shape=None, frame_dtype=None):
+        super().reshape_buffer(buffer_size=buffer_size,buffer_step=buffer_step,frame_shape=frame_shape,frame_dtype=frame_dtype)
+        self._reset_accumulators()
+    def _reset_accumulators(self):
+        self._mean=None
+        self._m2=None
+        self._count=0
+        self._updates=0
+        self._block_size=None
+        self._block_aggs=None
+        self._block_dirty=None
+        self._sorted=None
+        self._sorted_count=0
+    def _welford_add(self, frame):
+        self._count+=1
+        delta=frame-self._mean
+        self._mean+=delta/self._count
+        self._m2+=delta*(frame-self._mean)
+    def _welford_remove(self, frame):
+        self._count-=1
+        delta=frame-self._mean
+        self._mean-=delta/self._count
+        self._m2-=delta*(frame-self._mean)
+    def _welford_reset(self, frames):
+        self._mean=frames.sum(axis=0,dtype=_get_sum_dtype(frames.dtype))/len(frames)
+        self._m2=((frames-self._mean)**2).sum(axis=0)
+        self._count=len(frames)
+        self._updates=0
+    def update_buffer(self, frames, pos):
+        if self._mean is not None:
+            for i,f in enumerate(frames): # add first, so that the count never drops to zero
+                self._welford_add(f)
+                if self.filled:
+                    self._welford_remove(self.buffer[pos+i])
+            self._updates+=len(frames)
+        if self._block_dirty is not None:
+            b=self._block_size
+            self._block_dirty[pos//b:(pos+len(frames)-1)//b+1]=True
+        if self._sorted is not None:
+            for i,f in enumerate(frames):
+                new=np.asarray(f,dtype=self._sorted.dtype).ravel()
+                old=self.buffer[pos+i].ravel() if self.filled else None
+                _sorted_window_update(self._sorted,self._sorted_count,new,old)
+                if not self.filled:
+                    self._sorted_count+=1
+    def _get_median(self, buffer, filled):
+        if self._sorted is None:
+            self._sorted=np.empty((int(np.prod(buffer.shape[1:])),len(buffer)),dtype=buffer.dtype)
+            self._sorted[:,:filled]=np.sort(buffer[:filled].reshape(filled,-1),axis=0).T
+            self._sorted_count=filled
+        n=self._sorted_count
+        if n%2:
+            median=self._sorted[:,n//2].astype(np.float64)
+        else:
+            median=(self._sorted[:,n//2-1].astype(np.float64)+self._sorted[:,n//2])/2
+        return median.reshape(buffer.shape[1:])
+    def _get_block_aggregate(self, buffer, filled):
+        func=np.min if self.p["kind"]=="min" else np.max
+        if self._block_aggs is None:
+            b=self._block_size=max(int(np.ceil(len(buffer)**.5)),1)
+            nblocks=(len(buffer)-1)//b+1
+            self._block_aggs=np.empty((nblocks,)+buffer.shape[1:],dtype=buffer.dtype)
+            self._block_dirty=np.ones(nblocks,dtype=bool)
+        b=self._block_size
+        nvalid=(filled-1)//b+1
+        for k in np.nonzero(self._block_dirty[:nvalid])[0]:
+            self._block_aggs[k]=func(buffer[k*b:min((k+1)*b,filled)],axis=0)
+        self._block_dirty[:nvalid]=False
+        return func(self._block_aggs[:nvalid],axis=0)
+    def process_buffer(self, buffer, start, filled):
+        if not filled:
             return None
-        if self.p["kind"]=="mean":
-            return np.mean(buffer,axis=0)
-        if self.p["kind"]=="median":
-            return np.median(buffer,axis=0)
-        if self.p["kind"]=="min":
-            return np.min(buffer,axis=0)
-        if self.p["kind"]=="max":
-            return np.max(buffer,axis=0)
-        if self.p["kind"]=="std" and len(buffer)>1:
-            return np.std(buffer,axis=0)
+        kind=self.p["kind"]
+        if kind in ["mean","std"]:
+            resum_period=len(buffer) if self.resum_period is None else self.resum_period
+            if self._mean is None or self._updates>=resum_period:
+                self._welford_reset(buffer[:filled])
+            if kind=="mean":
+                return self._mean.copy()
+            if filled>1:
+                return np.sqrt(np.maximum(self._m2,0)/filled)
+            return None
+        if kind=="median":
+            return self._get_median(buffer,filled)
+        return self._get_block_aggregate(buffer,filled)
 
 
 @nb.njit(fastmath=True,parallel=False,nogil=True) # buffer is guranteed to stay constant during execution, so can lift GIL; parallel mode is unstable, shouldn't be used
@@ -186,32 +350,84 @@ class FastMovingAverageSubtractionFilter(base.IRingMultiFrameFilter):
     Finds the difference between the average of the last ``self.p["length"]`` received frames and the average of the preceding ``self.p["length"]`` frames.
 
     Faster version of :class:`MovingAverageSubtractionFilter`.
+    In the incremental mode keeps running sums of the two frame blocks: on every new frame it is added to the recent block sum,
+    the oldest frame of the recent block moves to the old block sum, and the oldest frame of the old block is evicted,
+    so the cost of generating a frame does not depend on the window length.
     """
     _class_name="moving_avg_sub"
     _class_caption="Moving average subtract"
     _class_description=("Averages two consecutive frame blocks into two individual frames and takes their difference. "
         "Similar to running background subtraction, but with some additional time averaging.")
-    def setup(self):
+    def setup(self, incremental=True, resum_period=None):
+        """
+        Setup the filter.
+
+        Args:
+            incremental: if ``True``, keep running block sums updated on every received frame; otherwise, sum the whole buffer on every generated frame
+            resum_period: number of added frames between exact buffer resummations, which bound the floating point drift of float running sums
+                (integer sums are exact and never resummed); ``None`` means once per buffer length
+        """
         super().setup()
         self.add_parameter("length",label="Number of frames",kind="int",limit=(1,None),default=20)
         self.add_parameter("period",label="Frame step",kind="int",limit=(1,None),default=1)
+        self.incremental=incremental
+        self.resum_period=resum_period
+        self._old_sum=None
+        self._recent_sum=None
+        self._sum_updates=0
     def set_parameter(self, name, value):
         super().set_parameter(name,value)
         buffer_size=value*2 if name=="length" else None
         buffer_step=value if name=="period" else None
         self.reshape_buffer(buffer_size,buffer_step)
+    def reshape_buffer(self, buffer_size=None, buffer_step=None, frame_shape=None, frame_dtype=None):
+        super().reshape_buffer(buffer_size=buffer_size,buffer_step=buffer_step,frame_shape=frame_shape,frame_dtype=frame_dtype)
+        self._old_sum=self._recent_sum=None
+    def update_buffer(self, frames, pos):
+        if self._old_sum is None: # sums are only initialized once the buffer is filled
+            return
+        n,nadd=len(self.buffer),len(frames)
+        if nadd==n: # whole buffer is replaced; cheaper to resum it on the next generated frame
+            self._old_sum=self._recent_sum=None
+            return
+        l=n//2
+        moved=_ring_sum(self.buffer,pos-l,min(nadd,l),self._old_sum.dtype) # oldest frames of the recent block
+        if nadd>l: # some of the new frames go straight into the old block
+            moved+=frames[:nadd-l].sum(axis=0,dtype=self._old_sum.dtype)
+        self._recent_sum+=frames.sum(axis=0,dtype=self._recent_sum.dtype)
+        self._recent_sum-=moved
+        self._old_sum+=moved
+        self._old_sum-=self.buffer[pos:pos+nadd].sum(axis=0,dtype=self._old_sum.dtype)
+        self._sum_updates+=nadd
+    def _resum_buffer(self, buffer, start):
+        l=len(buffer)//2
+        sum_dtype=_get_sum_dtype(buffer.dtype)
+        self._old_sum=_ring_sum(buffer,start,l,sum_dtype)
+        self._recent_sum=_ring_sum(buffer,start+l,l,sum_dtype)
+        self._sum_updates=0
     def process_buffer(self, buffer, start, filled):
         if not filled:
             return None
+        if self.incremental and len(buffer)%2==0:
+            if self._old_sum is None:
+                self._resum_buffer(buffer,start)
+            elif self._old_sum.dtype.kind!="i":
+                resum_period=len(buffer) if self.resum_period is None else self.resum_period
+                if self._sum_updates>=resum_period:
+                    self._resum_buffer(buffer,start)
+            return (self._old_sum-self._recent_sum)/(len(buffer)//2)
         if buffer.ndim>3:
             return np.concatenate([self.process_buffer(buffer[...,ch],start,filled)[...,None] for ch in range(buffer.shape[-1])],axis=-1)
         return _movavgsub(buffer,start)
 
 
 
-class TimeMapFilter(base.IMultiFrameFilter):
+class TimeMapFilter(base.IRingMultiFrameFilter):
     """
     A filter which plots a time dependence of a line cut.
+
+    Only the averaged line cuts are stored in the ring buffer, while the full frame is kept only for the most recent frame.
+    Whenever the cut region changes, the accumulated cuts are reset.
     """
     _class_name="time_map"
     _class_caption="Time map"
@@ -229,11 +445,14 @@ class TimeMapFilter(base.IMultiFrameFilter):
         self.add_linepos_parameter(default=None)
         self.select_plotter("map")
         self.add_rectangle("selection",(0,0),(0,0))
+        self._last_frame=None
+        self._cut_region=None
     def set_parameter(self, name, value):
         super().set_parameter(name,value)
-        buffer_size=value if name=="length" else None
-        buffer_step=value if name=="period" else None
-        self.reshape_buffer(buffer_size,buffer_step)
+        if name in ["length","period"]:
+            buffer_size=value if name=="length" else None
+            buffer_step=value if name=="period" else None
+            self.reshape_buffer(buffer_size,buffer_step)
         if name in ["linepos","orientation","track_lines"] and self.p["show_map_info"]=="frame" and self.p["track_lines"] and self.p["linepos"]:
             idx=0 if self.p["orientation"]=="rows" else 1
             self.set_parameter("position",int(self.p["linepos"][idx]))
@@ -250,11 +469,19 @@ class TimeMapFilter(base.IMultiFrameFilter):
             return axis,(start,stop),(0,shape[1])
         else:
             return axis,(0,shape[0]),(start,stop)
-    def process_buffer(self, buffer):
-        if not buffer:
+    def receive_frames(self, frames):
+        self._last_frame=frames[-1].copy()
+        axis,rs,cs=region=self._get_region(frames.shape[1:])
+        if self._cut_region!=region:
+            if self.buffer is not None:
+                self.reshape_buffer()
+            self._cut_region=region
+        super().receive_frames(np.mean(frames[:,rs[0]:rs[1],cs[0]:cs[1]],axis=axis+1))
+    def process_buffer(self, buffer, start, filled):
+        if not filled:
             return None
         if self.p["show_map_info"]=="frame":
-            frame=buffer[-1]
+            frame=self._last_frame
             _,rs,cs=self._get_region(frame.shape)
             corners=np.column_stack([rs,cs])
             self.change_rectangle("selection",center=corners.mean(axis=0),size=np.abs(corners[1]-corners[0]),visible=True)
@@ -262,16 +489,24 @@ class TimeMapFilter(base.IMultiFrameFilter):
             return frame
         self.change_rectangle("selection",visible=False)
         self.select_plotter("map")
-        axis,rs,cs=self._get_region(buffer[0].shape)
-        img=np.full((self.p["length"],buffer[0].shape[1-axis])+buffer[-1].shape[2:],np.nan)
-        img[:len(buffer)]=np.mean(np.array(buffer)[:,rs[0]:rs[1],cs[0]:cs[1]],axis=axis+1)
+        img=np.full(buffer.shape,np.nan)
+        if filled<len(buffer):
+            img[:filled]=buffer[:filled]
+        else:
+            img[:len(buffer)-start]=buffer[start:]
+            img[len(buffer)-start:]=buffer[:start]
         return img
 
 
 
-class DifferenceMatrixFilter(base.IMultiFrameFilter):
+class DifferenceMatrixFilter(base.IRingMultiFrameFilter):
     """
     A filter which generated a matrix plot with the RMS differences between different frames.
+
+    Keeps a ring buffer of flattened ``float64`` frames together with their squared norms and their Gram matrix,
+    and only recalculates the rows and columns corresponding to the newly added frames.
+    To reduce the rounding errors, all frames are stored relative to the first frame received after the buffer reset,
+    and the products are accumulated in double precision, since the differences are obtained by subtracting large numbers.
     """
     _class_name="diff_matrix"
     _class_caption="Difference matrix"
@@ -280,21 +515,54 @@ class DifferenceMatrixFilter(base.IMultiFrameFilter):
         super().setup(process_incomplete=True)
         self.add_parameter("length",label="Number of frames",kind="int",limit=(2,None),default=20)
         self.add_parameter("period",label="Frame step",kind="int",limit=(1,None),default=1)
+        self._frame_shape=None
+        self._reset_matrix()
     def set_parameter(self, name, value):
         super().set_parameter(name,value)
         buffer_size=value if name=="length" else None
         buffer_step=value if name=="period" else None
         self.reshape_buffer(buffer_size,buffer_step)
-    def _calc_matrix(self, buffer):
-        buffer=np.asarray(buffer,dtype=float).reshape((len(buffer),-1))
-        sqs=np.sum(buffer**2,axis=1)
-        sqss=sqs[:,None]+sqs[None,:]
-        prods=np.tensordot(buffer,buffer.T,axes=1)
-        return (sqss-2*prods)/buffer.shape[1]
-    def process_buffer(self, buffer):
-        if len(buffer)<2:
+    def reshape_buffer(self, buffer_size=None, buffer_step=None, frame_shape=None, frame_dtype=None):
+        super().reshape_buffer(buffer_size=buffer_size,buffer_step=buffer_step,frame_shape=frame_shape,frame_dtype=frame_dtype)
+        self._reset_matrix()
+    def _reset_matrix(self):
+        self._reference=None
+        self._norms=None
+        self._gram=None
+        self._dirty=None
+    def receive_frames(self, frames):
+        frames_flat=frames.reshape((len(frames),-1))
+        if self.buffer is None or self._frame_shape!=frames.shape[1:]:
+            self._frame_shape=frames.shape[1:]
+            self.reshape_buffer(frame_shape=frames_flat.shape[1:],frame_dtype=np.float64)
+        if self._reference is None:
+            self._reference=frames_flat[0].astype(np.float64)
+        super().receive_frames(frames_flat-self._reference)
+    def update_buffer(self, frames, pos):
+        if self._dirty is not None:
+            self._dirty[pos:pos+len(frames)]=True
+    def _update_matrix(self, buffer, filled):
+        if self._gram is None or len(self._gram)!=len(buffer):
+            self._norms=np.zeros(len(buffer))
+            self._gram=np.zeros((len(buffer),len(buffer)))
+            self._dirty=np.ones(len(buffer),dtype=bool)
+        rows=np.nonzero(self._dirty[:filled])[0]
+        if len(rows):
+            new_frames=buffer[rows]
+            self._norms[rows]=np.einsum("ij,ij->i",new_frames,new_frames)
+            prods=np.dot(new_frames,buffer[:filled].T)
+            self._gram[rows,:filled]=prods
+            self._gram[:filled,rows]=prods.T
+            self._dirty[rows]=False
+    def process_buffer(self, buffer, start, filled):
+        if filled<2:
             return None
-        img=np.full((self.p["length"],self.p["length"]),np.nan)
-        img[:len(buffer),:len(buffer)]=self._calc_matrix(buffer)
+        self._update_matrix(buffer,filled)
+        sqs=self._norms[:filled]
+        mat=(sqs[:,None]+sqs[None,:]-2*self._gram[:filled,:filled])/buffer.shape[1]
+        if start: # put the oldest frame first
+            mat=np.roll(mat,(-start,-start),axis=(0,1))
+        img=np.full((len(buffer),len(buffer)),np.nan)
+        img[:filled,:filled]=mat
         np.fill_diagonal(img,np.nan)
-        return img
\ No newline at end of file
+        return img
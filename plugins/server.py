@@ -207,6 +207,15 @@ class ServerCommThread(controller.QTaskThread):
         if name=="stop":
             self.plugin.save_control(start=False)
             return "success"
+        if name=="benchmark":
+            result=self.plugin.benchmark_disk(args)
+            if result is None:
+                raise IncomingMessageError("wrong_request","Benchmark can not be performed during saving or another benchmark",{"value":name})
+            return result
+        if name=="event":
+            if not self.plugin.trigger_event(args.get("description")):
+                raise IncomingMessageError("wrong_request","Event can only be triggered during the event capture saving",{"value":name})
+            return "success"
         if name=="snap":
             source=args.get("source")
             self.plugin.save_control(mode="snap",start=True,source=source,params=args)
@@ -348,6 +357,20 @@ class ServerPlugin(base.IPlugin):
     def save_control(self, mode="full", start=True, source=None, params=None):
         """Perform save control operation"""
         self.guictl.call_thread_method("toggle_saving",mode,start=start,source=source,change_params=params,no_popup=True)
+    def benchmark_disk(self, params=None):
+        """Perform the disk benchmark at the saving destination, wait until it is done, and return its results"""
+        sync=self.guictl.call_thread_method("benchmark_disk",change_params=params)
+        result=sync.get_value_sync() if sync is not None else None
+        if result is None:
+            return None
+        saver=self.extctls["saver"]
+        ctl=controller.get_controller()
+        while saver.v["benchmark"]["status"]=="running":
+            ctl.sleep(0.05)
+        return saver.v["benchmark"]
+    def trigger_event(self, desc=None):
+        """Trigger an event in the event capture saving mode; return ``True`` if the event has been triggered"""
+        return self.guictl.call_thread_method("trigger_event",desc)
     def cam_control(self, action, value=None):
         """Perform cam control operation"""
         if action=="acq/start":
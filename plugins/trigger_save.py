@@ -9,12 +9,16 @@ import time
 class TriggerSavePlugin(base.IPlugin):
     """
     Plugin for automatic starting of saving either on timer, or on maximal value of a plotted frame.
+
+    In the ``"event"`` save mode, the saving is started once in the event capture mode, and each trigger saves an event
+    containing the given number of frames before and after the trigger.
     """
     _class_name="trigger_save"
     _default_start_order=10
     def setup(self):
         self._last_save_timer=None
         self._last_save_image=None
+        self._last_skipped_trigger=None
         self._acquired_videos=None
         self._trigger_display_time=0.5
         self.trig_modes=["timer","image"]
@@ -31,7 +35,9 @@ class TriggerSavePlugin(base.IPlugin):
     
     def setup_gui(self):
         self.table=self.gui.add_plugin_box("params","Save trigger",cache_values=True)
-        self.table.add_combo_box("save_mode",options={"full":"Full","snap":"Snap"},label="Save mode")
+        self.table.add_combo_box("save_mode",options={"full":"Full","snap":"Snap","event":"Event"},label="Save mode")
+        self.table.add_num_edit("event_pre_frames",100,limiter=(0,None,"coerce","int"),formatter="int",label="Event pre-trigger frames")
+        self.table.add_num_edit("event_post_frames",100,limiter=(0,None,"coerce","int"),formatter="int",label="Event post-trigger frames")
         self.table.add_check_box("limit_videos",caption="Limit number of videos",value=False)
         self.table.add_num_edit("max_videos",1,limiter=(1,None,"coerce","int"),formatter="int",label="Number of videos",add_indicator=True)
         trig_mode_names={"timer":"Timer","image":"Image"}
@@ -58,8 +64,10 @@ class TriggerSavePlugin(base.IPlugin):
             self.table.set_enabled("frame_source",trigger_mode=="image")
             self.table.set_enabled("image_trigger_threshold",trigger_mode=="image")
             self.table.set_enabled("enabled",not (trigger_mode=="image" and self.table.v["frame_source"]==-1))
+            self.table.set_enabled(["event_pre_frames","event_post_frames"],self.table.v["save_mode"]=="event")
             self._update_trigger_status("armed")
         self.table.vs["trigger_mode"].connect(setup_gui_state)
+        self.table.vs["save_mode"].connect(setup_gui_state)
         self.table.vs["frame_source"].connect(setup_gui_state)
         setup_gui_state()
 
@@ -83,7 +91,17 @@ class TriggerSavePlugin(base.IPlugin):
         self.table.w["frame_source"].set_options(options=options,index_values=index_values,index=0 if reset_value else None)
     @controller.call_in_gui_thread
     def _start_save(self, mode):
-        self.guictl.call_thread_method("toggle_saving",mode=mode,start=True,no_popup=True)
+        if mode=="event":
+            if not self.guictl.call_thread_method("saving_in_progress"): # check saver directly, since the resource status can lag behind
+                event_params={"event_pre_frames":self.table.v["event_pre_frames"],"event_post_frames":self.table.v["event_post_frames"]}
+                self.guictl.call_thread_method("toggle_saving",mode="full",start=True,change_params=event_params,no_popup=True)
+            last_video=self.table.v["limit_videos"] and self._acquired_videos+1>=self.table.v["max_videos"]
+            if not self.guictl.call_thread_method("trigger_event",self._acquired_videos,stop_after=last_video): # e.g., a normal saving is already running
+                self._last_skipped_trigger=time.time()
+                self._update_trigger_status("skipped (saving busy)")
+                return
+        else:
+            self.guictl.call_thread_method("toggle_saving",mode=mode,start=True,no_popup=True)
         self._acquired_videos+=1
         self.table.i["max_videos"]=self._acquired_videos
         if self._acquired_videos>=self.table.v["max_videos"] and self.table.v["limit_videos"]:
@@ -91,13 +109,17 @@ class TriggerSavePlugin(base.IPlugin):
     def _saving_in_progress(self):
         saving_status=self.extctls["resource_manager"].cs.get_resource("process_activity","saving/streaming").get("status","off")
         return saving_status!="off"
+    def _can_start_save(self):
+        if self._last_video:
+            return False
+        return self.table.v["save_mode"]=="event" or not self._saving_in_progress()
     def check_timer_trigger(self):
         """Check saving timer and start saving if it's passed"""
         enabled=self.table.v["enabled"]
         self.ctl.v["enabled"]=enabled
         if enabled and self.table.v["trigger_mode"]=="timer":
             t=time.time()
-            if not (self._saving_in_progress() or self._last_video) and (self._last_save_timer is None or t>self._last_save_timer+self.table.v["period"]):
+            if self._can_start_save() and (self._last_save_timer is None or t>self._last_save_timer+self.table.v["period"]):
                 self._start_save(self.table.v["save_mode"])
                 self._last_save_timer=t
         else:
@@ -116,10 +138,12 @@ class TriggerSavePlugin(base.IPlugin):
             if self.table.v["frame_source"]==src:
                 if self._last_save_image is None or t>self._last_save_image+dead_time:
                     if np.any(frame>self.table.v["image_trigger_threshold"]):
-                        if not (self._saving_in_progress() or self._last_video) and self.table.v["enabled"]:
+                        if self._can_start_save() and self.table.v["enabled"]:
                             self._start_save(self.table.v["save_mode"])
                         self._last_save_image=t
-                if self._last_save_image is not None and t<self._last_save_image+self._trigger_display_time:
+                if self._last_skipped_trigger is not None and t<self._last_skipped_trigger+self._trigger_display_time:
+                    self._update_trigger_status("skipped (saving busy)")
+                elif self._last_save_image is not None and t<self._last_save_image+self._trigger_display_time:
                     self._update_trigger_status("triggered")
                 elif self._last_save_image is not None and t<self._last_save_image+dead_time:
                     self._update_trigger_status("dead time")
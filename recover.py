@@ -0,0 +1,43 @@
+# Copyright (C) 2021  Alexey Shkarin
+
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+import os
+import sys
+import argparse
+if __name__=="__main__":
+    sys.path.append(os.path.split(os.path.abspath(sys.argv[0]))[0])  # add the file location to the search path
+    parser=argparse.ArgumentParser(description="Recover recordings interrupted by a crash using their saving journals")
+    parser.add_argument("journal",nargs="+",help="saving journal path (file with _journal.jsonl suffix)")
+    parser.add_argument("--force","-f",help="repair the files even if the journal shows that the saving has been properly finished",action="store_true")
+    args=parser.parse_args()
+
+from utils.services.framestream import recover_recording
+
+
+if __name__=="__main__":
+    for path in args.journal:
+        try:
+            result=recover_recording(path,force=args.force)
+        except (OSError,ValueError,KeyError) as err:
+            print("{}: recovery failed: {}".format(path,err))
+            continue
+        if result["status"]=="complete":
+            print("{}: saving has been properly finished ({} frames), nothing to recover".format(path,result["saved"]))
+        elif result["status"]=="unsupported":
+            print("{}: recovery of HDF5 files is not supported".format(path))
+        else:
+            print("{}: recovered {} frames ({} after the last journal record)".format(path,result["saved"],result["recovered"]))
+            for f in result["files"]:
+                print("    repaired {}".format(f))
@@ -8,6 +8,11 @@ import os
 import datetime
 import re
 
+try:
+    import h5py
+except ImportError:
+    h5py=None
+
 
 
 class MessageLogWindow(container.QWidgetContainer):
@@ -73,7 +78,7 @@ class MessageLogWindow(container.QWidgetContainer):
 
 _error_description={
     "none":("None","None"),
-    "tiff_size_exceeded":("TIFF exceeded 2GB","TIFF files do not support sizes above 2GB. Consider using file splitting or switch to a different format."),
+    "tiff_size_exceeded":("TIFF exceeded 4GB","TIFF files do not support sizes above 4GB. Consider using file splitting or switch to a different format."),
     "single_shot_overflow":("Buffer overflow","Single-shot buffer overflow. Consider expanding buffer size in Preferences."),
     }
 def _get_error_message(err, long=False):
@@ -82,6 +87,21 @@ def _get_error_message(err, long=False):
     if err[0]=="write_os_error":
         return "Writing produced an OS error '{}'. Most likely the path is invalid, the location is read-only, or the drive is full.".format(err[1]) if long else "Write error"
     return "Error"
+def _get_benchmark_message(result):
+    """Get disk benchmark result description and its color (``None`` for the default color)"""
+    status=result.get("status")
+    if status=="running":
+        return "Running...",None
+    if status=="error":
+        return "Error: {}".format(result.get("error")),"red"
+    text="{:.0f} Mb/s, {:.0f} FPS, p99 {:.0f} ms".format(result["throughput"]/2**20,result["fps"],result["latency/p99"]*1E3)
+    if result["sustainable"] is None:
+        return text,None
+    if result["sustainable"]:
+        return text+" (OK)","green"
+    if result["overflow_time"] is not None:
+        return text+" (overflow in {:.0f} s)".format(result["overflow_time"]),"red"
+    return text+" (latency spikes)","red"
 class SaveBox_GUI(container.QGroupBoxContainer):
     """
     Saving controller widget.
@@ -118,7 +138,10 @@ class SaveBox_GUI(container.QGroupBoxContainer):
             self.params.add_combo_box("on_name_conflict",label="On duplicate name: ",
                 options=["Overwrite","Append","Rename"],index_values=["overwrite","append","rename"],value="rename")
         self.params.add_spacer(6)
-        self.params.add_combo_box("format",label="Format",options=["Raw binary","TIFF","Big TIFF"],index_values=["raw","tiff","bigtiff"])
+        formats=[("Raw binary","raw"),("Raw memory-mapped","raw_mmap"),("Compressed","compressed"),("TIFF","tiff"),("Big TIFF","bigtiff")]
+        if h5py is not None:
+            formats.append(("HDF5","hdf5"))
+        self.params.add_combo_box("format",label="Format",options=[f[0] for f in formats],index_values=[f[1] for f in formats])
         self.params.add_num_edit("batch_size",1,label="Frames",formatter="int",limiter=(1,None,"coerce","int"),)
         self.params.add_toggle_button("limit_frames","Limit",location=(-1,2,1,1))
         self.params.vs["limit_frames"].connect(lambda v: self.params.set_enabled("batch_size",v))
@@ -150,6 +173,8 @@ class SaveBox_GUI(container.QGroupBoxContainer):
             self.message_log_window.move(gui_utils.get_top_parent(self).rect().center()-self.message_log_window.rect().center())
             self.message_log_window.show()
         self.params.vs["show_log_window"].connect(show_message_log)
+        self.params.add_button("benchmark_disk","Benchmark disk",location=(-1,2,1,1))
+        self.params.vs["benchmark_disk"].connect(lambda v: self.cam_ctl.benchmark_disk())
         self.params.add_child("message_log_window",self.message_log_window,gui_values_path="message_log_window",location="skip")
         self.params.add_spacer(5)
         with self.params.using_new_sublayout("snap_header","hbox"):
@@ -200,7 +225,7 @@ class SaveBox_GUI(container.QGroupBoxContainer):
         self.setEnabled(False)
 
     # Build a dictionary of camera parameters from the controls
-    _default_ext={"raw":".bin","cam":".cam","tiff":".tiff","bigtiff":".btf"}
+    _default_ext={"raw":".bin","raw_mmap":".bin","compressed":".ccf","cam":".cam","tiff":".tiff","bigtiff":".btf","hdf5":".h5"}
     _allowed_ext={k:[e] for k,e in _default_ext.items()}
     _allowed_ext["tiff"].append(".tif")
     _path_gens={"pfx":"{date}_{name}","sfx":"{name}_{date}","folder":"{date}/{name}"}
@@ -220,7 +245,7 @@ class SaveBox_GUI(container.QGroupBoxContainer):
         if as_folder:
             return os.path.exists(os.path.join(path))
         folder,name=os.path.split(path)
-        for sfx in ["settings.dat","frameinfo.dat","background.bin","eventlog.dat"]:
+        for sfx in ["settings.dat","frameinfo.dat","frameinfo.bin","background.bin","eventlog.dat","index.bin"]:
             if os.path.exists(os.path.join(folder,"{}_{}".format(name,sfx))):
                 return True
         if split:
@@ -301,7 +326,7 @@ class SaveBox_GUI(container.QGroupBoxContainer):
             self.w["saving"].set_value(True,notify_value_change=False)
             self.message_log_window.on_start_recording()
         self.message_log_window.update()
-        block_on_record=["path","browse","add_datetime","make_folder","on_name_conflict","format","limit_frames","do_filesplit","pretrigger_enabled","save_settings","stream_mode"]
+        block_on_record=["path","browse","add_datetime","make_folder","on_name_conflict","format","limit_frames","do_filesplit","pretrigger_enabled","save_settings","stream_mode","benchmark_disk"]
         self.params.set_enabled(block_on_record,not record_in_progress)
         self.params.set_enabled(["batch_size"],self.v["limit_frames"] and not record_in_progress)
         self.params.set_enabled(["filesplit"],self.v["do_filesplit"] and not record_in_progress)
@@ -349,6 +374,7 @@ class SaveStatus_GUI(param_table.StatusTable):
         self.add_num_label("frames/pretrigger_frames",formatter=("int"),label="Pretrigger frames:")
         self.add_num_label("frames/pretrigger_ram",formatter=("int"),label="Pretrigger RAM:")
         self.add_num_label("frames/pretrigger_skipped",formatter=("int"),label="Pretrigger missed:")
+        self.add_text_label("frames/benchmark",label="Disk benchmark:")
         self.add_padding()
     def show_parameters(self, params):
         """Update camera status lines"""
@@ -375,6 +401,9 @@ class SaveStatus_GUI(param_table.StatusTable):
             self.v["frames/pretrigger_skipped"]="0"
             self.w["frames/pretrigger_skipped"].setStyleSheet("")
             self.v["frames/pretrigger_ram"]="0 / 0 Mb"
+        if params.get("frames/benchmark") is not None:
+            self.v["frames/benchmark"],color=_get_benchmark_message(params["frames/benchmark"])
+            self.w["frames/benchmark"].setStyleSheet("color: {}; font-weight: bold".format(color) if color else "")
         if self.cam_ctl.save_thread:
             if self.v["saving"]=="Finishing saving":
                 self._finishing_saving_time.trigger(restart=False)
@@ -34,6 +34,7 @@ class GenericCameraCtl(container.QContainer):
         self.settings=settings or {}
         self.frame_tag=frame_tag
         self.no_popup=False
+        self._overload_paused=False
     
     def setup(self):
         super().setup()
@@ -43,6 +44,8 @@ class GenericCameraCtl(container.QContainer):
         self.ctl.subscribe_sync(self.receive_frame,self.frame_src_thread,tags=self.frame_tag,limit_queue=1)
         self.ctl.subscribe_sync(lambda *args: self.recv_status_update(args[-1]),self.cam_thread,tags="status/connection")
         self.ctl.subscribe_sync(lambda src,tag,val: self.plot_control(*val),tags="image_plotter/control",limit_queue=-1)
+        if self.save_thread:
+            self.ctl.subscribe_sync(lambda src,tag,val: self.on_saving_overload(val),self.save_thread,tags="saving/overload")
         if self.resource_manager is not None:
             self.resource_manager.cs.add_resource("frame/display","standard",caption="Standard",src=self.frame_src_thread,tag=self.frame_tag,frame=None)
             self.ctl.subscribe_sync(lambda *args: self.frames_sources_updates.emit(),srcs=self.resource_manager_thread,tags=["resource/added","resource/removed"])
@@ -55,6 +58,8 @@ class GenericCameraCtl(container.QContainer):
         self.ctl.add_thread_method("acq_start",self.acq_start)
         self.ctl.add_thread_method("acq_stop",self.acq_stop)
         self.ctl.add_thread_method("clear_pretrigger",self.clear_pretrigger)
+        self.ctl.add_thread_method("trigger_event",self.trigger_event)
+        self.ctl.add_thread_method("benchmark_disk",self.benchmark_disk)
         self.connected=False
         self._last_parameters={}
         self._last_shown_frame=None
@@ -109,6 +114,18 @@ class GenericCameraCtl(container.QContainer):
         if self.dev is not None:
             self.dev.ca.acq_stop()
     @controller.exsafe
+    def on_saving_overload(self, action):
+        """Pause or resume the acquisition on the saving queue overload (with ``"pause"`` overload policy)"""
+        if self.dev is None:
+            return
+        if action=="pause":
+            if self.dev.v["status/acquisition"]=="acquiring":
+                self.dev.ca.acq_stop()
+                self._overload_paused=True
+        elif action=="resume" and self._overload_paused:
+            self._overload_paused=False
+            self.dev.ca.acq_start()
+    @controller.exsafe
     def toggle_saving(self, mode, start=True, source=None, change_params=None, no_popup=False):
         """
         Turn saving on/off (connected to a button in saving control)
@@ -131,7 +148,8 @@ class GenericCameraCtl(container.QContainer):
                         perform_status_check=self.c["settings"].collect_parameters().get("perform_status_check",False)
                     self.saver.csi.save_start(params["path"],path_kind=params["path_kind"],batch_size=params["batch_size"],
                         append=params["append"],format=params["format"],filesplit=params["filesplit"],
-                        save_settings=params["save_settings"],perform_status_check=perform_status_check)
+                        save_settings=params["save_settings"],perform_status_check=perform_status_check,
+                        event_pre_frames=params.get("event_pre_frames"),event_post_frames=params.get("event_post_frames",0))
                 else:
                     self.saver.ca.save_stop()
             else:
@@ -166,6 +184,37 @@ class GenericCameraCtl(container.QContainer):
         if frame is not None:
             self.ctl.send_multicast(self.snap_save_thread,tag="frames/new/snap",value=FramesMessage([frame],chandim=frame.ndim-2))
     @controller.exsafe
+    def benchmark_disk(self, change_params=None):
+        """
+        Start the disk benchmark at the current saving path.
+
+        If `change_params` is defined, it is a dictionary which overrides some of the saving parameters from the GUI
+        (besides the saving parameters, it can contain ``"frame_rate"`` and ``"max_time"`` benchmark parameters).
+        Return the call result synchronizer, which can be used to wait for the benchmark start (see :meth:`.FrameSaveThread.benchmark_disk`);
+        the result is published in the saver ``"benchmark"`` variable once the benchmark is done.
+        """
+        if self.saver:
+            params=self.settings.get("saving/defaults",{})
+            params.update(self.c["savebox"].collect_parameters())
+            if params["path"] is None: # invalid path
+                return
+            params.update(change_params or {})
+            frame_rate=params.get("frame_rate")
+            if frame_rate is None and self.dev is not None:
+                frame_rate=self.dev.v["frames/fps"] or None
+            return self.saver.cad.benchmark_disk(params["path"],path_kind=params["path_kind"],frame_rate=frame_rate,max_time=params.get("max_time",5.))
+    @controller.exsafe
+    def trigger_event(self, desc=None, stop_after=False):
+        """
+        Trigger an event if the saving is running in the event capture mode.
+
+        If ``stop_after==True``, stop the saving after the event post-trigger frames are saved.
+        Return ``True`` if the event has been triggered, and ``False`` otherwise (e.g., if a normal saving is running).
+        """
+        if self.saver:
+            return self.saver.cs.trigger_event(desc,stop_after=stop_after)
+        return False
+    @controller.exsafe
     def write_event_log(self, message):
         """Write an event to the saving event log"""
         if self.saver:
@@ -176,7 +225,8 @@ class GenericCameraCtl(container.QContainer):
         if self.saver:
             params=self.settings.get("saving/defaults",{})
             params.update(self.c["savebox"].collect_parameters(resolve_path=False))
-            self.saver.ca.setup_pretrigger(params["pretrigger_size"],params["pretrigger_enabled"])
+            self.saver.ca.setup_pretrigger(params["pretrigger_size"],params["pretrigger_enabled"],
+                spill_folder=self.settings.get("saving/pretrigger/spill_folder",None),ram_size=self.settings.get("saving/pretrigger/ram_size",None))
     @controller.exsafe
     def clear_pretrigger(self):
         """Clear pretrigger buffer"""
@@ -204,6 +254,7 @@ class GenericCameraCtl(container.QContainer):
             for n in ["saved","missed","received","scheduled","queue_ram","max_queue_ram","pretrigger_status"]:
                 params["frames",n]=self.saver.get_variable(n,0)    
             params["frames/status_line_check"]=self.saver.get_variable("status_line_check","none")
+            params["frames/benchmark"]=self.saver.get_variable("benchmark",None)
         return params
     @controller.exsafe
     def recv_status_update(self, status):
@@ -304,7 +304,7 @@ class TutorialBox(param_table.ParamTable):
                     "overwrite the old data, or append to it (it still results in a partial overwrite, so generally not recommended)."),
                         ["on_name_conflict"]),
                 "format": ("File format",
-                    ("This is the <b>storage format</b>. Currently you can choose raw binary, Tiff, or Big Tiff (unlike Tiff it handles files larger than 2Gb, "
+                    ("This is the <b>storage format</b>. Currently you can choose raw binary, Tiff, or Big Tiff (unlike Tiff it handles files larger than 4Gb, "
                     "but is not as widely supported)."),
                         ["format"]),
                 "batch_size": ("Dataset size",
@@ -313,7 +313,7 @@ class TutorialBox(param_table.ParamTable):
                         ["batch_size"]),
                 "filesplit": ("File splitting",
                     ("This lets you <b>split the frames into several files</b>. This is useful for very large datasets, where having a single "
-                    "giant file would be inconvenient. It is also necessary to save more than 2Gb into a Tiff format, since it does not support files larger than that."),
+                    "giant file would be inconvenient. It is also necessary to save more than 4Gb into a Tiff format, since it does not support files larger than that."),
                         ["filesplit"]),
                 "pretrigger_buffer": ("Pretrigger buffer",
                     ("Here you can control the <b>pretrigger buffer</b> parameters. If enabled, it always keeps in RAM a given number of previous frames, "
@@ -0,0 +1,1498 @@
+"""
+Frame file writers used by the frame saving thread.
+"""
+
+import numpy as np
+import os
+import json
+import struct
+import zlib
+import concurrent.futures
+import mmap
+import time
+
+try:
+    import h5py
+except ImportError:
+    h5py=None
+try:
+    import zstandard
+except ImportError:
+    zstandard=None
+try:
+    import lz4.frame as lz4frame
+except ImportError:
+    lz4frame=None
+try:
+    import blosc
+except ImportError:
+    blosc=None
+try:
+    import xxhash
+except ImportError:
+    xxhash=None
+
+
+
+
+_header_magic=b"CCFHEAD1"
+def write_header(f, desc):
+    """
+    Write a self-describing file header.
+
+    The header consists of a magic string, the description length, and the JSON-encoded description dictionary.
+    Return the total header length in bytes.
+    """
+    data=json.dumps(desc).encode()
+    f.write(_header_magic+struct.pack("<I",len(data))+data)
+    return len(_header_magic)+4+len(data)
+def read_header(f):
+    """
+    Read a file header written by :func:`write_header`.
+
+    Return tuple ``(desc, size)`` with the description dictionary and the total header length in bytes.
+    """
+    magic=f.read(len(_header_magic))
+    if magic!=_header_magic:
+        raise IOError("unrecognized file header")
+    length,=struct.unpack("<I",f.read(4))
+    desc=json.loads(f.read(length).decode())
+    return desc,len(_header_magic)+4+length
+
+
+
+
+try:
+    _iov_max=min(os.sysconf("SC_IOV_MAX"),1024)
+except (AttributeError,ValueError,OSError):
+    _iov_max=1024
+class RawFrameWriter:
+    """
+    Raw binary frames writer.
+
+    Keeps the file open for the whole recording and writes the data in large coalesced blocks.
+    Where supported (``os.writev``), the blocks are gathered from the references to the written arrays without copying them,
+    so the arrays passed to :meth:`write` should not be modified until the data is flushed.
+
+    Args:
+        path: file path
+        append: if ``True`` and the file already exists, append the data to it; otherwise, overwrite it
+        preallocate: if not ``None``, the expected size of the written data in bytes;
+            this space is preallocated in the file to reduce fragmentation (``posix_fallocate`` on POSIX systems, and file extension on Windows)
+        block_size: size of the coalesced write blocks in bytes; smaller pieces of data are accumulated in a block before writing,
+            while larger ones are written directly
+        drop_cache: if ``True``, advise the OS to remove the written data from the page cache (if supported by the OS),
+            so that long recordings do not fill the RAM with the cached file data; only supported on POSIX systems (ignored on Windows)
+    """
+    def __init__(self, path, append=True, preallocate=None, block_size=2**24, drop_cache=False):
+        self.path=path
+        if append and os.path.exists(path):
+            self.file=open(path,"r+b",buffering=0)
+            self.file.seek(0,2)
+        else:
+            self.file=open(path,"wb",buffering=0)
+        self.start=self.pos=self.file.tell()
+        self.block_size=block_size
+        self._gather=hasattr(os,"writev")
+        self._pending=[] # list of byte memoryviews to write in the gather mode
+        self._block=None if self._gather else bytearray(block_size)
+        self._block_fill=0
+        self.drop_cache=drop_cache and hasattr(os,"posix_fadvise")
+        self._dropped=self.pos
+        self._drop_window=block_size*4
+        self.preallocated=False
+        if preallocate:
+            try:
+                if hasattr(os,"posix_fallocate"):
+                    os.posix_fallocate(self.file.fileno(),self.pos,preallocate)
+                else: # on Windows, extending the file (SetEndOfFile) allocates its space
+                    self.file.truncate(self.pos+preallocate)
+                self.preallocated=True
+            except OSError:
+                pass
+
+    def _write_all(self, data):
+        data=memoryview(data).cast("B")
+        while len(data):
+            n=self.file.write(data)
+            data=data[n:]
+    def _write_pending(self):
+        bufs,self._pending=self._pending,[]
+        fd=self.file.fileno()
+        pos=0
+        while pos<len(bufs):
+            n=os.writev(fd,bufs[pos:pos+_iov_max])
+            while n>0: # skip over the written buffers and cut the partially written one
+                if n>=len(bufs[pos]):
+                    n-=len(bufs[pos])
+                    pos+=1
+                else:
+                    bufs[pos]=bufs[pos][n:]
+                    n=0
+    def _flush_block(self):
+        if self._pending:
+            self._write_pending()
+            self._block_fill=0
+        elif self._block_fill:
+            self._write_all(memoryview(self._block)[:self._block_fill])
+            self._block_fill=0
+        if self.drop_cache and self.pos-self._dropped>2*self._drop_window: # only drop the part which has likely been already written back to the disk
+            drop_end=self.pos-self._drop_window
+            os.posix_fadvise(self.file.fileno(),self._dropped,drop_end-self._dropped,os.POSIX_FADV_DONTNEED)
+            self._dropped=drop_end
+    def write(self, data):
+        """Write numpy array data to the file"""
+        data=np.ascontiguousarray(data)
+        nbytes=data.nbytes
+        if not nbytes:
+            return
+        if self._gather:
+            self._pending.append(memoryview(data).cast("B"))
+            self._block_fill+=nbytes
+            self.pos+=nbytes
+            if self._block_fill>=self.block_size:
+                self._flush_block()
+        elif self._block_fill+nbytes<=len(self._block):
+            self._block[self._block_fill:self._block_fill+nbytes]=memoryview(data).cast("B")
+            self._block_fill+=nbytes
+            self.pos+=nbytes
+            if self._block_fill==len(self._block):
+                self._flush_block()
+        else:
+            self._flush_block()
+            self._write_all(data)
+            self.pos+=nbytes
+            self._flush_block()
+    def tell(self):
+        """Get the current size of the written data (including the data still in the block buffer)"""
+        return self.pos
+    def get_committed_size(self):
+        """
+        Get the size of the data passed to the OS (excluding the data still in the block buffer).
+
+        Unlike :meth:`flush`, does not force a partial block write; can be called from a different thread, in which case the result can be slightly underestimated.
+        """
+        return self.pos-self._block_fill
+    def flush(self):
+        """Write all accumulated data to the file"""
+        self._flush_block()
+    def close(self):
+        """Flush the data, remove unused preallocated space, and close the file"""
+        if self.file is None:
+            return
+        try:
+            self._flush_block()
+            if self.preallocated:
+                self.file.truncate(self.pos)
+        finally:
+            self.file.close()
+            self.file=None
+
+
+
+
+def _preallocate_file(path, size):
+    """Make sure the file has at least the given size, preallocating the space if supported by the OS"""
+    with open(path,"r+b" if os.path.exists(path) else "wb") as f:
+        if f.seek(0,2)<size:
+            f.truncate(size)
+            if hasattr(os,"posix_fallocate"):
+                try:
+                    os.posix_fallocate(f.fileno(),0,size)
+                except OSError:
+                    pass
+def _copy_file_range(src, dst, offset, size, dst_offset):
+    """Copy data between two open files; return number of copied bytes"""
+    if hasattr(os,"copy_file_range"):
+        try:
+            n=os.copy_file_range(src.fileno(),dst.fileno(),size,offset,dst_offset)
+            if n>0:
+                return n
+        except OSError: # e.g., not supported by the file system
+            pass
+    src.seek(offset)
+    data=src.read(min(size,2**24))
+    dst.seek(dst_offset)
+    dst.write(data)
+    dst.flush()
+    return len(data)
+def transfer_file_data(src, dst, ranges, append=False):
+    """
+    Transfer data ranges from file `src` to file `dst` without reading it into Python (where possible).
+
+    `ranges` is a list of ``(offset, size)`` tuples, which are written into `dst` in the given order.
+    If ``append==False`` and the data is a single range at the beginning of `src`, `src` is simply renamed into `dst` and truncated;
+    otherwise, the data is copied by the OS (``os.copy_file_range`` on Linux), or in large blocks if this is not supported.
+    Return ``True`` if `src` has been renamed.
+    """
+    if not append and len(ranges)==1 and ranges[0][0]==0:
+        try:
+            os.replace(src,dst)
+            os.truncate(dst,ranges[0][1])
+            return True
+        except OSError: # e.g., different file systems
+            pass
+    with open(src,"rb") as fs, open(dst,"r+b" if (append and os.path.exists(dst)) else "wb") as fd:
+        dst_offset=fd.seek(0,2)
+        for offset,size in ranges:
+            while size>0:
+                n=_copy_file_range(fs,fd,offset,size,dst_offset)
+                if not n:
+                    raise IOError("could not read the source file {}".format(src))
+                offset+=n
+                dst_offset+=n
+                size-=n
+    return False
+
+
+
+def _get_stripe_nframes(nframes, nstripes, stripe_frames):
+    """Get the number of frames in each stripe for the given total number of striped frames"""
+    units,rem=divmod(nframes,stripe_frames)
+    counts=[(units//nstripes+(1 if k<units%nstripes else 0))*stripe_frames for k in range(nstripes)]
+    counts[units%nstripes]+=rem
+    return counts
+def _get_striped_nframes(stripe_nframes, stripe_frames):
+    """Get the total number of consecutive frames contained in the stripes with the given numbers of frames"""
+    nstripes=len(stripe_nframes)
+    complete=[n//stripe_frames for n in stripe_nframes]
+    unit=min([c*nstripes+k for k,c in enumerate(complete)]) # first incomplete stripe unit
+    return unit*stripe_frames+stripe_nframes[unit%nstripes]%stripe_frames
+def load_stripes_manifest(path):
+    """Load the manifest written by :class:`StripedFrameWriter`"""
+    with open(path,"r") as f:
+        return json.load(f)
+class StripedFrameWriter:
+    """
+    Raw binary frames writer which spreads the frames across several files (usually located on different drives).
+
+    The frames are split into units of `stripe_frames` frames, which are distributed round-robin across the stripe files:
+    unit ``u`` goes to the stripe ``u % nstripes``. Each stripe is written by a :class:`RawFrameWriter` in its own thread,
+    so that the drives work in parallel. The JSON manifest describes the frames, the stripe files, and the total number of frames
+    (``None`` until the writer is closed; in this case, the number of frames is determined from the stripe file sizes),
+    so that the stripes can be interleaved back into the original order using :class:`StripedFrameReader`.
+
+    Args:
+        path: manifest file path
+        stripe_paths: list of stripe file paths
+        frame_shape: shape of a single frame
+        dtype: frames dtype
+        append: if ``True`` and the manifest describing the same stripes already exists, append the data to them; otherwise, overwrite them
+        stripe_frames: number of frames in a single stripe unit
+        preallocate: if not ``None``, the expected number of frames; the corresponding space is preallocated in the stripe files
+        max_inflight: maximal number of units passed to the stripe threads but not yet written (by default, two per stripe)
+        block_size: size of the coalesced write blocks in bytes (see :class:`RawFrameWriter`)
+        drop_cache: if ``True``, advise the OS to remove the written data from the page cache (see :class:`RawFrameWriter`)
+    """
+    def __init__(self, path, stripe_paths, frame_shape, dtype, append=True, stripe_frames=1, preallocate=None, max_inflight=None,
+            block_size=2**24, drop_cache=False):
+        self.path=path
+        self.stripe_paths=[os.path.abspath(p) for p in stripe_paths]
+        self.frame_shape=tuple(frame_shape)
+        self.dtype=np.dtype(dtype)
+        self.stripe_frames=max(int(stripe_frames),1)
+        self.max_inflight=max_inflight or 2*len(self.stripe_paths)
+        self.nframes=0
+        if append and os.path.exists(path):
+            desc=load_stripes_manifest(path)
+            if (desc["stripes"]==self.stripe_paths and desc["stripe_frames"]==self.stripe_frames
+                    and tuple(desc["frame_shape"])==self.frame_shape and desc["dtype"]==self.dtype.str):
+                self.nframes=desc["nframes"]
+                if self.nframes is None:
+                    self.nframes=StripedFrameReader.get_nframes(desc,self.stripe_paths)
+            else:
+                append=False
+        frame_nbytes=self.dtype.itemsize*int(np.prod(self.frame_shape))
+        nstripes=len(self.stripe_paths)
+        counts=_get_stripe_nframes(self.nframes,nstripes,self.stripe_frames)
+        if preallocate:
+            expected=_get_stripe_nframes(self.nframes+preallocate,nstripes,self.stripe_frames)
+        self._writers=[]
+        try:
+            for k,p in enumerate(self.stripe_paths):
+                os.makedirs(os.path.dirname(p),exist_ok=True)
+                if append and os.path.exists(p):
+                    os.truncate(p,counts[k]*frame_nbytes) # remove incomplete data left after an interrupted recording
+                stripe_prealloc=(expected[k]-counts[k])*frame_nbytes if preallocate else None
+                self._writers.append(RawFrameWriter(p,append=append,preallocate=stripe_prealloc,block_size=block_size,drop_cache=drop_cache))
+        except OSError:
+            for w in self._writers:
+                w.close()
+            raise
+        self._pools=[concurrent.futures.ThreadPoolExecutor(1) for _ in self.stripe_paths]
+        self._inflight=[]
+        self._write_manifest(None)
+    
+    def _write_manifest(self, nframes):
+        desc={"frame_shape":self.frame_shape,"dtype":self.dtype.str,"stripe_frames":self.stripe_frames,"stripes":self.stripe_paths,"nframes":nframes}
+        with open(self.path,"w") as f:
+            json.dump(desc,f,indent=1)
+    def _wait(self, max_inflight=0):
+        while len(self._inflight)>max_inflight:
+            self._inflight.pop(0).result()
+    def write(self, frames):
+        """Write frames (3D array with the first axis being the frame index)"""
+        frames=np.asarray(frames,dtype=self.dtype)
+        nstripes=len(self._writers)
+        pos=0
+        while pos<len(frames):
+            unit,unit_pos=divmod(self.nframes,self.stripe_frames)
+            n=min(self.stripe_frames-unit_pos,len(frames)-pos)
+            k=unit%nstripes
+            self._inflight.append(self._pools[k].submit(self._writers[k].write,frames[pos:pos+n]))
+            pos+=n
+            self.nframes+=n
+        self._wait(self.max_inflight)
+    def tell(self):
+        """Get the number of written frames"""
+        return self.nframes
+    def get_committed_frames(self):
+        """Get the number of consecutive frames passed to the OS (excluding the frames still in the stripe threads or the block buffers)"""
+        frame_nbytes=self.dtype.itemsize*int(np.prod(self.frame_shape))
+        return _get_striped_nframes([w.get_committed_size()//frame_nbytes for w in self._writers],self.stripe_frames)
+    def flush(self):
+        """Write all accumulated data to the files"""
+        self._inflight+=[pool.submit(w.flush) for w,pool in zip(self._writers,self._pools)]
+        self._wait()
+    def close(self):
+        """Write all accumulated data, close the stripe files, and finalize the manifest"""
+        if self._pools is None:
+            return
+        try:
+            self._inflight+=[pool.submit(w.close) for w,pool in zip(self._writers,self._pools)]
+            self._wait()
+        finally:
+            for pool in self._pools:
+                pool.shutdown()
+            for w in self._writers:
+                w.close()
+            self._pools=None
+        self._write_manifest(self.nframes)
+
+class StripedFrameReader:
+    """
+    Reader for frames written by :class:`StripedFrameWriter`.
+
+    Args:
+        path: manifest file path
+    
+    If a stripe file is not found at the path stored in the manifest (e.g., the data has been moved), it is looked up in the manifest folder.
+    """
+    def __init__(self, path):
+        self.path=path
+        self.desc=load_stripes_manifest(path)
+        self.dtype=np.dtype(self.desc["dtype"])
+        self.frame_shape=tuple(self.desc["frame_shape"])
+        self.stripe_frames=self.desc["stripe_frames"]
+        self.stripe_paths=[p if os.path.exists(p) else os.path.join(os.path.dirname(os.path.abspath(path)),os.path.basename(p)) for p in self.desc["stripes"]]
+        self.nframes=self.desc["nframes"]
+        if self.nframes is None:
+            self.nframes=self.get_nframes(self.desc,self.stripe_paths)
+        counts=_get_stripe_nframes(self.nframes,len(self.stripe_paths),self.stripe_frames)
+        self._stripes=[np.memmap(p,dtype=self.dtype,mode="r",shape=(n,)+self.frame_shape) if n else np.zeros((0,)+self.frame_shape,dtype=self.dtype)
+            for p,n in zip(self.stripe_paths,counts)]
+    @staticmethod
+    def get_nframes(desc, stripe_paths):
+        """Get the number of consecutive frames contained in the stripe files described by the manifest dictionary `desc`"""
+        frame_nbytes=np.dtype(desc["dtype"]).itemsize*int(np.prod(desc["frame_shape"]))
+        sizes=[os.path.getsize(p)//frame_nbytes if os.path.exists(p) else 0 for p in stripe_paths]
+        return _get_striped_nframes(sizes,desc["stripe_frames"])
+    def __len__(self):
+        return self.nframes
+    def read(self, start=0, stop=None):
+        """Read frames from `start` to `stop` as a 3D array in the original order"""
+        stop=self.nframes if stop is None else min(stop,self.nframes)
+        indices=np.arange(start,max(stop,start))
+        units,unit_pos=np.divmod(indices,self.stripe_frames)
+        nstripes=len(self._stripes)
+        stripes=units%nstripes
+        local=(units//nstripes)*self.stripe_frames+unit_pos
+        frames=np.empty((len(indices),)+self.frame_shape,dtype=self.dtype)
+        for k,data in enumerate(self._stripes):
+            sel=stripes==k
+            if np.any(sel):
+                frames[sel]=data[local[sel]]
+        return frames
+    def close(self):
+        """Close the stripe files"""
+        self._stripes=[]
+    def __enter__(self):
+        return self
+    def __exit__(self, *args):
+        self.close()
+
+class MemmapFrameWriter:
+    """
+    Memory-mapped raw binary frames writer.
+
+    Preallocates the file and maps it into memory, so the frames are written by a simple copy into the mapped array.
+    The file layout is identical to the raw binary format.
+
+    Args:
+        path: file path
+        frame_shape: shape of a single frame
+        dtype: stored data type
+        append: if ``True`` and the file already exists, append the data to it; otherwise, overwrite it
+        nframes: expected number of frames to write (preallocated in the beginning); if ``None``, use `grow_step`
+        grow_step: minimal number of frames to add to the mapped region when it is filled
+    """
+    def __init__(self, path, frame_shape, dtype, append=True, nframes=None, grow_step=1024):
+        self.path=path
+        self.frame_shape=tuple(frame_shape)
+        self.dtype=np.dtype(dtype)
+        self.frame_nbytes=self.dtype.itemsize*int(np.prod(self.frame_shape))
+        if append and os.path.exists(path):
+            size=os.path.getsize(path)
+            self.start=size-size%self.frame_nbytes
+        else:
+            with open(path,"wb"):
+                pass
+            self.start=0
+        self.grow_step=grow_step
+        self.nwritten=0
+        self.capacity=0
+        self.mmap=None
+        self._reserve(nframes or grow_step)
+    def _reserve(self, nframes):
+        if self.mmap is not None:
+            self.mmap.flush()
+            self.mmap=None
+        _preallocate_file(self.path,self.start+nframes*self.frame_nbytes)
+        self.mmap=np.memmap(self.path,dtype=self.dtype,mode="r+",offset=self.start,shape=(nframes,)+self.frame_shape)
+        self.capacity=nframes
+    def write(self, frames):
+        """
+        Write frames (3D array with the first axis being the frame index) to the file.
+
+        Return an array with the file offsets of the written frames.
+        """
+        n=len(frames)
+        if self.nwritten+n>self.capacity:
+            self._reserve(max(self.capacity*2,self.nwritten+n,self.capacity+self.grow_step))
+        self.mmap[self.nwritten:self.nwritten+n]=frames
+        offsets=self.start+np.arange(self.nwritten,self.nwritten+n,dtype="<i8")*self.frame_nbytes
+        self.nwritten+=n
+        return offsets
+    def flush(self):
+        """Flush the mapped data to the disk"""
+        if self.mmap is not None:
+            self.mmap.flush()
+    def close(self):
+        """Flush the data, remove unused preallocated space, and close the file"""
+        if self.mmap is None:
+            return
+        self.mmap.flush()
+        self.mmap=None
+        with open(self.path,"r+b") as f:
+            f.truncate(self.start+self.nwritten*self.frame_nbytes)
+
+
+
+
+frame_index_dtype=np.dtype([("frame_index","<i8"),("file","<i4"),("offset","<i8")])
+class FrameIndexWriter:
+    """
+    Writer for the binary frame index.
+
+    The index contains a header (see :func:`write_header`) describing the frames, followed by
+    records of :data:`frame_index_dtype` type (camera frame index, file index, and offset within the file), one per saved frame.
+    The index is flushed after every write, so it can be used to read the data while it is still being recorded.
+
+    Args:
+        path: index file path
+        desc: additional description dictionary stored in the header
+        append: if ``True`` and the index already exists, append the data to it; otherwise, overwrite it
+    """
+    def __init__(self, path, desc, append=True):
+        self.path=path
+        if append and os.path.exists(path) and os.path.getsize(path)>0:
+            self.file=open(path,"ab")
+        else:
+            self.file=open(path,"wb")
+            desc=dict(desc,kind="frame_index",record_dtype=frame_index_dtype.descr)
+            write_header(self.file,desc)
+            self.file.flush()
+    def write(self, frame_indices, file_idx, offsets):
+        """Add index records for the given frame indices, file index, and frame offsets"""
+        records=np.zeros(len(offsets),dtype=frame_index_dtype)
+        records["frame_index"]=frame_indices
+        records["file"]=file_idx
+        records["offset"]=offsets
+        self.file.write(records.tobytes())
+        self.file.flush()
+    def close(self):
+        """Close the index file"""
+        if self.file is not None:
+            self.file.close()
+            self.file=None
+
+def load_frame_index(path):
+    """
+    Load binary frame index.
+
+    Return tuple ``(desc, records)``, where `desc` is the header description dictionary, and `records` is a numpy structured array
+    with fields ``"frame_index"``, ``"file"``, and ``"offset"``. Only complete records are returned, so the index can be loaded while it is still being written.
+    """
+    with open(path,"rb") as f:
+        desc,hsize=read_header(f)
+    nrec=(os.path.getsize(path)-hsize)//frame_index_dtype.itemsize
+    return desc,np.fromfile(path,dtype=frame_index_dtype,count=nrec,offset=hsize)
+
+
+class FrameInfoWriter:
+    """
+    Writer for the binary frame info table.
+
+    The file contains a header (see :func:`write_header`) with the column names and the record dtype,
+    followed by fixed-size records (one per frame), so the whole table can be loaded with a single :func:`numpy.fromfile` call.
+
+    Args:
+        path: file path
+        columns: list of column names
+        dtype: columns dtype (same for all columns)
+        append: if ``True`` and the file already exists, append the data to it; otherwise, overwrite it
+    """
+    def __init__(self, path, columns, dtype="<i8", append=True):
+        self.path=path
+        if append and os.path.exists(path) and os.path.getsize(path)>0:
+            with open(path,"rb") as f:
+                desc,_=read_header(f)
+            self.record_dtype=np.dtype([tuple(d) for d in desc["record_dtype"]])
+            self.file=open(path,"ab")
+        else:
+            self.record_dtype=np.dtype([(c,dtype) for c in columns])
+            self.file=open(path,"wb")
+            write_header(self.file,{"kind":"frame_info","columns":list(columns),"record_dtype":self.record_dtype.descr})
+        self.columns=self.record_dtype.names
+        self._base_dtype=self.record_dtype[0] if self.columns else np.dtype(dtype)
+    def write(self, table):
+        """Write frame info table (2D array with one row per frame)"""
+        table=np.asarray(table)
+        if table.ndim!=2 or not len(table):
+            return
+        ncols=len(self.columns)
+        if table.shape[1]!=ncols:
+            table=np.concatenate([table[:,:ncols],np.zeros((len(table),max(ncols-table.shape[1],0)))],axis=1)
+        records=np.ascontiguousarray(table,dtype=self._base_dtype).view(self.record_dtype)
+        self.file.write(records.tobytes())
+    def flush(self):
+        """Flush the data to the disk"""
+        self.file.flush()
+    def close(self):
+        """Close the file"""
+        if self.file is not None:
+            self.file.close()
+            self.file=None
+
+def load_frame_info(path):
+    """
+    Load binary frame info table.
+
+    Return tuple ``(desc, records)``, where `desc` is the header description dictionary, and `records` is a numpy structured array
+    with one field per column (starting with ``"save_index"``).
+    """
+    with open(path,"rb") as f:
+        desc,hsize=read_header(f)
+    return desc,np.fromfile(path,dtype=np.dtype([tuple(d) for d in desc["record_dtype"]]),offset=hsize)
+
+
+
+
+class TiffSizeExceededError(IOError):
+    """Classic TIFF file size limit exceeded error"""
+    def __init__(self, written=0):
+        self.written=written
+        super().__init__("TIFF file size exceeded; only {} frames written".format(written))
+
+_tiff_types={"H":3,"I":4,"Q":16}
+_tiff_sample_formats={"u":1,"b":1,"i":2,"f":3}
+class TiffFrameWriter:
+    """
+    Streaming TIFF/BigTIFF frames writer.
+
+    Writes uncompressed single-strip pages. Frames passed in a single :meth:`write` call are stored as a block of consecutive IFDs
+    (generated from a precomputed template) followed by the contiguous frames data, so the whole block is written in a couple of large writes.
+    The IFD chain is only linked to the new block after it has been written, so the file stays readable if the writing is interrupted.
+    The file size is tracked internally; if a classic TIFF would exceed its 4 Gb limit, only the fitting frames are written
+    and :exc:`TiffSizeExceededError` is raised.
+
+    Args:
+        path: file path (the file is always overwritten)
+        bigtiff: if ``True``, write BigTIFF file (without the size limit)
+        max_size: maximal file size; by default, 4 Gb for TIFF and no limit for BigTIFF
+    """
+    def __init__(self, path, bigtiff=False, max_size=None):
+        self.path=path
+        self.bigtiff=bigtiff
+        self.max_size=max_size if (max_size is not None or bigtiff) else 2**32-1
+        self._off="Q" if bigtiff else "I"
+        self.file=open(path,"wb")
+        if bigtiff:
+            self.file.write(b"II"+struct.pack("<HHHQ",43,8,0,0))
+            self._next_pos=8
+        else:
+            self.file.write(b"II"+struct.pack("<HI",42,0))
+            self._next_pos=4
+        self.pos=self.file.tell()
+        self.nframes=0
+        self._template=None
+    
+    def _make_ifd_template(self, frame_shape, dtype):
+        """
+        Build IFD template for the given frame shape and dtype.
+
+        Return tuple ``(template, strip_pos, next_pos, bps_data, bps_pos)``, where `template` is the IFD bytes array,
+        `strip_pos` and `next_pos` are positions of the strip offset and the next IFD offset within the IFD,
+        `bps_data` is the external bits-per-sample data (``None`` if it fits into the IFD),
+        and `bps_pos` is the position of its offset within the IFD.
+        """
+        off=self._off
+        osize=struct.calcsize(off)
+        height,width=frame_shape[:2]
+        spp=frame_shape[2] if len(frame_shape)>2 else 1
+        nbytes=dtype.itemsize*int(np.prod(frame_shape))
+        bps_data=None
+        if 2*spp<=osize:
+            bps=("H",spp,struct.pack("<{}H".format(spp),*([dtype.itemsize*8]*spp)))
+        else:
+            bps_data=struct.pack("<{}H".format(spp),*([dtype.itemsize*8]*spp))
+            bps=(off,1,None)
+        photometric=2 if spp in [3,4] else 1
+        tags=[(256,"I",1,width),(257,"I",1,height),(258,)+bps,(259,"H",1,1),(262,"H",1,photometric),(273,off,1,0),
+            (277,"H",1,spp),(278,"I",1,height),(279,off,1,nbytes),(284,"H",1,1)]
+        if spp==4:
+            tags.append((338,"H",1,2)) # unassociated alpha
+        tags.append((339,"H",1,_tiff_sample_formats[dtype.kind]))
+        entry_fmt="<HHQ" if self.bigtiff else "<HHI"
+        ifd=bytearray(struct.pack("<Q" if self.bigtiff else "<H",len(tags)))
+        positions={}
+        for t,tt,cnt,v in tags:
+            positions[t]=len(ifd)+struct.calcsize(entry_fmt)
+            if t==258 and bps_data is not None:
+                tt,cnt=("H",spp)
+                v=b"\0"*osize
+            elif not isinstance(v,bytes):
+                v=struct.pack("<"+tt,v)
+            ifd+=struct.pack(entry_fmt,t,_tiff_types[tt],cnt)+v.ljust(osize,b"\0")
+        next_pos=len(ifd)
+        ifd+=b"\0"*osize
+        if len(ifd)%2:
+            ifd+=b"\0"
+        return np.frombuffer(bytes(ifd),dtype="u1"),positions[273],next_pos,bps_data,positions[258]
+    def write(self, frames):
+        """Write frames (3D array with the first axis being the frame index, or a single 2D frame)"""
+        frames=np.asarray(frames)
+        if frames.ndim==2:
+            frames=frames[None]
+        if frames.dtype.byteorder==">":
+            frames=frames.astype(frames.dtype.newbyteorder("<"))
+        if frames.dtype.kind not in _tiff_sample_formats:
+            raise ValueError("unsupported frames dtype: {}".format(frames.dtype))
+        frames=np.ascontiguousarray(frames)
+        key=(frames.shape[1:],frames.dtype.str)
+        if self._template is None or self._template[0]!=key:
+            self._template=(key,self._make_ifd_template(frames.shape[1:],frames.dtype))
+        template,strip_pos,next_pos,bps_data,bps_pos=self._template[1]
+        osize=struct.calcsize(self._off)
+        odtype="<u"+str(osize)
+        frame_nbytes=frames[0].nbytes
+        ifd_size=len(template)
+        extra=b"" if bps_data is None else bps_data.ljust((len(bps_data)+1)//2*2,b"\0")
+        nframes=len(frames)
+        if self.max_size is not None:
+            nfit=(self.max_size-self.pos-len(extra)-1)//(ifd_size+frame_nbytes)
+            nframes=max(min(nframes,nfit),0)
+        if nframes:
+            ifd_start=self.pos+len(extra)
+            data_start=ifd_start+nframes*ifd_size
+            ifds=np.tile(template,(nframes,1))
+            ifds[:,strip_pos:strip_pos+osize]=(data_start+np.arange(nframes,dtype="u8")*frame_nbytes).astype(odtype)[:,None].view("u1")
+            nexts=ifd_start+np.arange(1,nframes+1,dtype="u8")*ifd_size
+            nexts[-1]=0
+            ifds[:,next_pos:next_pos+osize]=nexts.astype(odtype)[:,None].view("u1")
+            if bps_data is not None:
+                ifds[:,bps_pos:bps_pos+osize]=np.array([self.pos],dtype=odtype).view("u1")
+            self.file.write(extra)
+            self.file.write(ifds.data)
+            self.file.write(memoryview(frames[:nframes]).cast("B"))
+            self.pos=data_start+nframes*frame_nbytes
+            if self.pos%2:
+                self.file.write(b"\0")
+                self.pos+=1
+            self.file.seek(self._next_pos) # link the new block to the IFD chain
+            self.file.write(struct.pack("<"+self._off,ifd_start))
+            self.file.seek(self.pos)
+            self._next_pos=ifd_start+(nframes-1)*ifd_size+next_pos
+            self.nframes+=nframes
+        if nframes<len(frames):
+            raise TiffSizeExceededError(nframes)
+    def tell(self):
+        """Get the current file size"""
+        return self.pos
+    def flush(self):
+        """Flush the data to the disk"""
+        self.file.flush()
+    def close(self):
+        """Close the file"""
+        if self.file is not None:
+            self.file.close()
+            self.file=None
+
+
+
+def _as_hdf5_attr(value):
+    """Convert a settings value into a form storable as an HDF5 attribute"""
+    if value is None:
+        return "None"
+    if isinstance(value,(str,bool,int,float,np.number,np.bool_)):
+        return value
+    try:
+        value=np.asarray(value)
+        if value.dtype.kind in "biufc":
+            return value
+    except ValueError:
+        pass
+    return repr(value)
+def write_hdf5_settings(group, settings):
+    """Store flat settings dictionary ``{path: value}`` as attributes of the given HDF5 group (or HDF5 file path)"""
+    if isinstance(group,str):
+        with h5py.File(group,"a") as f:
+            return write_hdf5_settings(f.require_group("settings"),settings)
+    for k,v in settings.items():
+        group.attrs[k]=_as_hdf5_attr(v)
+
+class HDF5FrameWriter:
+    """
+    HDF5 frames writer.
+
+    Stores all of the data in a single file: frames in a resizable chunked dataset ``"frames"``,
+    frame info in a compound dataset ``"frame_info"`` (one field per column), background in dataset ``"background"``,
+    and settings as attributes of group ``"settings"``.
+
+    Args:
+        path: file path
+        append: if ``True`` and the file already exists, append the data to it; otherwise, overwrite it
+        chunk_frames: number of frames per dataset chunk; by default, chosen to make chunks about 2 Mb large
+        compression: chunk compression filter (e.g., ``"gzip"`` or ``"lzf"``); ``None`` means no compression
+        compression_opts: additional compression options (e.g., compression level for ``"gzip"``)
+    """
+    def __init__(self, path, append=True, chunk_frames=None, compression=None, compression_opts=None):
+        if h5py is None:
+            raise ImportError("h5py is required for HDF5 saving")
+        self.path=path
+        self.file=h5py.File(path,"a" if append else "w")
+        self.chunk_frames=chunk_frames
+        self.compression=compression
+        self.compression_opts=compression_opts
+    
+    def write(self, frames):
+        """Write frames (3D array with the first axis being the frame index) to the file"""
+        if "frames" not in self.file:
+            frame_nbytes=frames[0].nbytes
+            chunk_frames=self.chunk_frames or max(2**21//max(frame_nbytes,1),1)
+            self.file.create_dataset("frames",shape=(0,)+frames.shape[1:],maxshape=(None,)+frames.shape[1:],dtype=frames.dtype,
+                chunks=(chunk_frames,)+frames.shape[1:],compression=self.compression,compression_opts=self.compression_opts)
+        dset=self.file["frames"]
+        n=len(dset)
+        dset.resize(n+len(frames),axis=0)
+        dset[n:]=frames
+    @staticmethod
+    def _merge_frame_info_dtype(dtype, columns, kind):
+        """
+        Get the frame info dataset dtype which can hold both the data with the given `dtype` and the new rows with the given `columns` and dtype `kind`.
+
+        Columns are matched by name; integer columns become float if they receive float values, or if some rows lack them (these values are filled with NaN).
+        """
+        new_type="<i8" if kind in "iub" else "<f8"
+        fields=[]
+        names=dtype.names if dtype is not None else ()
+        for n in names:
+            fields.append((n,("<i8" if dtype[n].kind in "iu" and new_type=="<i8" else "<f8") if n in columns else "<f8"))
+        for c in columns:
+            if c not in names:
+                fields.append((c,new_type if dtype is None else "<f8"))
+        return np.dtype(fields)
+    @staticmethod
+    def _empty_frame_info(n, dtype):
+        records=np.zeros(n,dtype=dtype)
+        for c in dtype.names:
+            if dtype[c].kind=="f":
+                records[c]=np.nan
+        return records
+    def write_frame_info(self, columns, rows):
+        """
+        Write frame info rows.
+
+        `columns` is the list of column names, and `rows` is a 2D numpy array with the rows data.
+        The dataset contains the union of all written columns (matched by name); if new rows have columns or types which do not fit into the existing dataset,
+        it is recreated with the extended dtype (missing values are filled with NaN).
+        """
+        dset=self.file["frame_info"] if "frame_info" in self.file else None
+        dtype=self._merge_frame_info_dtype(None if dset is None else dset.dtype,columns,rows.dtype.kind)
+        if dset is None or dset.dtype!=dtype:
+            data=None
+            if dset is not None:
+                old_data=dset[()]
+                data=self._empty_frame_info(len(old_data),dtype)
+                for c in old_data.dtype.names:
+                    data[c]=old_data[c]
+                del self.file["frame_info"]
+            dset=self.file.create_dataset("frame_info",shape=(0,),maxshape=(None,),dtype=dtype,chunks=(max(2**16//dtype.itemsize,1),))
+            if data is not None:
+                dset.resize(len(data),axis=0)
+                dset[:]=data
+        records=self._empty_frame_info(len(rows),dset.dtype)
+        for i,c in enumerate(columns[:rows.shape[1]]):
+            records[c]=rows[:,i]
+        n=len(dset)
+        dset.resize(n+len(records),axis=0)
+        dset[n:]=records
+    def write_background(self, background, desc=None):
+        """Store background frames and its description"""
+        if "background" in self.file:
+            del self.file["background"]
+        dset=self.file.create_dataset("background",data=background)
+        write_hdf5_settings(dset,desc or {})
+    def write_settings(self, settings):
+        """Store flat settings dictionary ``{path: value}``"""
+        write_hdf5_settings(self.file.require_group("settings"),settings)
+    def flush(self):
+        """Flush the data to the disk"""
+        self.file.flush()
+    def close(self):
+        """Close the file"""
+        if self.file is not None:
+            self.file.close()
+            self.file=None
+
+
+
+
+def _shuffle(data, itemsize, shuffle):
+    """
+    Byte- or bit-shuffle the data buffer to improve its compressibility.
+
+    This is a numpy fallback used for non-blosc codecs; the bit shuffle takes 8 times the data size in temporary memory
+    and mostly holds GIL, so it effectively runs on a single core (see :func:`compress_block`).
+    """
+    if shuffle=="none" or itemsize==1 and shuffle=="byte":
+        return data
+    b=np.frombuffer(data,dtype="u1").reshape(-1,itemsize)
+    if shuffle=="byte":
+        return b.T.tobytes()
+    return np.packbits(np.unpackbits(b,axis=1).T,axis=1).tobytes()
+def _unshuffle(data, itemsize, shuffle, nbytes):
+    """Revert :func:`_shuffle` operation; `nbytes` is the original data size"""
+    if shuffle=="none" or itemsize==1 and shuffle=="byte":
+        return data
+    b=np.frombuffer(data,dtype="u1")
+    n=nbytes//itemsize
+    if shuffle=="byte":
+        return b.reshape(itemsize,n).T.tobytes()
+    bits=np.unpackbits(b.reshape(itemsize*8,-1),axis=1,count=n)
+    return np.packbits(bits.T,axis=1).tobytes()
+
+def pack_12bit(frames):
+    """
+    Pack 12-bit integer frames into bytes (two pixels in three bytes).
+
+    The packing is done along the last axis: pixels ``a`` and ``b`` are stored as bytes ``a & 0xFF``, ``(a >> 8) | ((b & 0x0F) << 4)``, and ``b >> 4``.
+    If the last axis length is odd, it is padded with a zero pixel. Values above 4095 are clipped.
+    Return ``uint8`` array with the last axis length ``3*ceil(n/2)``.
+    """
+    frames=np.minimum(frames,4095).astype("<u2",copy=False)
+    if frames.shape[-1]%2:
+        frames=np.concatenate([frames,np.zeros(frames.shape[:-1]+(1,),dtype=frames.dtype)],axis=-1)
+    a,b=frames[...,0::2],frames[...,1::2]
+    packed=np.empty(a.shape+(3,),dtype="u1")
+    packed[...,0]=a&0xFF
+    packed[...,1]=(a>>8)|((b&0x0F)<<4)
+    packed[...,2]=b>>4
+    return packed.reshape(frames.shape[:-1]+(-1,))
+def unpack_12bit(packed, width=None):
+    """
+    Unpack frames packed by :func:`pack_12bit` into ``uint16`` array.
+
+    `width` is the original last axis length (by default, assume that it is even).
+    """
+    packed=np.asarray(packed,dtype="u1")
+    triples=packed.reshape(packed.shape[:-1]+(-1,3)).astype("<u2")
+    frames=np.empty(triples.shape[:-1]+(2,),dtype="<u2")
+    frames[...,0]=triples[...,0]|((triples[...,1]&0x0F)<<8)
+    frames[...,1]=(triples[...,1]>>4)|(triples[...,2]<<4)
+    frames=frames.reshape(packed.shape[:-1]+(-1,))
+    return frames if width is None else frames[...,:width]
+
+def get_compression_codecs():
+    """Get the list of available compression codecs"""
+    codecs=["zlib"]
+    for c,m in [("zstd",zstandard),("lz4",lz4frame),("blosc",blosc)]:
+        if m is not None:
+            codecs.append(c)
+    return codecs
+def compress_block(data, itemsize, codec="zlib", level=1, shuffle="byte", cname="lz4"):
+    """
+    Compress the data block.
+
+    Args:
+        data: data buffer
+        itemsize: size of a single data element in bytes (used for shuffling)
+        codec: compression codec; can be ``"zlib"``, ``"zstd"``, ``"lz4"``, or ``"blosc"`` (the last three require the corresponding packages)
+        level: compression level
+        shuffle: data shuffling applied before compression; can be ``"none"``, ``"byte"``, or ``"bit"``
+            (the last one groups bits with the same significance together, which is the best option for high-bit-depth integer frames)
+        cname: internal compressor used by the ``"blosc"`` codec (e.g., ``"lz4"``, ``"zstd"``, or ``"zlib"``)
+    
+    All of the codecs release GIL, so compression can run in parallel in several threads.
+    Shuffling for the ``"blosc"`` codec is done natively (and also releases GIL); for the other codecs it is done using numpy,
+    which for the bit shuffle mostly holds GIL and is effectively single-core, so :class:`CompressedFrameWriter` switches to blosc for the bit shuffle whenever it is available.
+    """
+    if codec=="blosc":
+        mode={"none":blosc.NOSHUFFLE,"byte":blosc.SHUFFLE,"bit":blosc.BITSHUFFLE}[shuffle]
+        return blosc.compress(data,typesize=itemsize,clevel=level,shuffle=mode,cname=cname)
+    data=_shuffle(data,itemsize,shuffle)
+    if codec=="zlib":
+        return zlib.compress(data,level)
+    if codec=="zstd":
+        return zstandard.ZstdCompressor(level=level).compress(data)
+    if codec=="lz4":
+        return lz4frame.compress(data,compression_level=level)
+    raise ValueError("unrecognized compression codec: {}".format(codec))
+def decompress_block(data, nbytes, itemsize, codec="zlib", shuffle="byte"):
+    """Decompress the data block compressed by :func:`compress_block`; `nbytes` is the size of the uncompressed data"""
+    if codec=="blosc":
+        return blosc.decompress(data)
+    if codec=="zlib":
+        data=zlib.decompress(data)
+    elif codec=="zstd":
+        data=zstandard.ZstdDecompressor().decompress(data,max_output_size=nbytes)
+    elif codec=="lz4":
+        data=lz4frame.decompress(data)
+    else:
+        raise ValueError("unrecognized compression codec: {}".format(codec))
+    return _unshuffle(data,itemsize,shuffle,nbytes)
+
+
+_chunk_magic=b"CHNK"
+_chunk_header=struct.Struct("<4sqqqq") # magic, first frame, number of frames, uncompressed size, compressed size
+_footer=struct.Struct("<q8s") # index offset, magic
+_footer_magic=b"CCFINDEX"
+compressed_index_dtype=[("frame","<i8"),("nframes","<i8"),("offset","<i8"),("nbytes","<i8"),("cnbytes","<i8")]
+def _scan_compressed_chunks(f, start):
+    """Rebuild the chunk index by scanning the chunk headers starting from `start`; return the index and the end of the last complete chunk"""
+    index=[]
+    f.seek(0,2)
+    size=f.tell()
+    pos=start
+    while pos+_chunk_header.size<=size:
+        f.seek(pos)
+        magic,frame,nframes,nbytes,cnbytes=_chunk_header.unpack(f.read(_chunk_header.size))
+        if magic!=_chunk_magic or pos+_chunk_header.size+cnbytes>size:
+            break
+        index.append((frame,nframes,pos+_chunk_header.size,nbytes,cnbytes))
+        pos+=_chunk_header.size+cnbytes
+    return np.array(index,dtype=compressed_index_dtype),pos
+def _read_compressed_index(f):
+    """Read description, chunk index, and data end position of a compressed frames file"""
+    f.seek(0)
+    desc,hsize=read_header(f)
+    f.seek(0,2)
+    size=f.tell()
+    if size>=hsize+_footer.size:
+        f.seek(size-_footer.size)
+        index_pos,magic=_footer.unpack(f.read(_footer.size))
+        if magic==_footer_magic and hsize<=index_pos<=size-_footer.size:
+            f.seek(index_pos)
+            index=np.frombuffer(f.read(size-_footer.size-index_pos),dtype=compressed_index_dtype).copy()
+            return desc,index,index_pos
+    index,end=_scan_compressed_chunks(f,hsize) # no footer (e.g., the file was not properly closed)
+    return desc,index,end
+
+class CompressedFrameWriter:
+    """
+    Compressed frames writer.
+
+    Splits frames into blocks, compresses them in parallel in a thread pool, and writes them into a self-describing container.
+    The file consists of a header (see :func:`write_header`) with the frames shape, dtype and compression parameters,
+    followed by compressed blocks, each prepended by a short header with its first frame index, number of frames, and size,
+    and terminated by the blocks offset index (written on closing) for random access.
+    If the file was not properly closed, the index can still be restored from the block headers.
+
+    Args:
+        path: file path
+        frame_shape: shape of a single frame
+        dtype: frames dtype
+        append: if ``True`` and the file already exists, append the data to it; otherwise, overwrite it
+        codec: compression codec (see :func:`compress_block`); if bit shuffle is used and blosc is available,
+            ``"zlib"``, ``"zstd"``, and ``"lz4"`` codecs are used as internal compressors of the ``"blosc"`` codec with its native (multi-threaded) bit shuffle
+        level: compression level
+        shuffle: data shuffling applied before compression (see :func:`compress_block`)
+        nthreads: number of compression threads
+        block_size: approximate size of a single compressed block (before compression) in bytes
+    """
+    def __init__(self, path, frame_shape, dtype, append=True, codec="zlib", level=1, shuffle="byte", nthreads=2, block_size=2**22):
+        self.path=path
+        self.dtype=np.dtype(dtype)
+        self.frame_shape=tuple(frame_shape)
+        self.codec=codec
+        self.cname="lz4"
+        self.level=level
+        self.shuffle=shuffle
+        if shuffle=="bit" and codec in ["zlib","zstd","lz4"] and blosc is not None: # native bit shuffle is much faster than the numpy fallback
+            self.codec,self.cname="blosc",codec
+        if self.codec not in get_compression_codecs():
+            raise ValueError("compression codec {} is not available".format(codec))
+        frame_nbytes=self.dtype.itemsize*int(np.prod(self.frame_shape))
+        self.block_frames=max(block_size//max(frame_nbytes,1),1)
+        self.index=[]
+        self.nframes=0
+        if append and os.path.exists(path) and os.path.getsize(path)>0:
+            self.file=open(path,"r+b")
+            desc,index,end=_read_compressed_index(self.file)
+            if tuple(desc["frame_shape"])!=self.frame_shape or np.dtype(desc["dtype"])!=self.dtype:
+                self.file.close()
+                raise ValueError("appended frames shape or dtype do not match the existing file")
+            self.codec,self.shuffle,self.cname=desc["codec"],desc["shuffle"],desc.get("cname","lz4")
+            self.index=[tuple(r) for r in index]
+            self.nframes=int(index["frame"][-1]+index["nframes"][-1]) if len(index) else 0
+            self.file.seek(end)
+            self.file.truncate()
+        else:
+            self.file=open(path,"wb")
+            desc={"frame_shape":self.frame_shape,"dtype":self.dtype.str,"codec":self.codec,"cname":self.cname,"level":self.level,"shuffle":self.shuffle,"block_frames":self.block_frames}
+            write_header(self.file,desc)
+        self._pool=concurrent.futures.ThreadPoolExecutor(max(nthreads,1))
+        self.raw_nbytes=0
+        self.compressed_nbytes=0
+
+    def _write_block(self, data, nframes, nbytes):
+        self.file.write(_chunk_header.pack(_chunk_magic,self.nframes,nframes,nbytes,len(data)))
+        self.index.append((self.nframes,nframes,self.file.tell(),nbytes,len(data)))
+        self.file.write(data)
+        self.nframes+=nframes
+        self.raw_nbytes+=nbytes
+        self.compressed_nbytes+=len(data)
+    def write(self, frames, level=None):
+        """
+        Compress and write frames (3D array with the first axis being the frame index).
+
+        If `level` is not ``None``, it overrides the writer compression level for these frames.
+        """
+        level=self.level if level is None else level
+        frames=np.ascontiguousarray(frames,dtype=self.dtype)
+        blocks=[frames[i:i+self.block_frames] for i in range(0,len(frames),self.block_frames)]
+        futures=[self._pool.submit(compress_block,memoryview(b).cast("B"),self.dtype.itemsize,self.codec,level,self.shuffle,self.cname) for b in blocks]
+        for b,fut in zip(blocks,futures):
+            self._write_block(fut.result(),len(b),b.nbytes)
+    def tell(self):
+        """Get the current file size"""
+        return self.file.tell()
+    def get_ratio(self):
+        """Get the achieved compression ratio (uncompressed to compressed size)"""
+        return self.raw_nbytes/self.compressed_nbytes if self.compressed_nbytes else 1.
+    def flush(self):
+        """Flush the data to the disk"""
+        self.file.flush()
+    def close(self):
+        """Write the blocks index and close the file"""
+        if self.file is None:
+            return
+        try:
+            self._pool.shutdown()
+            index_pos=self.file.tell()
+            self.file.write(np.array(self.index,dtype=compressed_index_dtype).tobytes())
+            self.file.write(_footer.pack(index_pos,_footer_magic))
+            self.file.close()
+        finally:
+            self.file=None
+
+class CompressedFrameReader:
+    """
+    Reader for files written by :class:`CompressedFrameWriter`.
+
+    Args:
+        path: file path
+    
+    Attributes:
+        desc: file description dictionary (frame shape, dtype, compression parameters)
+        index: structured array with the compressed blocks index (first frame, number of frames, offset, uncompressed and compressed sizes)
+    """
+    def __init__(self, path):
+        self.path=path
+        self.file=open(path,"rb")
+        self.desc,self.index,_=_read_compressed_index(self.file)
+        self.dtype=np.dtype(self.desc["dtype"])
+        self.frame_shape=tuple(self.desc["frame_shape"])
+    def __len__(self):
+        return int(self.index["frame"][-1]+self.index["nframes"][-1]) if len(self.index) else 0
+    def _read_block(self, i):
+        _,nframes,offset,nbytes,cnbytes=self.index[i]
+        self.file.seek(offset)
+        data=decompress_block(self.file.read(cnbytes),nbytes,self.dtype.itemsize,codec=self.desc["codec"],shuffle=self.desc["shuffle"])
+        return np.frombuffer(data,dtype=self.dtype).reshape((nframes,)+self.frame_shape)
+    def read(self, start=0, stop=None):
+        """Read frames from `start` to `stop` as a 3D array (only the blocks containing these frames are decompressed)"""
+        stop=len(self) if stop is None else min(stop,len(self))
+        if stop<=start:
+            return np.zeros((0,)+self.frame_shape,dtype=self.dtype)
+        first=self.index["frame"]
+        blocks=range(max(np.searchsorted(first,start,side="right")-1,0),np.searchsorted(first,stop,side="left"))
+        frames=np.concatenate([self._read_block(i) for i in blocks],axis=0)
+        offset=first[blocks[0]]
+        return frames[start-offset:stop-offset]
+    def close(self):
+        """Close the file"""
+        self.file.close()
+    def __enter__(self):
+        return self
+    def __exit__(self, *args):
+        self.close()
+
+
+
+
+def get_checksum_algorithms():
+    """Get the list of available checksum algorithms"""
+    algorithms=["crc32"]
+    if xxhash is not None:
+        algorithms+=["xxh64","xxh3_64"]
+    return algorithms
+def compute_checksum(data, algorithm="crc32"):
+    """Calculate checksum of the data (bytes-like object or numpy array) using the given algorithm and return it as a hex string"""
+    if isinstance(data,np.ndarray):
+        data=memoryview(np.ascontiguousarray(data).reshape(-1)).cast("B")
+    if algorithm=="crc32":
+        return "{:08x}".format(zlib.crc32(data))
+    if algorithm in ["xxh64","xxh3_64"] and xxhash is not None:
+        return getattr(xxhash,algorithm+"_hexdigest")(data)
+    raise ValueError("checksum algorithm {} is not available".format(algorithm))
+def checksum_file_blocks(path, algorithm="crc32", block_size=2**24, start=0, stop=None):
+    """
+    Calculate checksums of consecutive blocks of the file between `start` and `stop` (end of file by default).
+
+    The file is read through a memory map. Return list of ``[offset, size, checksum]`` entries.
+    """
+    size=os.path.getsize(path)
+    stop=size if stop is None else min(stop,size)
+    blocks=[]
+    if stop<=start:
+        return blocks
+    with open(path,"rb") as f, mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ) as m:
+        for offset in range(start,stop,block_size):
+            n=min(block_size,stop-offset)
+            with memoryview(m)[offset:offset+n] as data:
+                blocks.append([offset,n,compute_checksum(data,algorithm)])
+    return blocks
+
+def write_checksum_manifest(path, algorithm, files):
+    """
+    Write the integrity manifest.
+
+    `files` is a dictionary ``{file_path: blocks}``, where `blocks` is a list of ``[offset, size, checksum]`` entries.
+    The file paths are stored relative to the manifest folder, so that the recording can be moved or copied together with the manifest.
+    The manifest is first written into a temporary file, so that an interrupted write does not leave a broken manifest.
+    """
+    folder=os.path.dirname(os.path.abspath(path))
+    desc={"algorithm":algorithm,"files":{}}
+    for p,blocks in files.items():
+        name=os.path.relpath(os.path.abspath(p),folder).replace(os.sep,"/")
+        desc["files"][name]={"size":os.path.getsize(p),"blocks":sorted(blocks)}
+    tmp_path=path+".tmp"
+    with open(tmp_path,"w") as f:
+        json.dump(desc,f)
+    os.replace(tmp_path,path)
+def load_checksum_manifest(path):
+    """Load the integrity manifest written by :func:`write_checksum_manifest`"""
+    with open(path,"r") as f:
+        return json.load(f)
+def verify_checksum_manifest(path, nthreads=4):
+    """
+    Verify the files described in the integrity manifest.
+
+    The files are read through memory maps, and the blocks are checked in `nthreads` parallel threads.
+    Return dictionary with the total verification result (``"ok"``), the number of checked bytes (``"nbytes"``), the verification time (``"time"``),
+    and the dictionary ``"files"`` with the per-file status (``"ok"``, ``"missing"``, ``"size_mismatch"``, or ``"corrupted"``)
+    and the list of ``[offset, size]`` of the corrupted blocks for each file.
+    """
+    t0=time.time()
+    desc=load_checksum_manifest(path)
+    folder=os.path.dirname(os.path.abspath(path))
+    algorithm=desc["algorithm"]
+    files={}
+    maps=[]
+    nbytes=0
+    def _check(m, offset, size, checksum):
+        with memoryview(m)[offset:offset+size] as data:
+            return compute_checksum(data,algorithm)==checksum
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max(nthreads,1)) as pool:
+            jobs={}
+            for name,entry in desc["files"].items():
+                fpath=os.path.join(folder,name)
+                if not os.path.exists(fpath):
+                    files[name]={"status":"missing","bad_blocks":[]}
+                    continue
+                size=os.path.getsize(fpath)
+                files[name]={"status":"ok" if size==entry["size"] else "size_mismatch","bad_blocks":[]}
+                jobs[name]=[]
+                m=None
+                if size:
+                    with open(fpath,"rb") as f:
+                        m=mmap.mmap(f.fileno(),0,access=mmap.ACCESS_READ)
+                    maps.append(m)
+                for offset,bsize,checksum in entry["blocks"]:
+                    if offset+bsize>size:
+                        files[name]["bad_blocks"].append([offset,bsize])
+                    else:
+                        jobs[name].append((offset,bsize,pool.submit(_check,m,offset,bsize,checksum)))
+                        nbytes+=bsize
+            for name,fjobs in jobs.items():
+                for offset,bsize,job in fjobs:
+                    if not job.result():
+                        files[name]["bad_blocks"].append([offset,bsize])
+                if files[name]["bad_blocks"]:
+                    files[name]["status"]="corrupted"
+    finally:
+        for m in maps:
+            m.close()
+    ok=all(f["status"]=="ok" for f in files.values())
+    return {"ok":ok,"nbytes":nbytes,"time":time.time()-t0,"files":files}
+
+
+
+
+def repair_raw_file(path, frame_nbytes, nframes=None):
+    """
+    Repair a raw binary frames file whose writing has been interrupted.
+
+    The file is truncated to `nframes` frames (if it is not ``None``) or to the last complete frame.
+    Return the number of frames in the file.
+    """
+    size=os.path.getsize(path)
+    n=size//frame_nbytes
+    if nframes is not None:
+        n=min(n,nframes)
+    if size!=n*frame_nbytes:
+        os.truncate(path,n*frame_nbytes)
+    return n
+def repair_striped_file(path, nframes=None):
+    """
+    Repair striped frames (see :class:`StripedFrameWriter`) whose writing has been interrupted.
+
+    The stripe files are truncated to `nframes` frames (if it is not ``None``) or to the last consecutive complete frame,
+    and the resulting number of frames is written into the manifest. Return the number of frames.
+    """
+    desc=load_stripes_manifest(path)
+    folder=os.path.dirname(os.path.abspath(path))
+    stripe_paths=[p if os.path.exists(p) else os.path.join(folder,os.path.basename(p)) for p in desc["stripes"]]
+    n=StripedFrameReader.get_nframes(desc,stripe_paths)
+    if nframes is not None:
+        n=min(n,nframes)
+    frame_nbytes=np.dtype(desc["dtype"]).itemsize*int(np.prod(desc["frame_shape"]))
+    for p,cnt in zip(stripe_paths,_get_stripe_nframes(n,len(stripe_paths),desc["stripe_frames"])):
+        if os.path.exists(p) and os.path.getsize(p)!=cnt*frame_nbytes:
+            os.truncate(p,cnt*frame_nbytes)
+    desc["nframes"]=n
+    with open(path,"w") as f:
+        json.dump(desc,f,indent=1)
+    return n
+def repair_cam_file(path, dtype="<u2"):
+    """
+    Repair a ``.cam`` frames file whose writing has been interrupted by truncating it after the last complete frame.
+
+    `dtype` is the stored frames dtype.
+    Return the number of frames in the file.
+    """
+    itemsize=np.dtype(dtype).itemsize
+    size=os.path.getsize(path)
+    pos=nframes=0
+    with open(path,"rb") as f:
+        while pos+8<=size:
+            f.seek(pos)
+            shape=struct.unpack("<II",f.read(8))
+            end=pos+8+itemsize*shape[0]*shape[1]
+            if end>size:
+                break
+            pos=end
+            nframes+=1
+    if pos!=size:
+        os.truncate(path,pos)
+    return nframes
+def repair_compressed_file(path):
+    """
+    Repair a compressed frames file (see :class:`CompressedFrameWriter`) whose writing has been interrupted.
+
+    If the file has no blocks index, it is restored from the block headers, the incomplete last block is removed, and the index is written.
+    Return the number of frames in the file.
+    """
+    with open(path,"r+b") as f:
+        desc,index,end=_read_compressed_index(f)
+        f.seek(0,2)
+        if f.tell()!=end+index.nbytes+_footer.size: # no valid index
+            f.seek(end)
+            f.truncate()
+            f.write(index.tobytes())
+            f.write(_footer.pack(end,_footer_magic))
+    return int(index["frame"][-1]+index["nframes"][-1]) if len(index) else 0
+def repair_tiff_file(path):
+    """
+    Repair a TIFF or BigTIFF file whose writing has been interrupted.
+
+    Follow the IFD chain and cut it at the first IFD which is incomplete, loops back, or points to strip data beyond the end of the file;
+    the file is then truncated after the last complete frame. Return the number of frames in the file.
+    """
+    type_sizes={3:2,4:4,16:8}
+    with open(path,"r+b") as f:
+        size=os.fstat(f.fileno()).st_size
+        header=f.read(8)
+        if len(header)<8 or header[:2]!=b"II":
+            raise IOError("unrecognized TIFF header")
+        bigtiff=struct.unpack("<H",header[2:4])[0]==43
+        off,cnt,entry_size="<Q" if bigtiff else "<I","<Q" if bigtiff else "<H",20 if bigtiff else 12
+        osize,csize=struct.calcsize(off),struct.calcsize(cnt)
+        link_pos=8 if bigtiff else 4
+        end=link_pos+osize
+        nframes=0
+        visited=set()
+        def read_values(entry):
+            tag,ttype=struct.unpack("<HH",entry[:4])
+            count,=struct.unpack(off,entry[4:4+osize])
+            tsize=type_sizes.get(ttype)
+            if tsize is None:
+                return tag,None
+            fmt="<{}{}".format(count,{2:"H",4:"I",8:"Q"}[tsize])
+            if count*tsize<=osize:
+                return tag,struct.unpack(fmt,entry[4+osize:4+osize+count*tsize])
+            pos,=struct.unpack(off,entry[4+osize:4+2*osize])
+            if pos+count*tsize>size:
+                return tag,None
+            f.seek(pos)
+            return tag,struct.unpack(fmt,f.read(count*tsize))
+        while True:
+            f.seek(link_pos)
+            ifd,=struct.unpack(off,f.read(osize))
+            if ifd==0:
+                break
+            valid=False
+            if ifd not in visited and ifd+csize<=size:
+                f.seek(ifd)
+                nentries,=struct.unpack(cnt,f.read(csize))
+                ifd_end=ifd+csize+nentries*entry_size+osize
+                if ifd_end<=size:
+                    f.seek(ifd+csize)
+                    data=f.read(nentries*entry_size)
+                    tags=dict(read_values(data[i*entry_size:(i+1)*entry_size]) for i in range(nentries))
+                    offsets,counts=tags.get(273),tags.get(279)
+                    if offsets is not None and counts is not None and len(offsets)==len(counts):
+                        strips_end=max([o+c for o,c in zip(offsets,counts)],default=0)
+                        valid=strips_end<=size
+            if not valid:
+                f.seek(link_pos)
+                f.write(struct.pack(off,0))
+                break
+            visited.add(ifd)
+            nframes+=1
+            end=max(end,ifd_end,strips_end)
+            link_pos=ifd+csize+nentries*entry_size
+        end+=end%2
+        if size>end:
+            f.truncate(end)
+    return nframes
+def repair_frame_info_file(path, nframes):
+    """
+    Repair a binary frame info file (see :class:`FrameInfoWriter`) whose writing has been interrupted.
+
+    The incomplete last record and the trailing records with the save index of `nframes` or above are removed.
+    Return the number of records in the file.
+    """
+    with open(path,"rb") as f:
+        desc,hsize=read_header(f)
+    record_dtype=np.dtype([tuple(d) for d in desc["record_dtype"]])
+    n=(os.path.getsize(path)-hsize)//record_dtype.itemsize
+    if n and nframes is not None:
+        save_index=np.memmap(path,dtype=record_dtype,mode="r",offset=hsize,shape=(n,))[record_dtype.names[0]]
+        valid=np.nonzero(save_index<nframes)[0]
+        n=valid[-1]+1 if len(valid) else 0
+        del save_index
+    os.truncate(path,hsize+n*record_dtype.itemsize)
+    return int(n)
+def repair_frame_info_text(path, nframes):
+    """
+    Repair a text frame info file whose writing has been interrupted.
+
+    The incomplete last row (with fewer columns than the header) and the trailing rows with the save index of `nframes` or above are removed.
+    Return the number of rows in the file.
+    """
+    with open(path,"rb") as f:
+        lines=f.read().split(b"\n")
+    def get_values(line):
+        try:
+            return [float(v) for v in line.split(b"\t")]
+        except ValueError:
+            return None
+    header=[line for line in lines if line.strip() and get_values(line.split(b"\t")[0]) is None]
+    ncols=len(header[0].split(b"\t")) if header else None
+    while lines:
+        if not lines[-1].strip():
+            lines.pop()
+            continue
+        values=get_values(lines[-1])
+        if values is None and lines[-1] in header:
+            break
+        if values is not None and (ncols is None or len(values)==ncols) and (nframes is None or values[0]<nframes):
+            break
+        lines.pop()
+    with open(path,"wb") as f:
+        f.write(b"\n".join(lines))
+    return sum(get_values(line) is not None for line in lines if line.strip())
+def repair_frame_index_file(path):
+    """
+    Repair a binary frame index file (see :class:`FrameIndexWriter`) whose writing has been interrupted by removing the incomplete last record.
+
+    Return the number of records in the file.
+    """
+    with open(path,"rb") as f:
+        _,hsize=read_header(f)
+    n=(os.path.getsize(path)-hsize)//frame_index_dtype.itemsize
+    os.truncate(path,hsize+n*frame_index_dtype.itemsize)
+    return n
+
+
+
+
+def benchmark_write(path, block_nbytes, total_nbytes=2**30, max_time=5., sync=True):
+    """
+    Benchmark the sustained disk writing speed.
+
+    Write blocks of `block_nbytes` bytes into a test file at `path` (flushing each one to the disk if ``sync==True``),
+    until either `total_nbytes` are written or `max_time` seconds pass, and then remove the file.
+    Return dictionary with the written size (``"nbytes"``), benchmark duration (``"time"``), sustained throughput in bytes/s (``"throughput"``),
+    and the median, 99th percentile, and maximal block write time in seconds (``"latency/p50"``, ``"latency/p99"``, and ``"latency/max"``).
+    If no blocks have been written (e.g., ``max_time<=0`` or ``total_nbytes<=0``), the latencies are ``None``.
+    """
+    block_nbytes=max(int(block_nbytes),1)
+    data=np.random.randint(0,256,size=block_nbytes,dtype="u1") # random data to avoid transparent compression by the file system
+    latencies=[]
+    nbytes=0
+    try:
+        with open(path,"wb",buffering=0) as f:
+            t0=time.perf_counter()
+            t=t0
+            while nbytes<total_nbytes and t-t0<max_time:
+                f.write(data.data)
+                if sync:
+                    os.fsync(f.fileno())
+                t1=time.perf_counter()
+                latencies.append(t1-t)
+                nbytes+=block_nbytes
+                t=t1
+    finally:
+        if os.path.exists(path):
+            os.remove(path)
+    elapsed=t-t0
+    result={"nbytes":nbytes,"time":elapsed,"throughput":nbytes/elapsed if elapsed>0 else 0.}
+    if latencies:
+        result.update({"latency/p50":float(np.percentile(latencies,50)),"latency/p99":float(np.percentile(latencies,99)),"latency/max":float(max(latencies))})
+    else:
+        result.update({"latency/p50":None,"latency/p99":None,"latency/max":None})
+    return result
@@ -4,13 +4,19 @@ from pylablib.devices.interface import camera as camera_utils
 from pylablib.core.thread import controller
 from pylablib.core.utils import dictionary, files as file_utils, funcargparse, string as string_utils
 from pylablib.core.fileio import savefile, loadfile, table_stream, location
-from pylablib.core.dataproc import image
+from pylablib.core.dataproc import image, filters
 from pylablib.thread.stream import frameproc, table_accum, stream_manager
 
+from . import framefiles
+
 import time
 import collections
+import copy
+import threading
+import concurrent.futures
+import queue
+import json
 import numpy as np
-import imageio
 import os
 
 
@@ -250,60 +256,212 @@ class PretriggerBuffer:
     Pretrigger buffer.
 
     Keeps track of the added frames and the total size, finds skips frames.
+    The frames are stored in a preallocated ring array (which grows up to the maximal size as the frames are added),
+    together with rings of frame indices, frame info, and skips; the message metadata is stored per added message.
+    All of the status counters are updated incrementally, and the frames are returned as views into the ring.
+    Since the returned views are still linked to the ring, the ring is copied on the next modification (copy-on-write).
 
     Args:
         size: maximal buffer size
         strict_size: if ``True``, the number of the frames in the buffer is never greater than `size`;
-            otherwise, the frame number is quantized to the whole frame messages, so the size might be larger.
+            the ring storage is always strict, so this parameter is only kept for compatibility.
         clear_on_reset: if ``True`` and a message with the reset signature (zero start index) is added, clear the buffer before adding.
     """
     def __init__(self, size, strict_size=True, clear_on_reset=True):
         self.size=size
-        self.buffer=[]
-        self.current_size=0
+        self.ring_size=size
         self.strict_size=strict_size
         self.clear_on_reset=clear_on_reset
+        self._frames=None
+        self._indices=None
+        self._gaps=None
+        self._info=None
+        self._capacity=0
+        self._start=0
+        self._count=0
+        self._frame_nbytes=0
+        self._segments=collections.deque() # list of ``[nframes, message_description, has_info]``, one per stored message
+        self._gap_sum=0
+        self._last_index=None
+        self._shared=False
     
+    def _ring_slices(self, start, n):
+        """Get list of ring slices corresponding to `n` frames starting from `start` ring position"""
+        if not n:
+            return []
+        start%=self._capacity
+        end=start+n
+        if end<=self._capacity:
+            return [slice(start,end)]
+        return [slice(start,self._capacity),slice(0,end-self._capacity)]
+    def _new_frames_array(self, capacity, frame_shape, dtype):
+        """Allocate a new frames ring array"""
+        return np.empty((capacity,)+frame_shape,dtype=dtype)
+    def _get_new_capacity(self, required):
+        """Get the new ring capacity to fit at least `required` frames"""
+        return min(self.ring_size,max(required,2*self._capacity))
+    def _unroll(self, arr, capacity):
+        """Copy the ring array `arr` contents into a new array of the given capacity starting from position zero"""
+        if arr is None:
+            return None
+        if arr is self._frames:
+            new_arr=self._new_frames_array(capacity,arr.shape[1:],arr.dtype)
+        else:
+            new_arr=np.empty((capacity,)+arr.shape[1:],dtype=arr.dtype)
+        pos=0
+        for sl in self._ring_slices(self._start,self._count):
+            n=sl.stop-sl.start
+            new_arr[pos:pos+n]=arr[sl]
+            pos+=n
+        return new_arr
+    def _reallocate(self, capacity):
+        """Reallocate the ring arrays with the new capacity"""
+        self._frames,self._indices,self._gaps,self._info=[self._unroll(arr,capacity) for arr in [self._frames,self._indices,self._gaps,self._info]]
+        self._capacity=capacity
+        self._start=0
+        self._shared=False
+    def _evict(self, n):
+        """Remove `n` oldest frames"""
+        n=min(n,self._count)
+        if n<=0:
+            return
+        for sl in self._ring_slices(self._start,n):
+            self._gap_sum-=int(self._gaps[sl].sum())
+        self._start=(self._start+n)%self._capacity
+        self._count-=n
+        while n>0:
+            seg=self._segments[0]
+            if seg[0]<=n:
+                n-=seg[0]
+                self._segments.popleft()
+            else:
+                seg[0]-=n
+                n=0
+    def _get_message_data(self, msg):
+        """Get frames, indices, and frame info (``None`` if missing or incompatible) of the message as lists of arrays"""
+        if msg.chunks:
+            frames=list(msg.frames)
+            indices=[np.asarray(i) for i in msg.indices]
+        else:
+            frames=[np.asarray(msg.frames)]
+            indices=[np.asarray(msg.indices)]
+        info=None
+        if msg.frame_info is not None:
+            try:
+                if msg.chunks:
+                    info=[np.asarray(i) for i in msg.frame_info]
+                else:
+                    info=[np.array(msg.frame_info)]
+                if any(i.ndim!=2 or i.dtype.kind not in "biuf" for i in info):
+                    info=None
+            except ValueError:
+                info=None
+        return frames,indices,info
     def add_frame_message(self, msg):
         """Add a new frame message"""
         if not msg:
             return
         if not msg.first_frame_index() and self.clear_on_reset:
             self.clear()
-        self.buffer.append(msg)
-        self.current_size+=msg.nframes()
-        while self.buffer and self.current_size-self.buffer[0].nframes()>=self.size:
-            self.current_size-=self.buffer[0].nframes()
-            del self.buffer[0]
-        if self.strict_size and self.current_size>self.size:
-            extra_frames=self.current_size-self.size
-            self.buffer[0].cut_to_size(self.buffer[0].nframes()-extra_frames,from_end=True)
-            self.current_size-=extra_frames
+        self._add_message(msg)
+    def _make_room(self, n):
+        """Remove `n` oldest frames to make room for the new ones"""
+        self._evict(n)
+    def _add_message(self, msg):
+        """Add frames from the message to the ring"""
+        if msg.nframes()>self.ring_size:
+            msg.cut_to_size(self.ring_size,from_end=True)
+        n=msg.nframes()
+        if not n:
+            return
+        frames,indices,info=self._get_message_data(msg)
+        frame_shape,frame_dtype=frames[0].shape[1:],frames[0].dtype
+        if self._frames is not None and (self._frames.shape[1:]!=frame_shape or self._frames.dtype!=frame_dtype):
+            self.clear()
+            self._frames=None
+        if self._frames is None:
+            self._capacity=0
+            self._frames=np.empty((0,)+frame_shape,dtype=frame_dtype)
+            self._indices=np.empty(0,dtype="i8")
+            self._gaps=np.empty(0,dtype="i8")
+            self._info=None
+            self._frame_nbytes=frame_dtype.itemsize*int(np.prod(frame_shape))
+        if info is not None:
+            if self._info is None and not self._count:
+                self._info=np.empty((self._capacity,info[0].shape[1]),dtype="f8" if any(i.dtype.kind=="f" for i in info) else "i8")
+            elif self._info is None or self._info.shape[1]!=info[0].shape[1]:
+                info=None
+        self._make_room(self._count+n-self.ring_size)
+        if self._count+n>self._capacity:
+            self._reallocate(self._get_new_capacity(self._count+n))
+        elif self._shared:
+            self._reallocate(self._capacity)
+        all_indices=np.concatenate(indices)
+        gaps=np.zeros(n,dtype="i8")
+        step=msg.metainfo.get("step",1)
+        gaps[1:]=np.diff(all_indices)-step
+        if self._last_index is not None and msg.first_frame_index(): # don't count reset as skip
+            gaps[0]=all_indices[0]-self._last_index-step
+        pos=0
+        for f,i,inf in zip(frames,indices,info or [None]*len(frames)):
+            for sl in self._ring_slices(self._start+self._count,len(f)):
+                m=sl.stop-sl.start
+                self._frames[sl]=f[:m]
+                self._indices[sl]=i[:m]
+                self._gaps[sl]=gaps[pos:pos+m]
+                if inf is not None:
+                    self._info[sl]=inf[:m]
+                f,i,inf=f[m:],i[m:],(None if inf is None else inf[m:])
+                pos+=m
+                self._count+=m
+        self._gap_sum+=int(gaps.sum())
+        desc=(type(msg),msg.metainfo,msg.sn,msg.sid,msg.mid)
+        self._segments.append([n,desc,info is not None])
+        self._last_index=msg.last_frame_index()
+    def _make_message(self, n, desc, has_info):
+        """Make a message containing `n` oldest frames (as views into the ring) with the given stored description"""
+        msg_type,metainfo,sn,sid,mid=desc
+        slices=self._ring_slices(self._start,n)
+        frames=[self._frames[sl] for sl in slices]
+        indices=[self._indices[sl].copy() for sl in slices]
+        frame_info=[self._info[sl] for sl in slices] if has_info else None
+        return msg_type(frames,indices=indices,frame_info=frame_info,chunks=True,metainfo=dict(metainfo),sn=sn,sid=sid,mid=mid)
     def pop_frame_message(self):
         """Pop the latest frame message"""
-        if self.buffer:
-            self.current_size-=self.buffer[0].nframes()
-            return self.buffer.pop(0)
+        if self._segments:
+            n,desc,has_info=self._segments[0]
+            msg=self._make_message(n,desc,has_info)
+            self._evict(n)
+            self._shared=True
+            return msg
     def clear(self):
         """Clear all frames in the buffer"""
-        self.buffer=[]
-        self.current_size=0
+        self._start=0
+        self._count=0
+        self._segments.clear()
+        self._gap_sum=0
+        self._last_index=None
     def copy(self):
-        """Return copy of the buffer"""
-        buff=PretriggerBuffer(self.size,self.strict_size,self.clear_on_reset)
-        buff.buffer=list(self.buffer)
-        buff.current_size=self.current_size
+        """Return copy of the buffer (the storage is shared until one of the buffers is modified)"""
+        buff=copy.copy(self)
+        buff._segments=collections.deque([list(seg) for seg in self._segments])
+        buff._shared=self._shared=True
         return buff
+    def close(self):
+        """Clear the buffer and release its storage"""
+        self.clear()
+        self._frames=self._indices=self._gaps=self._info=None
+        self._capacity=0
 
     def has_frames(self):
         """Check if there are frames in the buffer"""
-        return bool(self.buffer)
+        return self._count>0
     def nframes(self):
         """Get total number of frames"""
-        return sum([m.nframes() for m in self.buffer])
+        return self._count
     def nbytes(self):
         """Get total size of the frames in bytes"""
-        return sum([m.nbytes() for m in self.buffer])
+        return self._count*self._frame_nbytes
     TBufferStatus=collections.namedtuple("TBufferStatus",["frames","skipped","nbytes","size"])
     def get_status(self):
         """
@@ -312,14 +470,417 @@ class PretriggerBuffer:
         Return tuple ``(frames, skipped, nbytes, size)`` with, correspondingly, number of frames in the buffer, number of skipped frames amongst them,
         size of the buffer in bytes, and maximal buffer size.
         """ 
-        last_frame_idx=None
-        nframes=self.nframes()
-        nbytes=self.nbytes()
-        skipped=0
-        for m in self.buffer:
-            skipped+=m.get_missing_frames_number(last_frame_idx if m.first_frame_index() else None) # don't count reset as skip
-            last_frame_idx=m.last_frame_index()
-        return self.TBufferStatus(nframes,skipped,nbytes,self.size)
+        return self.TBufferStatus(self.nframes(),self._get_skipped(),self.nbytes(),self.size)
+    def _get_skipped(self, include_first=False):
+        """Get the number of skipped frames in the buffer; if ``include_first==True``, include the skip before the oldest frame"""
+        if not self._count:
+            return 0
+        return self._gap_sum if include_first else self._gap_sum-int(self._gaps[self._start])
+
+class _DiskPretriggerRing(PretriggerBuffer):
+    """
+    Pretrigger ring with frames stored in a preallocated memory-mapped file.
+
+    Args:
+        size: maximal number of frames
+        folder: folder containing the ring file
+    """
+    _ring_cnt=0
+    def __init__(self, size, folder):
+        super().__init__(size,clear_on_reset=False)
+        self.folder=folder
+        self.path=None
+    def _new_frames_array(self, capacity, frame_shape, dtype):
+        _DiskPretriggerRing._ring_cnt+=1
+        self.path=os.path.join(self.folder,"pretrigger_{}_{}.bin".format(os.getpid(),_DiskPretriggerRing._ring_cnt))
+        os.makedirs(self.folder,exist_ok=True)
+        framefiles._preallocate_file(self.path,capacity*dtype.itemsize*int(np.prod(frame_shape)))
+        return np.memmap(self.path,dtype=dtype,mode="r+",shape=(capacity,)+frame_shape)
+    def _get_new_capacity(self, required):
+        return self.ring_size
+    def _remove_file(self, path):
+        if path is not None:
+            try:
+                os.remove(path)
+            except OSError: # file is still mapped on Windows
+                pass
+    def _reallocate(self, capacity):
+        path=self.path
+        super()._reallocate(capacity)
+        if path!=self.path:
+            self._remove_file(path)
+    def close(self):
+        super().close()
+        self._remove_file(self.path)
+        self.path=None
+    def promote(self, path, append=False):
+        """
+        Move all of the stored frames into a raw binary file at `path` (append to it if ``append==True``).
+
+        The data is moved by renaming the ring file (if possible), or copied within the OS without reading it into Python.
+        Return list of frame messages with the moved frames (frames are memory-mapped views, and can be used to get the metadata).
+        """
+        if not self._count:
+            return []
+        ranges=[(sl.start*self._frame_nbytes,(sl.stop-sl.start)*self._frame_nbytes) for sl in self._ring_slices(self._start,self._count)]
+        msgs=[]
+        while self.has_frames():
+            msgs.append(self.pop_frame_message())
+        if framefiles.transfer_file_data(self.path,path,ranges,append=append): # the ring file is now the output file; start a new one
+            self._frames=None
+            self._capacity=0
+            self.path=None
+        return msgs
+
+class SpillingPretriggerBuffer(PretriggerBuffer):
+    """
+    Tiered pretrigger buffer.
+
+    The most recent `ram_size` frames are kept in RAM, while the older frames (up to the total of `size` frames)
+    are moved into a memory-mapped ring file in `spill_folder`, so the buffer can be larger than the available RAM.
+    On saving start the file data can be moved directly into the raw output file using :meth:`promote`.
+
+    Args:
+        size: maximal buffer size
+        ram_size: maximal number of frames kept in RAM
+        spill_folder: folder to store the ring file (preferably, on a fast disk)
+        strict_size: kept for compatibility with :class:`PretriggerBuffer`
+        clear_on_reset: if ``True`` and a message with the reset signature (zero start index) is added, clear the buffer before adding.
+    """
+    def __init__(self, size, ram_size, spill_folder, strict_size=True, clear_on_reset=True):
+        super().__init__(size,strict_size=strict_size,clear_on_reset=clear_on_reset)
+        self.ring_size=max(min(ram_size,size),1)
+        self.spill_folder=spill_folder
+        self._spill=_DiskPretriggerRing(max(size-self.ring_size,1),spill_folder)
+
+    def add_frame_message(self, msg):
+        if not msg:
+            return
+        if not msg.first_frame_index() and self.clear_on_reset:
+            self.clear()
+        n=msg.nframes()
+        if n>self.ring_size: # spill the excess frames directly
+            self._make_room(self._count)
+            head=msg.copy()
+            head.cut_to_size(n-self.ring_size)
+            self._spill.add_frame_message(head)
+            self._last_index=head.last_frame_index()
+            msg.cut_to_size(self.ring_size,from_end=True)
+        self._add_message(msg)
+    def _make_room(self, n):
+        n=min(n,self._count)
+        while n>0:
+            m=min(self._segments[0][0],n)
+            self._spill.add_frame_message(self._make_message(m,*self._segments[0][1:]))
+            self._evict(m)
+            n-=m
+    def pop_frame_message(self):
+        """
+        Pop the latest frame message.
+
+        Messages with the spilled frames (memory-mapped views into the ring file) have ``"pretrigger_spilled"`` metainfo entry set to ``True``;
+        since they do not occupy RAM, the saver does not count them towards the queue RAM.
+        """
+        if self._spill.has_frames():
+            msg=self._spill.pop_frame_message()
+            msg.metainfo["pretrigger_spilled"]=True
+            return msg
+        return super().pop_frame_message()
+    def clear(self):
+        super().clear()
+        self._spill.clear()
+    def copy(self):
+        buff=super().copy()
+        buff._spill=self._spill.copy()
+        return buff
+    def close(self):
+        super().close()
+        self._spill.close()
+    def promote(self, path, append=False):
+        """
+        Move all of the spilled frames into a raw binary file at `path` (append to it if ``append==True``).
+
+        Return list of frame messages with the moved frames (see :meth:`_DiskPretriggerRing.promote`);
+        the frames kept in RAM are left in the buffer.
+        """
+        return self._spill.promote(path,append=append)
+    def nspilled(self):
+        """Get number of frames in the spill file"""
+        return self._spill.nframes()
+    def spilled_dtype(self):
+        """Get dtype of the frames in the spill file (``None`` if there are no frames)"""
+        return self._spill._frames.dtype if self._spill.has_frames() else None
+
+    def has_frames(self):
+        return self._count>0 or self._spill.has_frames()
+    def nframes(self):
+        return self._count+self._spill.nframes()
+    def nbytes(self):
+        return self._count*self._frame_nbytes+self._spill.nbytes()
+    def _get_skipped(self, include_first=False):
+        if not self._spill.has_frames():
+            return super()._get_skipped(include_first=include_first)
+        return self._spill._get_skipped(include_first=include_first)+super()._get_skipped(include_first=True)
+
+class FrameWriterPool:
+    """
+    Pool of background writer threads.
+
+    Executes blocking write jobs in dedicated threads, so that the disk latency does not stall the controlling thread.
+    Jobs submitted to the same lane are executed by the same thread in the order of submission; different lanes can run in parallel.
+
+    Args:
+        nthreads: number of writer threads
+        max_inflight: maximal number of jobs which are submitted but not yet completed
+    """
+    def __init__(self, nthreads=1, max_inflight=4):
+        self.nthreads=max(nthreads,1)
+        self.max_inflight=max(max_inflight,1)
+        self._inflight=0
+        self._results=[]
+        self._lock=threading.Condition()
+        self._queues=[queue.Queue() for _ in range(self.nthreads)]
+        self._threads=[threading.Thread(target=self._run,args=(q,),daemon=True) for q in self._queues]
+        for t in self._threads:
+            t.start()
+    def _run(self, jobs):
+        while True:
+            job=jobs.get()
+            if job is None:
+                break
+            func,args,tag=job
+            result,error=None,None
+            try:
+                result=func(*args)
+            except Exception as err:  # pylint: disable=broad-except
+                error=err
+            with self._lock:
+                self._results.append((tag,result,error))
+                self._inflight-=1
+                self._lock.notify_all()
+    
+    def submit(self, func, args=(), tag=None, lane=0, force=False):
+        """
+        Submit a job calling ``func(*args)``.
+
+        `tag` is returned together with the job result in :meth:`pop_results`.
+        Return ``True`` if the job is submitted, and ``False`` if the maximal number of in-flight jobs is reached.
+        If ``force==True``, the job is always submitted (used for jobs accompanying an already submitted one).
+        """
+        with self._lock:
+            if self._inflight>=self.max_inflight and not force:
+                return False
+            self._inflight+=1
+        self._queues[lane%self.nthreads].put((func,args,tag))
+        return True
+    def is_full(self):
+        """Check if the maximal number of in-flight jobs is reached"""
+        return self._inflight>=self.max_inflight
+    def ninflight(self):
+        """Get number of submitted but not yet completed jobs"""
+        return self._inflight
+    def pop_results(self):
+        """Return list of tuples ``(tag, result, error)`` for all the jobs completed since the last call (in the order of completion)"""
+        with self._lock:
+            results,self._results=self._results,[]
+        return results
+    def cancel_pending(self):
+        """Remove all jobs which have not been started yet"""
+        for jobs in self._queues:
+            while True:
+                try:
+                    job=jobs.get_nowait()
+                except queue.Empty:
+                    break
+                if job is None:
+                    jobs.put(None)
+                    break
+                with self._lock:
+                    self._inflight-=1
+                    self._lock.notify_all()
+    def wait(self, timeout=None):
+        """Wait until all of the submitted jobs are completed; return ``True`` if all jobs are done, and ``False`` if timeout has passed"""
+        with self._lock:
+            return self._lock.wait_for(lambda: self._inflight<=0,timeout=timeout)
+    def close(self):
+        """Wait for all current jobs to finish and stop the threads"""
+        for jobs in self._queues:
+            jobs.put(None)
+        for t in self._threads:
+            t.join()
+
+class WriteStatistics:
+    """
+    Write timing statistics.
+
+    Keeps the durations of the recent writes of each kind (e.g., frame data or frame info) to get their latency percentiles,
+    the total counts, durations, and sizes, and the written data rate over a sliding time window.
+    The writes can be added from several threads.
+
+    Args:
+        history: number of recent writes of each kind used to calculate latency percentiles
+        window: duration of the sliding window (in seconds) used to calculate the data rate
+    """
+    def __init__(self, history=1000, window=5.):
+        self.history=history
+        self.window=window
+        self._lock=threading.Lock()
+        self.reset()
+    def reset(self):
+        """Reset all statistics"""
+        with self._lock:
+            self._latencies={}
+            self._totals={}
+            self._rate_window=collections.deque()
+            self._rate_range=None
+            self._start=None
+    def add(self, kind, duration, nbytes=0):
+        """Add a write of the given kind, which took `duration` seconds and wrote `nbytes` bytes"""
+        t=time.time()
+        with self._lock:
+            if self._start is None:
+                self._start=t-duration
+            if kind not in self._latencies:
+                self._latencies[kind]=collections.deque(maxlen=self.history)
+                self._totals[kind]=[0,0.,0,0.] # count, total duration, total size, maximal duration
+            self._latencies[kind].append(duration)
+            totals=self._totals[kind]
+            totals[0]+=1
+            totals[1]+=duration
+            totals[2]+=nbytes
+            totals[3]=max(totals[3],duration)
+            if nbytes:
+                self._rate_window.append((t,nbytes))
+    def _get_rate(self, t):
+        while self._rate_window and self._rate_window[0][0]<t-self.window:
+            self._rate_window.popleft()
+        span=0 if self._start is None else min(t-self._start,self.window)
+        if not self._rate_window or span<=0:
+            return 0.
+        return sum([n for _,n in self._rate_window])/span
+    def get_rate(self):
+        """Get the data rate (in bytes/s) over the sliding window"""
+        with self._lock:
+            return self._get_rate(time.time())
+    def get_summary(self):
+        """
+        Get the statistics summary.
+
+        Return dictionary with a branch for each write kind, which contains the number of writes (``"count"``), total write duration (``"time"``) and size (``"nbytes"``),
+        and the latency percentiles over the recent writes and the overall maximal latency (``"latency/p50"``, ``"latency/p95"``, ``"latency/p99"``, ``"latency/max"``);
+        the current data rate over the sliding window (``"rate/current"``), and its minimal and maximal values among the previous summary requests (``"rate/min"`` and ``"rate/max"``;
+        only requests made after the first full window are taken into account).
+        """
+        t=time.time()
+        summary={}
+        with self._lock:
+            rate=self._get_rate(t)
+            if self._start is not None and t-self._start>=self.window: # only consider full windows for the range
+                self._rate_range=(rate,rate) if self._rate_range is None else (min(self._rate_range[0],rate),max(self._rate_range[1],rate))
+            for kind,lats in self._latencies.items():
+                count,duration,nbytes,max_latency=self._totals[kind]
+                p50,p95,p99=np.percentile(lats,[50,95,99])
+                summary[kind]={"count":count,"time":duration,"nbytes":nbytes,
+                    "latency/p50":float(p50),"latency/p95":float(p95),"latency/p99":float(p99),"latency/max":max_latency}
+            summary["rate/current"]=rate
+            summary["rate/min"],summary["rate/max"]=self._rate_range or (0.,0.)
+        return summary
+
+class ChecksumCollector:
+    """
+    Background checksum calculator for the saved recording.
+
+    The checksums of the written raw data chunks are calculated in a background thread as the data is written, and the remaining saved files
+    (or the files whose chunks could not be queued in time) are checksummed block-wise after the saving is done.
+    The resulting integrity manifest (see :func:`.framefiles.write_checksum_manifest`) is written by a separate finishing thread,
+    so the saving thread never waits for the checksum calculation.
+
+    Args:
+        algorithm: checksum algorithm (see :func:`.framefiles.get_checksum_algorithms`)
+        block_size: size of the checksummed blocks for the files which are checksummed after saving
+        max_inflight: maximal number of chunks queued for the checksum calculation; if it is exceeded, the corresponding file is checksummed after saving instead
+    """
+    def __init__(self, algorithm="crc32", block_size=2**24, max_inflight=8):
+        self.algorithm=algorithm
+        self.block_size=block_size
+        self._pool=FrameWriterPool(1,max_inflight)
+        self._chunks={}
+        self._prefixes={}
+        self._rescan=set()
+        self._nchunks=0
+        self._finisher=None
+        self._status="collecting"
+        self._error=None
+        self.manifest_path=None
+
+    def add_chunk(self, path, offset, data):
+        """Queue checksum calculation of the `data` array written at `offset` of the file at `path`"""
+        path=os.path.abspath(path)
+        if path in self._rescan:
+            return
+        if not self._pool.submit(framefiles.compute_checksum,(data,self.algorithm),tag=(path,offset,data.nbytes)):
+            self._rescan.add(path)
+        self._nchunks+=1
+    def add_prefix(self, path, size):
+        """Mark the first `size` bytes of the file at `path` (already present before the saving started) to be checksummed after saving"""
+        path=os.path.abspath(path)
+        self._prefixes[path]=max(self._prefixes.get(path,0),size)
+    def _collect(self):
+        for (path,offset,size),checksum,err in self._pool.pop_results():
+            if err is None:
+                self._chunks.setdefault(path,[]).append([offset,size,checksum])
+            else:
+                self._rescan.add(path)
+    def _finish(self, files):
+        try:
+            self._pool.wait()
+            self._collect()
+            self._pool.close()
+            blocks={}
+            for path in set(files)|set(self._chunks)|set(self._rescan):
+                if not os.path.exists(path):
+                    continue
+                if path in self._chunks and path not in self._rescan:
+                    blocks[path]=self._chunks[path]
+                    if path in self._prefixes:
+                        blocks[path]+=framefiles.checksum_file_blocks(path,self.algorithm,self.block_size,stop=self._prefixes[path])
+                else:
+                    blocks[path]=framefiles.checksum_file_blocks(path,self.algorithm,self.block_size)
+            framefiles.write_checksum_manifest(self.manifest_path,self.algorithm,blocks)
+            self._status="done"
+        except (OSError,ValueError) as err:
+            self._status="error"
+            self._error=str(err)
+    def finish(self, manifest_path, files):
+        """
+        Start writing the integrity manifest to `manifest_path` in the background.
+
+        `files` is the list of saved file paths; the files which have not been checksummed by chunks are checksummed as a whole.
+        """
+        self.manifest_path=manifest_path
+        self._status="finishing"
+        self._finisher=threading.Thread(target=self._finish,args=([os.path.abspath(p) for p in files],),daemon=True)
+        self._finisher.start()
+    def wait(self, timeout=None):
+        """Wait until the manifest is written; return ``True`` if it is done"""
+        if self._finisher is not None:
+            self._finisher.join(timeout)
+            return not self._finisher.is_alive()
+        return False
+    def is_finishing(self):
+        """Check if the manifest is being written"""
+        return self._finisher is not None and self._finisher.is_alive()
+    def get_status(self):
+        """
+        Get the checksum status.
+
+        Return dictionary with the status (``"collecting"``, ``"finishing"``, ``"done"``, or ``"error"``),
+        the error message (``None`` if there is no error), the number of checksummed chunks, and the number of files which are checksummed after saving.
+        """
+        return {"status":self._status,"error":self._error,"chunks":self._nchunks,"rescanned":len(self._rescan)}
+
+
+
 
 class FrameWriteError(IOError):
     """Frame saving error"""
@@ -328,6 +889,163 @@ class FrameWriteError(IOError):
         self.kind=kind
         super().__init__("saving frames raised {} error; only {} frames saved".format(kind,saved))
 
+class FrameSink:
+    """
+    Additional saving destination written from the saving queue of :class:`FrameSaveThread`.
+
+    Each sink applies its own frame selection (decimation, ROI, and rate limit) and writes the selected frames in its own format,
+    together with the binary frame info table (suffix ``_frameinfo``, see :class:`.framefiles.FrameInfoWriter`) containing the camera frame indices,
+    and the settings file (suffix ``_settings``) describing the sink and its counters.
+    Write errors only stop the sink itself and are reported in its status.
+
+    Args:
+        name: sink name
+        path: saving path; if ``None``, it is generated from the main saving path by adding the sink name as a suffix
+        format: saving format; can be ``"raw"``, ``"tiff"``, or ``"bigtiff"``
+        decimation: only save frames whose index is divisible by `decimation`
+        roi: if not ``None``, tuple ``(hstart, hend, vstart, vend)`` with the saved frame region
+        max_rate: if not ``None``, maximal saved frame rate in Hz; extra frames are dropped evenly
+    """
+    extensions={"raw":"bin","tiff":"tiff","bigtiff":"btf"}
+    def __init__(self, name, path=None, format="tiff", decimation=1, roi=None, max_rate=None):
+        funcargparse.check_parameter_range(format,"format",list(self.extensions))
+        self.name=name
+        self.base_path=path
+        self.format=format
+        self.decimation=max(int(decimation or 1),1)
+        self.roi=tuple(roi) if roi else None
+        self.max_rate=max_rate or None
+        self.path=None
+        self.status="off"
+        self.error=None
+        self._reset()
+    def _reset(self):
+        self.received=0
+        self.saved=0
+        self.skipped=0
+        self._frame_desc=None
+        self._writer=None
+        self._index_writer=None
+        self._opened=False
+        self._finished=False
+        self._rate_tokens=1.
+        self._rate_time=None
+
+    def get_desc(self):
+        """Get the sink parameters dictionary"""
+        return {"path":self.path,"format":self.format,"decimation":self.decimation,"roi":self.roi,"max_rate":self.max_rate}
+    def get_status(self):
+        """
+        Get the sink status dictionary.
+
+        Contains the status (``"off"``, ``"saving"``, ``"done"``, or ``"error"``), the error description,
+        and the numbers of received, saved, and skipped (by decimation or rate limit) frames.
+        """
+        return {"status":self.status,"error":self.error,"received":self.received,"saved":self.saved,"skipped":self.skipped}
+    def _get_path(self, subpath, ext):
+        return FrameSaveThread.build_path(self.path,"pfx",subpath=subpath,ext=ext)
+    def start(self, main_path, main_path_kind="pfx"):
+        """Start saving; `main_path` and `main_path_kind` describe the main saving path"""
+        self._reset()
+        if self.base_path is None:
+            self.path=FrameSaveThread.build_path(main_path,main_path_kind,subpath=self.name,ext=self.extensions[self.format])
+        else:
+            self.path=self.base_path
+        self.status="saving"
+        self.error=None
+    def _select(self, msg):
+        """Select frames of the message to be saved; return list of tuples ``(frames, indices)``"""
+        selected=[]
+        t=msg.metainfo["creation_time"]
+        if self.max_rate:
+            if self._rate_time is not None:
+                self._rate_tokens=min(self._rate_tokens+(t-self._rate_time)*self.max_rate,max(self.max_rate,1.))
+            self._rate_time=t
+        for frames,indices in zip(msg.frames,msg.indices):
+            if not msg.chunks:
+                frames,indices=frames[None],[indices]
+            indices=np.asarray(indices)
+            nframes=len(frames)
+            sel=np.arange(nframes)
+            if self.decimation>1:
+                sel=sel[indices%self.decimation==0]
+            if self.max_rate:
+                n=min(len(sel),int(self._rate_tokens))
+                if n<len(sel):
+                    sel=sel[np.unique(np.linspace(0,len(sel)-1,n).round().astype(int))] if n else sel[:0]
+                self._rate_tokens-=n
+            self.received+=nframes
+            self.skipped+=nframes-len(sel)
+            if len(sel):
+                if len(sel)<nframes:
+                    frames=frames[sel]
+                if self.roi is not None:
+                    h0,h1,v0,v1=self.roi
+                    frames=frames[:,v0:v1,h0:h1]
+                selected.append((frames,indices[sel]))
+        return selected
+    def _write_frames(self, frames, indices):
+        if self._writer is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)),exist_ok=True)
+            if self.format=="raw":
+                self._writer=framefiles.RawFrameWriter(self.path,append=False)
+            else:
+                self._writer=framefiles.TiffFrameWriter(self.path,bigtiff=self.format=="bigtiff")
+            self._opened=True
+            self._index_writer=framefiles.FrameInfoWriter(self._get_path("frameinfo","bin"),["save_index","frame_index"],append=False)
+        if self.format=="raw":
+            frames=np.asarray(frames,FrameSaveThread._get_raw_save_dtype(frames.dtype))
+        elif frames.dtype=="float64":
+            frames=frames.astype("float32")
+        self._frame_desc=(frames.shape[1:],frames.dtype.str)
+        nframes=len(frames)
+        try:
+            self._writer.write(frames)
+        except framefiles.TiffSizeExceededError as err:
+            nframes=err.written
+            raise
+        finally:
+            self._index_writer.write(np.column_stack([np.arange(self.saved,self.saved+nframes),indices[:nframes]]))
+            self.saved+=nframes
+    def write(self, messages):
+        """Select and write frames from the list of messages"""
+        if self.status!="saving":
+            return
+        try:
+            for msg in messages:
+                for frames,indices in self._select(msg):
+                    self._write_frames(frames,indices)
+        except (OSError,ValueError) as err:
+            self.status="error"
+            self.error=str(err)
+            self._close()
+    def _close(self):
+        writers,self._writer,self._index_writer=(self._writer,self._index_writer),None,None
+        for w in writers:
+            if w is not None:
+                w.close()
+    def finish(self, extra_settings=None):
+        """Finish saving: close the files and write the settings file"""
+        if self.status=="off" or self._finished:
+            return
+        self._finished=True
+        if self.status=="saving":
+            self.status="done"
+        try:
+            self._close()
+            if self._opened:
+                settings=dictionary.Dictionary({"sink":self.name})
+                settings.update(self.get_desc())
+                settings.update(self.get_status())
+                if self._frame_desc is not None:
+                    settings["frame/shape"],settings["frame/dtype"]=self._frame_desc
+                if extra_settings:
+                    settings.update(extra_settings)
+                savefile.save_dict(settings,self._get_path("settings","dat"))
+        except OSError as err:
+            self.status="error"
+            self.error=str(err)
+
 class FrameSaveThread(controller.QTaskThread):
     """
     Frame saving thread
@@ -342,8 +1060,46 @@ class FrameSaveThread(controller.QTaskThread):
 
     Attributes:
         chunks_per_save: number of saving queue chunks to write to disk in one dump job (by default, one chunk)
-        chunk_period (float): duration of a single saving queue chunk (in seconds); by default, 0.5 seconds
+        chunk_period (float): duration of a single saving queue chunk (in seconds); by default, 0.2 seconds;
+            with adaptive chunking, it is also the maximal time the frames wait in the queue before being written (unless the disk is too slow)
+        adaptive_chunking (bool): if ``True`` (default), adapt the write size to the queue state: frames are accumulated up to :attr:`chunk_target_size`
+            (or for at most :attr:`chunk_period`) before being written, and several chunks are merged into a single write (up to :attr:`chunk_max_size`) when the queue backs up;
+            if ``False``, the queue is written in chunks of fixed duration as soon as possible
+        chunk_target_size (int): target size of a single write in bytes with adaptive chunking; by default, 8 Mb
+        chunk_max_size (int): maximal size of a single merged write in bytes with adaptive chunking; by default, 128 Mb
         dumping_period (float): period of queue dump job; by default, 0.1 seconds
+        writer_threads (int): number of background writer threads; if 0 (default), the data is written directly in the saving thread;
+            the first thread writes the main file, and the additional saving sinks are distributed among the rest (so more than ``1+len(sinks)`` threads have no effect)
+        max_inflight_chunks (int): maximal number of chunks passed to the writer threads but not yet written; by default, 4
+        raw_preallocate (bool): if ``True`` (default), preallocate raw files space when the final size is known (from batch size or file split size)
+        raw_drop_cache (bool): if ``True``, advise the OS to drop the written raw data from the page cache (where supported); by default, ``False``
+        raw_block_size (int): size of coalesced raw write blocks in bytes; by default, 16 Mb
+        stripe_folders: list of folders (usually on different drives) to spread the ``"raw"`` format data across (see :class:`.framefiles.StripedFrameWriter`);
+            by default, ``None`` (no striping, the data is written into a single file)
+        stripe_size (int): size of a single stripe unit in bytes (rounded down to whole frames); by default, 8 Mb
+        hdf5_chunk_frames (int): number of frames per HDF5 dataset chunk; by default (``None``), chosen to make chunks about 2 Mb large
+        hdf5_compression (str): HDF5 chunk compression filter (e.g., ``"gzip"`` or ``"lzf"``); by default, no compression
+        hdf5_compression_opts: additional HDF5 compression options (e.g., compression level for ``"gzip"``)
+        compression_codec (str): codec used for ``"compressed"`` format (see :func:`.framefiles.compress_block`); by default, ``"zlib"``
+        compression_level (int): compression level for ``"compressed"`` format; by default, 1
+        compression_shuffle (str): data shuffling for ``"compressed"`` format (``"none"``, ``"byte"``, or ``"bit"``); by default, ``"byte"``
+        compression_threads (int): number of compression threads for ``"compressed"`` format; by default, 2
+        frame_info_format (str): frame info file format; can be ``"text"`` (default; tab-separated text table) or ``"binary"`` (fixed-size binary records, see :class:`.framefiles.FrameInfoWriter`)
+        journal_period (float): period of the saving journal updates in seconds (see :func:`recover_recording`); by default, 1 second; 0 disables the journal
+        overload_policy (str): policy applied when the saving queue RAM fills up (see :meth:`setup_overload`); by default, ``"drop"`` (drop the whole messages which do not fit)
+        overload_threshold (float): queue RAM fill fraction at which the overload policy is engaged; by default, 0.75
+        overload_recover (float): queue RAM fill fraction at which the overload policy is released; by default, 0.5
+        overload_decimation (int): with ``"decimate"`` policy, every `overload_decimation`-th frame (based on frame index) is dropped; by default, 2
+        overload_roi: with ``"roi"`` policy, tuple ``(hstart, hend, vstart, vend)`` with the saved frame region; by default, ``None``
+        overload_compression_level (int): with ``"compress"`` policy, compression level used during the overload; by default, 1
+        checksum_algorithm (str): checksum algorithm for the integrity manifest (see :meth:`setup_checksums`); by default, ``None`` (no checksums)
+        checksum_block_size (int): size of the checksummed blocks for the files checksummed after saving; by default, 16 Mb
+        checksum_max_inflight (int): maximal number of written chunks queued for the checksum calculation; by default, 8
+        save_rois: list of regions ``(hstart, hend, vstart, vend)`` saved from each frame (see :meth:`setup_preprocessing`); by default, ``None`` (full frame)
+        save_binning: tuple ``(xbin, ybin)`` with the save-only spatial binning factors; by default, ``(1, 1)`` (no binning)
+        save_bin_mode (str): save-only spatial binning mode (``"skip"``, ``"sum"``, ``"min"``, ``"max"``, or ``"mean"``); by default, ``"mean"``
+        save_decimation (int): save-only temporal decimation: only frames with indices divisible by `save_decimation` are saved; by default, 1 (no decimation)
+        save_pack_bits (int): if 12, pack integer frames into 12-bit values for the raw formats (see :func:`.framefiles.pack_12bit`); by default, ``None`` (no packing)
 
     Variables:
         path: saving path
@@ -353,8 +1109,20 @@ class FrameSaveThread(controller.QTaskThread):
         saved: total frames saved since the saving started
         missed: total number of frames missed in saving since the saving stated (based on frames indices)
         pretrigger_status: tuple with the pretrigger status (see :meth:`PretriggerBuffer.get_status`), or ``None`` if pretrigger is disabled
+        events: number of events triggered since the saving started (in the event capture mode)
+        benchmark: result of the last disk benchmark (see :meth:`benchmark_disk`), or ``None`` if it has not been performed
         queue_ram: current occupied queue RAM size
+        queue_ram_peak: maximal occupied queue RAM size since the saving started
         max_queue_ram: maximal queue RAM size
+        write_stats: write timing statistics since the saving started (see :meth:`WriteStatistics.get_summary`) with branches ``"frames"``, ``"frame_info"``, ``"event_log"``, and ``"sinks"``;
+            updated about once per second
+        inflight: number of chunks currently being written by the background writer threads
+        overload: currently engaged overload policy, or ``None`` if the saving is not overloaded
+        overload_dropped: number of frames dropped by the overload policy since the saving started (not counted in ``missed``)
+        sinks: dictionary with statuses of the additional saving sinks (see :meth:`FrameSink.get_status`) used in the current or the last saving
+        checksums: checksum status of the current or the last saving (see :meth:`ChecksumCollector.get_status`), or ``None`` if checksums are disabled
+        checksum_verify: result of the last :meth:`verify_checksums` call: dictionary with the status (``"running"``, ``"ok"``, ``"failed"``, or ``"error"``),
+            number of checked bytes and files, verification time, and the list of failed files with their statuses; ``None`` if no verification has been performed
         status_line_check: status line check status; can be ``"off"`` (check is off), ``"none"`` (frames don't have status line), ``"na"`` (no frames have been received yet),
             ``"ok"`` (status line check is ok), ``"missing"`` (missing frames), ``"still"`` (repeating frames), or ``"out_of_order"`` (later frames have lower index).
 
@@ -363,7 +1131,18 @@ class FrameSaveThread(controller.QTaskThread):
         save_stop: stop streaming
         setup_pretrigger: setup pretrigger buffer
         clear_pretrigger: clear pretrigger buffer
+        trigger_event: trigger an event in the event capture mode
+        benchmark_disk: benchmark the disk writing speed at the saving destination
         setup_queue_ram: setup maximal saving queue RAM
+        setup_overload: setup saving queue overload policy
+        setup_sink: add or change an additional saving sink
+        remove_sink: remove an additional saving sink
+        setup_preprocessing: setup save-only frame preprocessing
+        setup_checksums: setup integrity manifest checksums
+        verify_checksums: verify the saved files using the integrity manifest
+
+    Multicasts:
+        saving/overload: sent with ``"pause"`` or ``"resume"`` value when the camera should be paused or resumed with ``"pause"`` overload policy
     """
     def setup_task(self, src, tag, settings_mgr=None, frame_processor=None, garbage_collector=None):
         self.subscribe_commsync(self.receive_frames,srcs=src,tags=tag,limit_queue=100)
@@ -373,6 +1152,7 @@ class FrameSaveThread(controller.QTaskThread):
         self._save_queue=None
         self.garbage_collector=garbage_collector
         self._pretrigger_buffer=None
+        self._pretrigger_spill_params=None
         self._clear_pretrigger_on_write=True
         self._saving=False
         self._stopping=False
@@ -385,6 +1165,19 @@ class FrameSaveThread(controller.QTaskThread):
         self.v["scheduled"]=0
         self.v["missed"]=0
         self.v["pretrigger_status"]=None
+        self._event_capture=None
+        self._event_buffer=None
+        self._event_post_remaining=0
+        self._event_stop_after=False
+        self._event_idle=0
+        self._event_run_start=0
+        self._event_last_index=None
+        self._events_pending=[]
+        self.v["events"]=0
+        self._recv_frame_desc=None
+        self._recv_rate_window=[None,0]
+        self._recv_rate=None
+        self.v["benchmark"]=None
         self.append=False
         self.filesplit=None
         self.format="raw"
@@ -394,6 +1187,46 @@ class FrameSaveThread(controller.QTaskThread):
         self.single_shot=False
         self.chunk_period=0.2
         self.dumping_period=0.02
+        self.adaptive_chunking=True
+        self.chunk_target_size=2**23
+        self.chunk_max_size=2**27
+        self.overload_policy="drop"
+        self.overload_threshold=0.75
+        self.overload_recover=0.5
+        self.overload_decimation=2
+        self.overload_roi=None
+        self.overload_compression_level=1
+        self._overload_policy=None
+        self._overload_range=None
+        self._overflow_range=None
+        self.v["overload"]=None
+        self.v["overload_dropped"]=0
+        self._sinks={}
+        self._active_sinks=[]
+        self.v["sinks"]={}
+        self.save_rois=None
+        self.save_binning=(1,1)
+        self.save_bin_mode="mean"
+        self.save_decimation=1
+        self.save_pack_bits=None
+        self._preprocess=None
+        self._preprocess_skipped=0
+        self._preprocess_shape=None
+        self.checksum_algorithm=None
+        self.checksum_block_size=2**24
+        self.checksum_max_inflight=8
+        self._checksums=None
+        self._finishing_checksums=[]
+        self._checksum_verify=None
+        self._benchmark=None
+        self.v["checksums"]=None
+        self.v["checksum_verify"]=None
+        self.writer_threads=0
+        self.max_inflight_chunks=4
+        self._writer_pool=None
+        self._dumped=0
+        self._write_failed=False
+        self.v["inflight"]=0
         self._event_log_started=False
         self._start_time=None
         self._first_frame_recvd=None
@@ -404,9 +1237,41 @@ class FrameSaveThread(controller.QTaskThread):
         self._last_frame_sid=None
         self._last_frame=None
         self._last_chunk_start=0
+        self._last_chunk_size=0
         self._tiff_writer=None
+        self._raw_writer=None
+        self._mmap_writer=None
+        self._index_writer=None
+        self.raw_preallocate=True
+        self.raw_drop_cache=False
+        self.raw_block_size=2**24
+        self.stripe_folders=None
+        self.stripe_size=2**23
+        self._hdf5_writer=None
+        self._save_settings=False
+        self.hdf5_chunk_frames=None
+        self.hdf5_compression=None
+        self.hdf5_compression_opts=None
+        self.compression_codec="zlib"
+        self.compression_level=1
+        self.compression_shuffle="byte"
+        self.compression_threads=2
+        self._compression_stats=[0,0]
+        self.frame_info_format="text"
+        self._frame_info_writer=None
+        self.journal_period=1.
+        self._journal=None
+        self._journal_updated=0
+        self._journal_last=None
+        self._raw_flushed=0
         self.v["max_queue_ram"]=2**30*4
+        self._queue_ram_peak=0
+        self.v["queue_ram_peak"]=0
         self._update_queue_ram(0)
+        self._write_stats=WriteStatistics()
+        self._write_stats_period=1.
+        self._write_stats_updated=0
+        self.v["write_stats"]={}
         self.v["status_line_check"]="off"
         self._last_frame_statusline_idx=None
         self._perform_status_check=False
@@ -417,13 +1282,21 @@ class FrameSaveThread(controller.QTaskThread):
         self.add_command("save_stop",self.save_stop)
         self.add_command("setup_queue_ram",self.setup_queue_ram)
         self.add_command("setup_streaming",self.setup_streaming)
+        self.add_command("setup_overload",self.setup_overload)
+        self.add_command("setup_sink",self.setup_sink)
+        self.add_command("remove_sink",self.remove_sink)
+        self.add_command("setup_preprocessing",self.setup_preprocessing)
+        self.add_command("setup_checksums",self.setup_checksums)
+        self.add_command("verify_checksums",self.verify_checksums)
         self.add_command("write_event_log",self.write_event_log)
         self.add_command("setup_pretrigger",self.setup_pretrigger)
         self.add_command("clear_pretrigger",self.clear_pretrigger)
+        self.add_command("trigger_event",self.trigger_event)
+        self.add_command("benchmark_disk",self.benchmark_disk)
         self.add_job("dump_queue",self.dump_queue,self.dumping_period)
         
     
-    def setup_pretrigger(self, size, enabled=True, preserve_frames=True, clear_on_write=True):
+    def setup_pretrigger(self, size, enabled=True, preserve_frames=True, clear_on_write=True, spill_folder=None, ram_size=None):
         """
         Setup pretrigger.
 
@@ -434,15 +1307,28 @@ class FrameSaveThread(controller.QTaskThread):
             clear_on_write (bool): if ``True``, the buffer freames are removed from it when they are saved (default behavior); otherwise, the buffer state is preserved
                 keep in mind that it's not updated during save (so there will be a gap for newly-added frames);
                 generally, only makes sense to set ``clear_on_write=False`` for single-frame buffers
+            spill_folder (str): if not ``None`` and `ram_size` is smaller than `size`, the older frames are moved into a ring file in this folder
+                (see :class:`SpillingPretriggerBuffer`)
+            ram_size (int): maximal number of pretrigger frames kept in RAM (only used if `spill_folder` is specified)
         """
         if enabled:
-            if not (self._pretrigger_buffer and self._pretrigger_buffer.size==size):
-                curr_buffer=self._pretrigger_buffer
-                self._pretrigger_buffer=PretriggerBuffer(size)
-                if curr_buffer and preserve_frames:
-                    while curr_buffer.has_frames():
-                        self._pretrigger_buffer.add_frame_message(curr_buffer.pop_frame_message())
+            spilling=spill_folder is not None and ram_size is not None and ram_size<size
+            spill_params=(ram_size,spill_folder) if spilling else None
+            curr_buffer=self._pretrigger_buffer
+            if not (curr_buffer and curr_buffer.size==size and self._pretrigger_spill_params==spill_params):
+                if spilling:
+                    self._pretrigger_buffer=SpillingPretriggerBuffer(size,ram_size,spill_folder)
+                else:
+                    self._pretrigger_buffer=PretriggerBuffer(size)
+                self._pretrigger_spill_params=spill_params
+                if curr_buffer:
+                    if preserve_frames:
+                        while curr_buffer.has_frames():
+                            self._pretrigger_buffer.add_frame_message(curr_buffer.pop_frame_message())
+                    curr_buffer.close()
         else:
+            if self._pretrigger_buffer:
+                self._pretrigger_buffer.close()
             self._pretrigger_buffer=None
         self._clear_pretrigger_on_write=clear_on_write
         self.v["pretrigger_status"]=self._pretrigger_buffer.get_status() if self._pretrigger_buffer else None
@@ -461,52 +1347,479 @@ class FrameSaveThread(controller.QTaskThread):
                 garbage_collector.setup(enabled=enabled)
             except controller.threadprop.NoControllerThreadError:
                 pass
-    def setup_streaming(self, single_shot=None):
+    def setup_streaming(self, single_shot=None, writer_threads=None, max_inflight_chunks=None, raw_preallocate=None, raw_drop_cache=None,
+            hdf5_chunk_frames=None, hdf5_compression=None, hdf5_compression_opts=None,
+            compression_codec=None, compression_level=None, compression_shuffle=None, compression_threads=None, frame_info_format=None,
+            adaptive_chunking=None, chunk_period=None, chunk_target_size=None, chunk_max_size=None, stripe_folders=None, stripe_size=None, journal_period=None):
+        """
+        Setup streaming parameters.
+
+        Args:
+            single_shot (bool): if ``True``, only write the data to the disk after the saving is stopped
+            writer_threads (int): number of background writer threads; 0 means that the data is written directly in the saving thread
+            max_inflight_chunks (int): maximal number of chunks passed to the writer threads but not yet written
+            raw_preallocate (bool): if ``True``, preallocate raw files space when the final size is known
+                (using ``posix_fallocate`` on POSIX systems, and by extending the file on Windows)
+            raw_drop_cache (bool): if ``True``, advise the OS to drop the written raw data from the page cache (only on POSIX systems; ignored on Windows)
+            hdf5_chunk_frames (int): number of frames per HDF5 dataset chunk; 0 means that it is chosen automatically
+            hdf5_compression (str): HDF5 chunk compression filter (e.g., ``"gzip"`` or ``"lzf"``); ``"none"`` means no compression
+            hdf5_compression_opts: additional HDF5 compression options (e.g., compression level for ``"gzip"``)
+            compression_codec (str): codec used for ``"compressed"`` format
+            compression_level (int): compression level for ``"compressed"`` format
+            compression_shuffle (str): data shuffling for ``"compressed"`` format
+            compression_threads (int): number of compression threads for ``"compressed"`` format
+            frame_info_format (str): frame info file format; can be ``"text"`` or ``"binary"``
+            adaptive_chunking (bool): if ``True``, adapt the write size to the saving queue state
+            chunk_period (float): duration of a single saving queue chunk (maximal queue latency with adaptive chunking)
+            chunk_target_size (int): target size of a single write in bytes with adaptive chunking
+            chunk_max_size (int): maximal size of a single merged write in bytes with adaptive chunking
+            stripe_folders: list of folders to spread the ``"raw"`` format data across; empty list means no striping
+            stripe_size (int): size of a single stripe unit in bytes
+            journal_period (float): period of the saving journal updates in seconds; 0 disables the journal
+        
+        Writer parameters are applied on the next saving start.
+        """
         if single_shot is not None:
             self.single_shot=single_shot
             if self._saving and not self._stopping:
                 self._enable_garbage_collect(not single_shot)
+        if writer_threads is not None:
+            self.writer_threads=writer_threads
+        if max_inflight_chunks is not None:
+            self.max_inflight_chunks=max_inflight_chunks
+        if raw_preallocate is not None:
+            self.raw_preallocate=raw_preallocate
+        if raw_drop_cache is not None:
+            self.raw_drop_cache=raw_drop_cache
+        if hdf5_chunk_frames is not None:
+            self.hdf5_chunk_frames=hdf5_chunk_frames or None
+        if hdf5_compression is not None:
+            self.hdf5_compression=None if hdf5_compression=="none" else hdf5_compression
+        if hdf5_compression_opts is not None:
+            self.hdf5_compression_opts=hdf5_compression_opts
+        if compression_codec is not None:
+            self.compression_codec=compression_codec
+        if compression_level is not None:
+            self.compression_level=compression_level
+        if compression_shuffle is not None:
+            funcargparse.check_parameter_range(compression_shuffle,"compression_shuffle",["none","byte","bit"])
+            self.compression_shuffle=compression_shuffle
+        if compression_threads is not None:
+            self.compression_threads=compression_threads
+        if frame_info_format is not None:
+            funcargparse.check_parameter_range(frame_info_format,"frame_info_format",["text","binary"])
+            self.frame_info_format=frame_info_format
+        if adaptive_chunking is not None:
+            self.adaptive_chunking=adaptive_chunking
+        if chunk_period is not None:
+            self.chunk_period=chunk_period
+        if chunk_target_size is not None:
+            self.chunk_target_size=max(chunk_target_size,1)
+        if chunk_max_size is not None:
+            self.chunk_max_size=max(chunk_max_size,1)
+        if stripe_folders is not None:
+            self.stripe_folders=list(stripe_folders) or None
+        if stripe_size is not None:
+            self.stripe_size=max(stripe_size,1)
+        if journal_period is not None:
+            self.journal_period=journal_period
+    def setup_overload(self, policy=None, threshold=None, recover=None, decimation=None, roi=None, compression_level=None):
+        """
+        Setup the policy applied when the saving queue RAM fills up.
+
+        Args:
+            policy (str): overload policy; can be ``"drop"`` (drop the whole messages which do not fit into the queue),
+                ``"decimate"`` (drop every `decimation`-th frame), ``"compress"`` (use faster compression for ``"compressed"`` format),
+                ``"roi"`` (only save the given region of the frame for ``"cam"``, ``"tiff"``, or ``"bigtiff"`` formats),
+                or ``"pause"`` (pause the camera acquisition until the queue is emptied)
+            threshold (float): queue RAM fill fraction at which the policy is engaged
+            recover (float): queue RAM fill fraction at which the policy is released
+            decimation (int): decimation factor for ``"decimate"`` policy
+            roi: tuple ``(hstart, hend, vstart, vend)`` with the saved frame region for ``"roi"`` policy
+            compression_level (int): compression level for ``"compress"`` policy
+
+        If the policy is not applicable to the current saving format, ``"decimate"`` is used instead.
+        Frames which do not fit into the queue are dropped regardless of the policy.
+        The engaged and released policies and the affected frame ranges are recorded in the event log.
+        Parameters are applied on the next saving start.
+        """
+        if policy is not None:
+            funcargparse.check_parameter_range(policy,"policy",["drop","decimate","compress","roi","pause"])
+            self.overload_policy=policy
+        if threshold is not None:
+            self.overload_threshold=threshold
+        if recover is not None:
+            self.overload_recover=recover
+        if decimation is not None:
+            self.overload_decimation=max(int(decimation),2)
+        if roi is not None:
+            self.overload_roi=tuple(roi) if roi else None
+        if compression_level is not None:
+            self.overload_compression_level=compression_level
+    def setup_sink(self, name, path=None, format="tiff", decimation=1, roi=None, max_rate=None):
+        """
+        Add or change an additional saving sink.
+
+        The sink is written from the same saving queue as the main destination, but applies its own frame selection
+        and writes the frames in its own format (see :class:`FrameSink` for the description of the parameters).
+        Sinks are applied on the next saving start.
+        """
+        self._sinks[name]=FrameSink(name,path=path,format=format,decimation=decimation,roi=roi,max_rate=max_rate)
+    def remove_sink(self, name):
+        """Remove an additional saving sink (applied on the next saving start)"""
+        self._sinks.pop(name,None)
+    def _finish_sinks(self):
+        """Finish saving into the additional saving sinks"""
+        main_path=file_utils.normalize_path(self._make_path())
+        for sink in self._active_sinks:
+            sink.finish(extra_settings={"main_path":main_path})
+    def setup_preprocessing(self, rois=None, binning=None, bin_mode=None, decimation=None, pack_bits=None):
+        """
+        Setup save-only frame preprocessing.
+
+        Args:
+            rois: list of regions ``(hstart, hend, vstart, vend)`` saved from each frame; several regions are placed side by side
+                (aligned to the top and zero-padded to the same height); empty list means the full frame
+            binning: spatial binning factor; can be a single integer or a tuple ``(xbin, ybin)``; 1 means no binning
+            bin_mode (str): spatial binning mode; can be ``"skip"``, ``"sum"``, ``"min"``, ``"max"``, or ``"mean"``;
+                ``"sum"`` produces frames of a wider integer type, and ``"mean"`` produces floating point frames (so the averages are not rounded);
+                the latter are not affected by `pack_bits`
+            decimation (int): temporal decimation factor: only frames with indices divisible by `decimation` are saved; 1 means no decimation
+            pack_bits (int): if 12, pack integer frames into 12-bit values (two pixels in three bytes, see :func:`.framefiles.pack_12bit`);
+                only applies to ``"raw"``, ``"raw_mmap"``, and ``"compressed"`` formats; 0 means no packing
+
+        The preprocessing is applied to the whole chunks right before writing in the order decimation, ROIs, binning (applied to each ROI separately), and packing.
+        It only affects the main saving destination (additional sinks receive the original frames) and is recorded in the ``"preprocess"`` branch of the saved settings.
+        Parameters are applied on the next saving start.
+        """
+        if rois is not None:
+            self.save_rois=[tuple(r) for r in rois] or None
+        if binning is not None:
+            binning=(binning,binning) if np.ndim(binning)==0 else tuple(binning)
+            self.save_binning=(max(int(binning[0]),1),max(int(binning[1]),1))
+        if bin_mode is not None:
+            funcargparse.check_parameter_range(bin_mode,"bin_mode",["skip","sum","min","max","mean"])
+            self.save_bin_mode=bin_mode
+        if decimation is not None:
+            self.save_decimation=max(int(decimation),1)
+        if pack_bits is not None:
+            funcargparse.check_parameter_range(pack_bits,"pack_bits",[0,12])
+            self.save_pack_bits=pack_bits or None
+    def _get_preprocess(self):
+        """Get the preprocessing parameters applicable to the current saving format, or ``None`` if there is no preprocessing"""
+        preprocess={"rois":self.save_rois,"binning":self.save_binning,"bin_mode":self.save_bin_mode,"decimation":self.save_decimation,
+            "pack_bits":self.save_pack_bits if self.format in ["raw","raw_mmap","compressed"] else None}
+        if preprocess["rois"] or preprocess["binning"]!=(1,1) or preprocess["decimation"]>1 or preprocess["pack_bits"]:
+            return preprocess
+        return None
+    def _preprocess_frames(self, frames):
+        """Apply the save-only ROIs, binning and packing to a chunk of frames"""
+        pp=self._preprocess
+        parts=[frames[:,v0:v1,h0:h1] for h0,h1,v0,v1 in pp["rois"]] if pp["rois"] else [frames]
+        xbin,ybin=pp["binning"]
+        if (xbin,ybin)!=(1,1):
+            binned=[]
+            for p in parts:
+                if ybin>1:
+                    p=filters.decimate(p,ybin,dec=pp["bin_mode"],axis=1)
+                if xbin>1:
+                    p=filters.decimate(p,xbin,dec=pp["bin_mode"],axis=2)
+                binned.append(p if pp["bin_mode"] in ["sum","mean"] else p.astype(frames.dtype,copy=False)) # keep the wider sum type and the fractional part of the averages
+            parts=binned
+        if len(parts)>1:
+            height=max([p.shape[1] for p in parts])
+            width=sum([p.shape[2] for p in parts])
+            result=np.zeros((len(frames),height,width)+frames.shape[3:],dtype=np.result_type(*parts))
+            x=0
+            for p in parts:
+                result[:,:p.shape[1],x:x+p.shape[2]]=p
+                x+=p.shape[2]
+        else:
+            result=parts[0]
+        if result.ndim==3:
+            self._preprocess_shape=result.shape[1:]
+        if pp["pack_bits"]==12 and result.dtype.kind in "ui" and result.ndim==3:
+            return framefiles.pack_12bit(result)
+        return np.ascontiguousarray(result)
+    def _preprocess_message(self, msg):
+        """
+        Apply the save-only preprocessing to the message.
+
+        Return a new message containing preprocessed frame chunks (the original message is unchanged), or ``None`` if all of the frames are dropped.
+        """
+        if msg.chunks:
+            frames,indices,frame_info=msg.frames,msg.indices,msg.frame_info
+        else:
+            frames=[f[None] for f in msg.frames]
+            indices=[np.array([i]) for i in msg.indices]
+            frame_info=msg.frame_info
+            if frame_info is not None:
+                frame_info=None if any(r is None for r in frame_info) else [np.asarray(r)[None] for r in frame_info]
+        k=self._preprocess["decimation"]
+        if k>1:
+            keep=[np.asarray(idx)%k==0 for idx in indices]
+            nframes=sum([len(f) for f in frames])
+            frames=[f[m] for f,m in zip(frames,keep)]
+            indices=[idx[m] for idx,m in zip(indices,keep)]
+            if frame_info is not None:
+                frame_info=[inf[m] for inf,m in zip(frame_info,keep)]
+            nonempty=[i for i,f in enumerate(frames) if len(f)]
+            self._preprocess_skipped+=nframes-sum([len(frames[i]) for i in nonempty])
+            if not nonempty:
+                return None
+            frames=[frames[i] for i in nonempty]
+            indices=[indices[i] for i in nonempty]
+            if frame_info is not None:
+                frame_info=[frame_info[i] for i in nonempty]
+        frames=[self._preprocess_frames(f) for f in frames]
+        pmsg=msg.copy(frames=frames,indices=indices,frame_info=frame_info,chunks=True)
+        pmsg.metainfo.pop("status_line",None)
+        return pmsg
+    def setup_checksums(self, algorithm=None, block_size=None, max_inflight=None):
+        """
+        Setup integrity manifest checksums.
+
+        Args:
+            algorithm (str): checksum algorithm (``"crc32"``, or ``"xxh64"`` and ``"xxh3_64"`` if ``xxhash`` package is installed); ``"none"`` disables the checksums
+            block_size (int): size of the checksummed blocks for the files checksummed after saving
+            max_inflight (int): maximal number of written chunks queued for the checksum calculation
+
+        If enabled, the checksums of the written data are calculated in a background thread, and an integrity manifest
+        (suffix ``"_checksums"``) listing the checksums of all saved files is written next to the settings file after the saving is done
+        (see :class:`ChecksumCollector`). Parameters are applied on the next saving start.
+        """
+        if algorithm is not None:
+            if algorithm=="none":
+                algorithm=None
+            elif algorithm not in framefiles.get_checksum_algorithms():
+                raise ValueError("checksum algorithm {} is not available".format(algorithm))
+            self.checksum_algorithm=algorithm
+        if block_size is not None:
+            self.checksum_block_size=max(int(block_size),1)
+        if max_inflight is not None:
+            self.checksum_max_inflight=max(int(max_inflight),1)
+    def _get_checksums_path(self):
+        """Generate save path for the integrity manifest"""
+        return self._make_path(subpath="checksums",ext="json")
+    def _get_checksum_files(self):
+        """Get the list of all saved files to be included into the integrity manifest"""
+        if self.filesplit is None or self.format=="hdf5":
+            paths=[self._make_path()]
+        else:
+            paths=[self._make_path(idx=i) for i in range(self._file_idx+1)]
+        if self.format=="raw" and self.stripe_folders:
+            manifests=[self._make_path(subpath="stripes",idx=i if self.filesplit else None,ext="json") for i in range(self._file_idx+1 if self.filesplit else 1)]
+            paths=[p for p in manifests if os.path.exists(p)]
+            for p in list(paths):
+                paths+=framefiles.load_stripes_manifest(p)["stripes"]
+        if self.format=="raw_mmap":
+            paths.append(self._get_index_path())
+        paths+=[self._get_frame_info_path(),self._get_background_path(),self._get_event_index_path(),self._get_event_log_path()]
+        return [p for p in paths if os.path.exists(p)]
+    def _finish_checksums(self):
+        """Start writing the integrity manifest"""
+        if self._checksums is not None and self._checksums.manifest_path is None:
+            self._checksums.finish(self._get_checksums_path(),self._get_checksum_files())
+            self.v["checksums"]=self._checksums.get_status()
+    def verify_checksums(self, path=None, nthreads=4):
+        """
+        Verify the saved files using the integrity manifest at the given path (by default, the manifest of the current or the last saving).
+
+        The verification runs in the background using `nthreads` threads (see :func:`.framefiles.verify_checksum_manifest`); its result is stored in the ``"checksum_verify"`` variable.
+        """
+        if self._checksum_verify is not None:
+            return
+        if path is None:
+            if self.v["path"] is None:
+                return
+            path=self._get_checksums_path()
+        self.v["checksum_verify"]={"status":"running","path":file_utils.normalize_path(path)}
+        executor=concurrent.futures.ThreadPoolExecutor(1)
+        self._checksum_verify=(path,executor.submit(framefiles.verify_checksum_manifest,path,nthreads))
+        executor.shutdown(wait=False)
+    def _update_checksums(self):
+        """Publish the checksum calculation and verification statuses"""
+        if self._checksums is not None:
+            status=self._checksums.get_status()
+            if status!=self.v["checksums"]:
+                self.v["checksums"]=status
+        if self._checksum_verify is not None and self._checksum_verify[1].done():
+            (path,future),self._checksum_verify=self._checksum_verify,None
+            result={"path":file_utils.normalize_path(path)}
+            try:
+                res=future.result()
+                failed=["{}: {}".format(name,f["status"]) for name,f in res["files"].items() if f["status"]!="ok"]
+                result.update({"status":"ok" if res["ok"] else "failed","nfiles":len(res["files"]),"nbytes":res["nbytes"],"time":res["time"],"failed":failed})
+            except (OSError,ValueError,KeyError) as err:
+                result.update({"status":"error","error":str(err)})
+            self.v["checksum_verify"]=result
+    def _setup_writer_pool(self):
+        """Create, remove, or recreate the writer pool according to the current parameters"""
+        pool=self._writer_pool
+        if pool is not None and (pool.nthreads==self.writer_threads and pool.max_inflight==self.max_inflight_chunks):
+            return
+        if pool is not None:
+            pool.close()
+        self._writer_pool=FrameWriterPool(self.writer_threads,self.max_inflight_chunks) if self.writer_threads>0 else None
+    def finalize_task(self):
+        if self._writer_pool is not None:
+            self._writer_pool.close()
+            self._writer_pool=None
+        if self._pretrigger_buffer is not None:
+            self._pretrigger_buffer.close()
+        for checksums in self._finishing_checksums+[self._checksums]:
+            if checksums is not None:
+                checksums.wait()
+        super().finalize_task()
 
     def _update_queue_ram(self, queue_ram=None):
         if queue_ram is not None:
             self.v["queue_ram"]=queue_ram
+            if queue_ram>self._queue_ram_peak:
+                self._queue_ram_peak=self.v["queue_ram_peak"]=queue_ram
         # self._frame_scheduler.change_max_size((self._frame_scheduler.max_size[0],self.v["max_queue_ram"]-self.v["queue_ram"]))
+    def _write_chunk(self, frames, messages, append, nsaved, level=None):
+        """
+        Write a chunk of frames and the corresponding frame info into the main file.
+
+        `nsaved` is the number of frames saved before this chunk, and `level` is the compression level for ``"compressed"`` format (see :meth:`_write_frames`).
+        """
+        indices=[i for msg in messages for i in msg.indices] if self.format=="raw_mmap" else None
+        t0=time.perf_counter()
+        self._write_frames(frames,append=append,nsaved=nsaved,indices=indices,level=level)
+        t1=time.perf_counter()
+        self._write_stats.add("frames",t1-t0,sum([f.nbytes for f in frames]))
+        self._write_chunk_info(messages,append,nsaved)
+        self._write_stats.add("frame_info",time.perf_counter()-t1)
+        last_frame_index=next((int(msg.last_frame_index()) for msg in messages[::-1] if msg.nframes()),None)
+        self._update_journal(nsaved+sum([(1 if f.ndim==2 else len(f)) for f in frames]),last_frame_index)
+    def _write_sinks_chunk(self, sinks, messages):
+        """Write a chunk of messages into the given additional sinks"""
+        t0=time.perf_counter()
+        for sink in sinks:
+            sink.write(messages)
+        self._write_stats.add("sinks",time.perf_counter()-t0)
+    def _submit_sinks_chunk(self, messages):
+        """
+        Submit a chunk of messages to the additional sinks.
+
+        With several writer threads, the first one writes the main file, and the sinks are distributed among the rest, so they are written in parallel with the main file.
+        """
+        pool=self._writer_pool
+        nlanes=pool.nthreads-1
+        if nlanes<=0:
+            pool.submit(self._write_sinks_chunk,(self._active_sinks,messages),force=True)
+            return
+        for lane in range(min(nlanes,len(self._active_sinks))):
+            pool.submit(self._write_sinks_chunk,(self._active_sinks[lane::nlanes],messages),lane=lane+1,force=True)
+    def _write_chunk_info(self, messages, append, nsaved):
+        """Write frame info of a chunk of frames; `nsaved` is the number of frames saved before this chunk"""
+        if self.format=="hdf5":
+            self._write_frame_info_hdf5(messages,nsaved=nsaved)
+        elif self.frame_info_format=="binary":
+            self._write_frame_info_binary(messages,append=append,nsaved=nsaved)
+        else:
+            self._write_frame_info(messages,self._get_frame_info_path(),append=append,nsaved=nsaved)
+    def _update_write_stats(self, force=False):
+        """Publish the write statistics and the sinks statuses (at most once per :attr:`_write_stats_period`, unless ``force==True``)"""
+        t=time.time()
+        if force or t>self._write_stats_updated+self._write_stats_period:
+            self.v["write_stats"]=self._write_stats.get_summary()
+            self.v["sinks"]={sink.name:sink.get_status() for sink in self._active_sinks}
+            self._write_stats_updated=t
+    def _on_write_error(self, err):
+        """Process an error raised on writing a chunk"""
+        if isinstance(err,FrameWriteError):
+            self.v["saved"]=err.saved
+            self.signal_error(err.kind)
+        else:
+            self.signal_error("write_os_error",desc=str(err))
+        self.save_stop()
+        self._save_queue.clear()
+        if self._writer_pool is not None:
+            self._writer_pool.cancel_pending()
+        self._write_failed=True
+    def _collect_written(self):
+        """Collect results of the chunks written by the writer threads"""
+        if self._writer_pool is None:
+            return
+        for nframes,_,err in self._writer_pool.pop_results():
+            if self._write_failed or nframes is None: # sink jobs handle their errors internally
+                continue
+            if err is None:
+                self.v["saved"]+=nframes
+            elif isinstance(err,(FrameWriteError,OSError)):
+                self._on_write_error(err)
+            else:
+                raise err
+        self.v["inflight"]=self._writer_pool.ninflight()
+    def _wait_written(self):
+        """Wait until all of the chunks passed to the writer threads are written"""
+        if self._writer_pool is not None:
+            self._writer_pool.wait()
+            self._collect_written()
     def dump_queue(self):
         """Dump one or several chunks from the saving queue to the disk"""
+        self._collect_written()
+        self._update_checksums()
+        self._update_benchmark()
+        if self._saving:
+            self._update_write_stats()
+            if not self._stopping:
+                self._update_overload()
+                self._schedule_raw_flush()
         if self.single_shot and not self._stopping:
             return
         queue_empty=False
-        append=(self.v["saved"]>0) or self.append
+        append=(self._dumped>0) or self.append
         for _ in range(self.chunks_per_save):
-            new_chunk=self._save_queue.pop(0) if self._save_queue else []
+            if self._writer_pool is not None and self._writer_pool.is_full():
+                break
+            if self._chunk_pending():
+                self.sleep(0.02)
+                break
+            new_chunk=self._pop_queue()
             queue_empty=not self._save_queue
             if new_chunk:
                 if self._first_frame_idx is None:
                     self._first_frame_idx=new_chunk[0].first_frame_index()
                     self._first_frame_sid=new_chunk[0].sid
-                chunk_size=sum([msg.nbytes() for msg in new_chunk])
+                chunk_size=sum([self._get_queue_nbytes(msg) for msg in new_chunk])
                 self._update_queue_ram(self.v["queue_ram"]-chunk_size)
                 flat_chunk=[f for m in new_chunk for f in m.frames]
                 if self._perform_status_check:
                     if self.v["status_line_check"] in {"ok","na"} and "status_line" in new_chunk[0].metainfo:
                         self.v["status_line_check"]=self._check_status_line(flat_chunk,status_line=new_chunk[0].metainfo["status_line"],step=new_chunk[0].metainfo["step"])
-                try:
-                    self._write_frames(flat_chunk,append=append)
-                    self._write_frame_info(new_chunk,self._get_frame_info_path(),append=append)
-                except FrameWriteError as err:
-                    self.v["saved"]=err.saved
-                    self.signal_error(err.kind)
-                    self.save_stop()
-                    self._save_queue.clear()
-                    self.queue_empty=True
-                except OSError as err:
-                    self.signal_error("write_os_error",desc=str(err))
-                    self.save_stop()
-                    self._save_queue.clear()
-                    self.queue_empty=True
-                self.v["saved"]+=sum([msg.nframes() for msg in new_chunk])
+                sink_chunk=None
+                if self._preprocess is not None:
+                    sink_chunk=new_chunk
+                    new_chunk=[pmsg for pmsg in [self._preprocess_message(msg) for msg in new_chunk] if pmsg is not None]
+                    flat_chunk=[f for m in new_chunk for f in m.frames]
+                nframes=sum([msg.nframes() for msg in new_chunk])
+                nsaved=self._dumped
+                self._dumped+=nframes
+                level=self._get_compression_level() # determined here, since the overload policy can change while the chunk is waiting in the writer pool
+                if sink_chunk is None:
+                    sink_chunk=new_chunk
+                if self._writer_pool is not None:
+                    self._writer_pool.submit(self._write_chunk,(flat_chunk,new_chunk,append,nsaved,level),tag=nframes)
+                    if self._active_sinks:
+                        self._submit_sinks_chunk(sink_chunk)
+                    self.v["inflight"]=self._writer_pool.ninflight()
+                else:
+                    try:
+                        self._write_chunk(flat_chunk,new_chunk,append,nsaved,level)
+                    except (FrameWriteError,OSError) as err:
+                        self._on_write_error(err)
+                    else:
+                        self.v["saved"]+=nframes
+                    finally:
+                        if self._active_sinks:
+                            self._write_sinks_chunk(self._active_sinks,sink_chunk)
                 append=True
             if queue_empty:
+                if self._stopping and self._writer_pool is not None and self._writer_pool.ninflight():
+                    break
                 if self._stopping:
                     if self.v["status/result"]=="in_progress":
                         self.update_status("result","success",text="Success")
@@ -520,8 +1833,14 @@ class FrameSaveThread(controller.QTaskThread):
     def _finalize_saving(self):
         try:
             self._write_finish()
+            self._finish_journal(remove=self.v["status/result"]!="error")
+            self._finish_events()
+            self._finish_overload()
+            self._finish_sinks()
+            self._update_write_stats(force=True)
             if self._event_log_started:
                 self.write_event_log("Recording stopped")
+            self._finish_checksums()
             self.finalize_settings()
         except OSError as err:
             self.signal_error("write_os_error",desc=str(err))
@@ -566,20 +1885,150 @@ class FrameSaveThread(controller.QTaskThread):
     def _get_settings_path(self):
         """Generate save path for settings file"""
         return self._make_path(subpath="settings",ext="dat")
+    def _get_index_path(self):
+        """Generate save path for binary frame index file"""
+        return self._make_path(subpath="index",ext="bin")
     def _get_frame_info_path(self):
         """Generate save path for frame info table file"""
-        return self._make_path(subpath="frameinfo",ext="dat")
+        return self._make_path(subpath="frameinfo",ext="bin" if self.frame_info_format=="binary" else "dat")
+    def _get_journal_path(self):
+        """Generate save path for the saving journal"""
+        return self._make_path(subpath="journal",ext="jsonl")
+    def _write_journal_record(self, record):
+        """Append a record to the saving journal and flush it to the disk"""
+        self._journal.write(json.dumps(record)+"\n")
+        self._journal.flush()
+    def _start_journal(self):
+        """Start the saving journal (see :func:`recover_recording`)"""
+        if not self.journal_period:
+            return
+        path=self._get_journal_path()
+        self._journal=open(path,"a" if self.append else "w")
+        self._journal_updated=0
+        main_path=os.path.abspath(self.v["path"])
+        self._write_journal_record({"event":"start","time":time.time(),"path":file_utils.normalize_path(main_path),
+            "rel_path":os.path.relpath(main_path,os.path.dirname(os.path.abspath(path))).replace(os.sep,"/"),"path_kind":self.v["path_kind"],
+            "format":self.format,"filesplit":self.filesplit,"append":self.append,"striped":bool(self.format=="raw" and self.stripe_folders),
+            "frame_info_format":"hdf5" if self.format=="hdf5" else self.frame_info_format})
+    def _get_journal_file_state(self):
+        """
+        Get the state of the current data file.
+
+        Return tuple ``(nframes, nbytes, committed, preallocated)`` with the number of frames and bytes written to the current file (``None`` if unknown),
+        the number of frames among them which have already been passed to the OS (the rest are still in the coalesced write blocks, and are lost if the application crashes),
+        and whether the file space beyond the committed data can be preallocated (i.e., contain no actual data).
+        The raw writers are not flushed, since it would break the write blocks coalescing.
+        """
+        frame_nbytes=self._last_frame.nbytes if self._last_frame is not None else 0
+        if self.format in ["raw","compressed"] and self._raw_writer is not None:
+            writer=self._raw_writer
+            if isinstance(writer,framefiles.RawFrameWriter):
+                return writer.tell()//max(frame_nbytes,1),writer.tell(),writer.get_committed_size()//max(frame_nbytes,1),writer.preallocated
+            if isinstance(writer,framefiles.StripedFrameWriter):
+                return writer.tell(),None,writer.get_committed_frames(),self.raw_preallocate and (self.filesplit is not None or self.v["batch_size"] is not None)
+            writer.flush()
+            return writer.nframes,writer.tell(),writer.nframes,False
+        if self.format=="raw_mmap" and self._mmap_writer is not None: # mapped data is already in the OS page cache
+            nbytes=self._mmap_writer.start+self._mmap_writer.nwritten*self._mmap_writer.frame_nbytes
+            return nbytes//self._mmap_writer.frame_nbytes,nbytes,nbytes//self._mmap_writer.frame_nbytes,True
+        if self.format in ["tiff","bigtiff"] and self._tiff_writer is not None:
+            self._tiff_writer.flush()
+            return self._tiff_writer.nframes,self._tiff_writer.tell(),self._tiff_writer.nframes,False
+        if self.format=="hdf5" and self._hdf5_writer is not None:
+            self._hdf5_writer.flush()
+            return None,None,None,False
+        if self.format=="cam": # the file is closed after every chunk, so all of its frames are committed
+            path=self._make_path(idx=self._file_idx if self.filesplit else None)
+            nbytes=os.path.getsize(path) if os.path.exists(path) else 0
+            nframes=nbytes//(frame_nbytes+8) if frame_nbytes else None # each frame is prepended by its shape
+            return nframes,nbytes,nframes,False
+        return 0,0,0,False
+    def _update_journal(self, nsaved, last_frame_index, force=False):
+        """
+        Add a commit record to the saving journal (at most once per :attr:`journal_period`, unless ``force==True``).
+
+        `nsaved` is the total number of saved frames, and `last_frame_index` is the index of the last saved frame.
+        """
+        self._journal_last=(nsaved,last_frame_index)
+        t=time.time()
+        if self._journal is None or not (force or t>self._journal_updated+self.journal_period):
+            return
+        if self._frame_info_writer is not None:
+            self._frame_info_writer.flush()
+        nframes,nbytes,committed,preallocated=self._get_journal_file_state()
+        last_frame=self._last_frame
+        self._write_journal_record({"event":"commit","time":t,"saved":nsaved,"file_idx":self._file_idx if self.filesplit else None,
+            "file_frames":nframes,"file_bytes":nbytes,"file_committed":committed,"preallocated":preallocated,
+            "frame_shape":None if last_frame is None else list(last_frame.shape),"dtype":None if last_frame is None else last_frame.dtype.str,
+            "first_frame_index":None if self._first_frame_idx is None else int(self._first_frame_idx),"last_frame_index":last_frame_index})
+        self._journal_updated=t
+    def _flush_raw_data(self):
+        """Flush the data accumulated in the raw write blocks and record it in the journal (executed in the same thread as the frames writing)"""
+        if isinstance(self._raw_writer,(framefiles.RawFrameWriter,framefiles.StripedFrameWriter)):
+            self._raw_writer.flush()
+            if self._journal_last is not None:
+                self._update_journal(*self._journal_last,force=True)
+    def _schedule_raw_flush(self):
+        """
+        Flush the raw write blocks at least once per :attr:`journal_period` (once per second if the journal is disabled).
+
+        Keeps slow recordings from staying in memory until the write block is filled, where they would be lost on the application crash.
+        """
+        t=time.time()
+        if self.format!="raw" or t<self._raw_flushed+(self.journal_period or 1.):
+            return
+        self._raw_flushed=t
+        if self._writer_pool is not None:
+            self._writer_pool.submit(self._flush_raw_data,tag=0,force=True) # executed after the already submitted chunks
+        else:
+            try:
+                self._flush_raw_data()
+            except OSError as err:
+                self._on_write_error(err)
+    def _finish_journal(self, remove=False):
+        """Finish the saving journal; if ``remove==True``, remove it afterwards (it is not needed once the saving is properly finished)"""
+        if self._journal is not None:
+            path=self._journal.name
+            try:
+                self._write_journal_record({"event":"stop","time":time.time(),"saved":self.v["saved"]})
+            finally:
+                self._journal.close()
+                self._journal=None
+            if remove and os.path.exists(path):
+                os.remove(path)
     def _get_settings(self):
         """Get settings dictionary for the saver thread"""
-        return {"path":file_utils.normalize_path(self.v["path"]),
+        settings={"path":file_utils.normalize_path(self.v["path"]),
                 "path_kind":self.v["path_kind"],
                 "batch_size":self.v["batch_size"],
                 "chunk_size":self.filesplit or self.v["batch_size"],
                 "append":self.append,
                 "format":self.format,
+                "frame_info_format":"hdf5" if self.format=="hdf5" else self.frame_info_format,
                 "background":self.background_desc,
                 "start_timestamp":time.time(),
                 "pretrigger_status/start":self.v["pretrigger_status"]}
+        if self._event_capture is not None:
+            settings["event_capture"]={"pre_frames":self._event_capture[0],"post_frames":self._event_capture[1]}
+        if self.format=="compressed":
+            settings["compression"]={"codec":self.compression_codec,"level":self.compression_level,"shuffle":self.compression_shuffle}
+        if self._active_sinks:
+            settings["sinks"]={sink.name:sink.get_desc() for sink in self._active_sinks}
+        if self.checksum_algorithm is not None:
+            settings["checksums"]={"algorithm":self.checksum_algorithm,"manifest":file_utils.normalize_path(self._get_checksums_path())}
+        if self.format=="raw" and self.stripe_folders:
+            settings["stripes"]={"folders":[file_utils.normalize_path(f) for f in self.stripe_folders],"size":self.stripe_size}
+        if self._preprocess is not None:
+            settings["preprocess"]=dict(self._preprocess)
+        if self.overload_policy!="drop":
+            settings["overload"]={"policy":self._get_overload_policy(),"threshold":self.overload_threshold,"recover":self.overload_recover}
+            if settings["overload"]["policy"]=="decimate":
+                settings["overload/decimation"]=self.overload_decimation
+            elif settings["overload"]["policy"]=="roi":
+                settings["overload/roi"]=self.overload_roi
+            elif settings["overload"]["policy"]=="compress":
+                settings["overload/compression_level"]=self.overload_compression_level
+        return settings
     def _get_finalized_settings(self):
         """Get finalized settings (additional info at the end of saving process)"""
         settings={}
@@ -593,6 +2042,18 @@ class FrameSaveThread(controller.QTaskThread):
         settings["last_frame_session"]=self._last_frame_sid
         settings["stop_timestamp"]=time.time()
         settings["pretrigger_status/stop"]=self.v["pretrigger_status"]
+        settings["queue_ram_peak"]=self._queue_ram_peak
+        settings["write_stats"]=self._write_stats.get_summary()
+        settings["overload_dropped"]=self.v["overload_dropped"]
+        if self._preprocess is not None:
+            settings["preprocess/skipped"]=self._preprocess_skipped
+            settings["preprocess/frame_shape"]=self._preprocess_shape
+        if self._active_sinks:
+            settings["sinks"]={sink.name:sink.get_status() for sink in self._active_sinks}
+        if self._event_capture is not None:
+            settings["events"]=self.v["events"]
+        if self.format=="compressed" and self._compression_stats[1]:
+            settings["compression_ratio"]=self._compression_stats[0]/self._compression_stats[1]
         if self._last_frame is not None:
             settings["frame/shape"]=self._last_frame.shape
             settings["frame/dtype"]=self._last_frame.dtype.str
@@ -614,9 +2075,21 @@ class FrameSaveThread(controller.QTaskThread):
         settings["save"]=self._get_settings()
         if extra_settings is not None:
             settings["extra"]=extra_settings
-        savefile.save_dict(settings,self._get_settings_path())
+        if self.format=="hdf5":
+            self._hdf5_writer.write_settings(dictionary.Dictionary(settings).as_dict(style="flat"))
+        else:
+            savefile.save_dict(settings,self._get_settings_path())
     def finalize_settings(self):
         """Save finalized settings to the file"""
+        if self.format=="hdf5":
+            if self._save_settings:
+                settings=dictionary.Dictionary()
+                settings.update(self._get_finalized_settings(),"save")
+                if self._cam_settings_time!="before":
+                    settings.merge(self._get_manager_settings(include=["cam"]).get("cam",{}),path="cam")
+                settings.merge(self._get_manager_settings(include=["cam/cnt"]).get("cam/cnt",{}),path="cam/cnt_after")
+                framefiles.write_hdf5_settings(self._make_path(),settings.as_dict(style="flat"))
+            return
         path=self._get_settings_path()
         if os.path.exists(path):
             settings=loadfile.load_dict(path)
@@ -643,9 +2116,13 @@ class FrameSaveThread(controller.QTaskThread):
         if background is not None:
             background=np.array(background)
             save_dtype="<f8" if background.dtype.kind=="f" else "<u2"
+            bg_saving_mode="only_bg" if len(background)==1 else "all"
+            if self.format=="hdf5":
+                self.background_desc={"size":len(background),"dtype":save_dtype,"shape":background.shape[1:],"format":"hdf5","bg_params":params,"saving_mode":bg_saving_mode}
+                self._hdf5_writer.write_background(np.asarray(background,save_dtype),dictionary.Dictionary(self.background_desc).as_dict(style="flat"))
+                return
             with open(self._get_background_path(),"wb") as f:
                 np.asarray(background,save_dtype).tofile(f)
-            bg_saving_mode="only_bg" if len(background)==1 else "all"
             self.background_desc={"size":len(background),"dtype":save_dtype,"shape":background.shape[1:],"format":"bin","bg_params":params,"saving_mode":bg_saving_mode}
         else:
             self.background_desc={"saving_mode":"none"}
@@ -667,12 +2144,14 @@ class FrameSaveThread(controller.QTaskThread):
                         file_utils.retry_remove(path)
                 preamble="Timestamp\tElapsed\tIndex\tSaved\tMessage\n"
                 preamble+="{:.3f}\t{:.3f}\t{:d}\t{:d}\t{}\n".format(self._start_time,0,self._first_frame_idx or 0,0,string_utils.escape_string("Recording started",location="parameter"))
+            t0=time.perf_counter()
             with open(path,"a") as f:
                 t=time.time()
                 line="{:.3f}\t{:.3f}\t{:d}\t{:d}\t{}\n".format(t,t-self._start_time,self._last_frame_idx or 0,max(self.v["saved"]-1,0),string_utils.escape_string(msg,location="parameter"))
                 if preamble:
                     f.write(preamble)
                 f.write(line)
+            self._write_stats.add("event_log",time.perf_counter()-t0)
             self._event_log_started=True
             return (t,t-self._start_time,msg)
 
@@ -694,25 +2173,104 @@ class FrameSaveThread(controller.QTaskThread):
                 return res
         return "ok"
 
-    def _write_tiff(self, frames):
+    def _write_tiff(self, frames, nsaved):
+        """Write frames to the current tiff file; `nsaved` is the number of frames saved before this call"""
         try:
-            self._tiff_writer._meta["contiguous"]=False # force to flush after write to check the file size
-        except AttributeError:
-            pass
-        if frames.ndim==3 and len(frames) in [3,4]: # can be confused with color-channel data
-            self._tiff_writer.append_data(frames[:2])
-            self._tiff_writer.append_data(frames[2:])
+            self._tiff_writer.write(frames)
+        except framefiles.TiffSizeExceededError as err:
+            raise FrameWriteError(nsaved+err.written,kind="tiff_size_exceeded")
+    def _get_expected_file_frames(self, nsaved):
+        """Get the path of the current file and the expected number of frames remaining to be written in it (``None`` if unknown)"""
+        if self.filesplit is None:
+            path=self._make_path()
+            nexpected=None if self.v["batch_size"] is None else self.v["batch_size"]-nsaved
         else:
-            self._tiff_writer.append_data(frames)
-    def _write_frames(self, frames, append=True):
-        """Write frames to the given path"""
+            path=self._make_path(idx=self._file_idx)
+            nexpected=self.filesplit-nsaved%self.filesplit
+            if self.v["batch_size"] is not None:
+                nexpected=min(nexpected,self.v["batch_size"]-nsaved)
+        return path,nexpected
+    def _open_raw_writer(self, append, nsaved, frame_shape, save_dtype, level=None):
+        """
+        Open a raw (compressed, or striped) writer for the current file, preallocating the expected raw file size if it is known.
+
+        `level` is the default compression level for ``"compressed"`` format (by default, the current level).
+        """
+        path,nexpected=self._get_expected_file_frames(nsaved)
+        if self.format=="compressed":
+            return framefiles.CompressedFrameWriter(path,frame_shape,save_dtype,append=append,
+                codec=self.compression_codec,level=self._get_compression_level() if level is None else level,shuffle=self.compression_shuffle,nthreads=self.compression_threads)
+        frame_nbytes=np.dtype(save_dtype).itemsize*int(np.prod(frame_shape))
+        if self.stripe_folders:
+            name,ext=os.path.splitext(os.path.basename(path))
+            stripe_paths=[os.path.join(f,"{}_stripe{}{}".format(name,k,ext)) for k,f in enumerate(self.stripe_folders)]
+            manifest_path=self._make_path(subpath="stripes",idx=self._file_idx if self.filesplit else None,ext="json")
+            return framefiles.StripedFrameWriter(manifest_path,stripe_paths,frame_shape,save_dtype,append=append,stripe_frames=max(self.stripe_size//frame_nbytes,1),
+                preallocate=nexpected if self.raw_preallocate else None,block_size=self.raw_block_size,drop_cache=self.raw_drop_cache)
+        preallocate=nexpected*frame_nbytes if (self.raw_preallocate and nexpected) else None
+        return framefiles.RawFrameWriter(path,append=append,preallocate=preallocate,block_size=self.raw_block_size,drop_cache=self.raw_drop_cache)
+    def _close_raw_writer(self):
+        """Close the current raw (or compressed) writer"""
+        writer,self._raw_writer=self._raw_writer,None
+        if isinstance(writer,framefiles.CompressedFrameWriter):
+            self._compression_stats[0]+=writer.raw_nbytes
+            self._compression_stats[1]+=writer.compressed_nbytes
+        writer.close()
+    def _write_frames_mmap(self, frames, indices, append, nsaved, save_dtype):
+        """Write frames into the memory-mapped raw file and add them to the frame index"""
+        for frm,idx in zip(frames,indices):
+            if np.ndim(idx)==0: # single frame
+                frm=frm[None]
+                idx=[idx]
+            frm_size=len(frm)
+            frm_saved=0
+            while frm_saved<frm_size:
+                if self.filesplit is None:
+                    frm_to_save=frm_size-frm_saved
+                else: # file splitting mechanics
+                    lchunk=(-nsaved-1)%self.filesplit+1
+                    frm_to_save=min(lchunk,frm_size-frm_saved)
+                if self._mmap_writer is None:
+                    path,nexpected=self._get_expected_file_frames(nsaved)
+                    self._mmap_writer=framefiles.MemmapFrameWriter(path,frm.shape[1:],save_dtype,append=append,nframes=nexpected)
+                if self._index_writer is None:
+                    desc={"frame_shape":frm.shape[1:],"frame_dtype":np.dtype(save_dtype).str,"filesplit":self.filesplit}
+                    self._index_writer=framefiles.FrameIndexWriter(self._get_index_path(),desc,append=append)
+                offsets=self._mmap_writer.write(frm[frm_saved:frm_saved+frm_to_save])
+                self._index_writer.write(idx[frm_saved:frm_saved+frm_to_save],self._file_idx if self.filesplit else 0,offsets)
+                frm_saved+=frm_to_save
+                nsaved+=frm_to_save
+                if self.filesplit is not None and nsaved%self.filesplit==0:
+                    self._mmap_writer.close()
+                    self._mmap_writer=None
+                    self._file_idx+=1
+                    self._clean_path(idx=self._file_idx)
+    @staticmethod
+    def _get_raw_save_dtype(dtype):
+        """Get dtype of the frames saved in raw formats"""
+        if dtype.kind=="f":
+            return np.dtype("<f8")
+        if dtype.kind in "ui":
+            return dtype.newbyteorder("<")
+        return dtype
+    def _write_frames(self, frames, append=True, nsaved=None, indices=None, level=None):
+        """
+        Write frames to the given path.
+
+        `nsaved` is the number of frames saved before this call (by default, use the ``"saved"`` variable).
+        `indices` is the list of frame indices for each element of `frames` (only required for ``"raw_mmap"`` format).
+        `level` is the compression level for ``"compressed"`` format (by default, the current level);
+        it is passed with each chunk instead of being changed in the writer, since the writer can be used by a writer pool thread.
+        """
         if not frames:
             return
         if self.format in ["cam"]:
             frames=[f for fs in frames for f in fs]
-        nsaved=self.v["saved"]
+        if nsaved is None:
+            nsaved=self.v["saved"]
         self._last_frame=frames[-1][-1,:].copy()
         if self.format=="cam":
+            self._last_frame=frames[-1].astype("<u2") # frames are already split into single 2D frames, which are stored as 16-bit
             if self.filesplit is None:
                 cam.save_cam(frames,self._make_path(),append=append)
             else: # file splitting mechanics
@@ -724,52 +2282,49 @@ class FrameSaveThread(controller.QTaskThread):
                     if nsaved%self.filesplit==0:
                         self._file_idx+=1
                         self._clean_path(idx=self._file_idx)
-        elif self.format=="raw":
-            if frames[0].dtype.kind=="f":
-                save_dtype="<f8"
-            elif frames[0].dtype.kind in "ui":
-                save_dtype=frames[0].dtype.newbyteorder("<")
-            else:
-                save_dtype=frames[0].dtype
-            self._last_frame=frames[-1][-1,:].astype(save_dtype).copy()
-            mode="ab" if append else "wb"
-            if self.filesplit is None:
-                with open(self._make_path(),mode) as f:
-                    for frm in frames:
-                        np.asarray(frm,save_dtype).tofile(f)
-            else: # file splitting mechanics
-                f=None
-                try:
-                    for frm in frames:
-                        frm_size=len(frm)
-                        frm_saved=0
-                        while frm_saved<frm_size:
-                            lchunk=(-nsaved-1)%self.filesplit+1
-                            frm_to_save=min(lchunk,frm_size-frm_saved)
-                            if f is None:
-                                f=open(self._make_path(idx=self._file_idx),mode)
-                            np.asarray(frm[frm_saved:frm_saved+frm_to_save],save_dtype).tofile(f)
-                            frm_saved+=frm_to_save
-                            nsaved+=frm_to_save
-                            if nsaved%self.filesplit==0:
-                                f.close()
-                                self._file_idx+=1
-                                self._clean_path(idx=self._file_idx)
-                                f=None
-                finally:
-                    if f is not None:
-                        f.close()
+        elif self.format in ["raw","raw_mmap","compressed"]:
+            save_dtype=self._get_raw_save_dtype(frames[0].dtype)
+            self._last_frame=self._last_frame.astype(save_dtype,copy=False)
+            if self.format=="raw_mmap":
+                self._write_frames_mmap(frames,indices,append,nsaved,save_dtype)
+                return
+            for frm in frames:
+                frm_size=len(frm)
+                frm_saved=0
+                while frm_saved<frm_size:
+                    if self.filesplit is None:
+                        frm_to_save=frm_size-frm_saved
+                    else: # file splitting mechanics
+                        lchunk=(-nsaved-1)%self.filesplit+1
+                        frm_to_save=min(lchunk,frm_size-frm_saved)
+                    if self._raw_writer is None:
+                        self._raw_writer=self._open_raw_writer(append,nsaved,frm.shape[1:],save_dtype,level=level)
+                        if self._checksums is not None and isinstance(self._raw_writer,framefiles.RawFrameWriter) and self._raw_writer.start:
+                            self._checksums.add_prefix(self._raw_writer.path,self._raw_writer.start)
+                    data=np.asarray(frm[frm_saved:frm_saved+frm_to_save],save_dtype)
+                    if self._checksums is not None and isinstance(self._raw_writer,framefiles.RawFrameWriter):
+                        self._checksums.add_chunk(self._raw_writer.path,self._raw_writer.tell(),data)
+                    if self.format=="compressed":
+                        self._raw_writer.write(data,level=level)
+                    else:
+                        self._raw_writer.write(data)
+                    frm_saved+=frm_to_save
+                    nsaved+=frm_to_save
+                    if self.filesplit is not None and nsaved%self.filesplit==0:
+                        self._close_raw_writer()
+                        self._file_idx+=1
+                        self._clean_path(idx=self._file_idx)
+        elif self.format=="hdf5":
+            for frm in frames:
+                self._hdf5_writer.write(frm[None] if frm.ndim==2 else frm)
         elif self.format in ["tiff","bigtiff"]:
             frames=[f.astype("float32") if f.dtype=="float64" else f for f in frames]
             if self.filesplit is None:
                 if self._tiff_writer is None:
-                    self._tiff_writer=imageio.get_writer(self._make_path(),format="tiff",bigtiff=self.format=="bigtiff",mode="V")
+                    self._tiff_writer=framefiles.TiffFrameWriter(self._make_path(),bigtiff=self.format=="bigtiff")
                 for f in frames:
-                    try:
-                        self._write_tiff(f)
-                        nsaved+=len(f)
-                    except ValueError:
-                        raise FrameWriteError(nsaved,kind="tiff_size_exceeded")
+                    self._write_tiff(f,nsaved)
+                    nsaved+=len(f)
             else: # file splitting mechanics
                 for frm in frames:
                     frm_size=len(frm)
@@ -778,44 +2333,61 @@ class FrameSaveThread(controller.QTaskThread):
                         lchunk=(-nsaved-1)%self.filesplit+1
                         frm_to_save=min(lchunk,frm_size-frm_saved)
                         if self._tiff_writer is None:
-                            self._tiff_writer=imageio.get_writer(self._make_path(idx=self._file_idx),format="tiff",bigtiff=self.format=="bigtiff",mode="V")
-                        try:
-                            self._write_tiff(frm[frm_saved:frm_saved+frm_to_save])
-                            frm_saved+=frm_to_save
-                            nsaved+=frm_to_save
-                        except ValueError:
-                            raise FrameWriteError(nsaved,kind="tiff_size_exceeded")
+                            self._tiff_writer=framefiles.TiffFrameWriter(self._make_path(idx=self._file_idx),bigtiff=self.format=="bigtiff")
+                        self._write_tiff(frm[frm_saved:frm_saved+frm_to_save],nsaved)
+                        frm_saved+=frm_to_save
+                        nsaved+=frm_to_save
                         if nsaved%self.filesplit==0:
                             self._tiff_writer.close()
                             self._file_idx+=1
                             self._clean_path(idx=self._file_idx)
                             self._tiff_writer=None
     def _write_finish(self):
-        """Finalize writing (applies only for tiff files)"""
+        """Finalize writing (close currently open raw, compressed, or tiff files)"""
+        if self._raw_writer:
+            self._close_raw_writer()
+        if self._mmap_writer:
+            try:
+                self._mmap_writer.close()
+            finally:
+                self._mmap_writer=None
+        if self._index_writer:
+            self._index_writer.close()
+            self._index_writer=None
+        if self._hdf5_writer:
+            try:
+                self._hdf5_writer.close()
+            finally:
+                self._hdf5_writer=None
+        if self._frame_info_writer:
+            try:
+                self._frame_info_writer.close()
+            finally:
+                self._frame_info_writer=None
         if self._tiff_writer:
             try:
                 self._tiff_writer.close()
-            except ValueError:
-                pass
-            self._tiff_writer=None
+            finally:
+                self._tiff_writer=None
 
-    def _write_frame_info(self, messages, path, append=True):
-        """Write frame info in a table to the given path"""
-        if not append and os.path.exists(path):
-            file_utils.retry_remove(path)
-        if all(msg.frame_info is None for msg in messages):
-            return
-        nsaved=self.v["saved"]
+    def _get_frame_info_rows(self, messages, nsaved=None):
+        """
+        Get frame info table for the given messages.
+
+        Return tuple ``(header, rows)``, where `header` is the list of column names (``None`` if unknown),
+        and `rows` is the list of rows with the first column being the save index.
+        """
+        if nsaved is None:
+            nsaved=self.v["saved"]
         header=None
         for msg in messages:
             header=msg.metainfo.get("frame_info_fields")
             if header is not None:
                 header=["save_index"]+header
                 break
-        streamer=table_stream.TableStreamFile(path,columns=header,header_prepend="")
+        rows=[]
         for msg in messages:
             if msg.frame_info is not None:
-                rows=[]
                 for f,r in zip(msg.frames,msg.frame_info):
                     if r is not None:
                         if isinstance(r,np.ndarray) and r.ndim==2:
@@ -826,12 +2398,188 @@ class FrameSaveThread(controller.QTaskThread):
                         else:
                             rows.append([nsaved]+list(r))
                     nsaved+=(1 if f.ndim==2 else len(f))
-                if rows:
-                    streamer.write_multiple_rows(rows)
+            else:
+                nsaved+=msg.nframes()
+        return header,rows
+    def _write_frame_info(self, messages, path, append=True, nsaved=None):
+        """Write frame info in a table to the given path"""
+        if not append and os.path.exists(path):
+            file_utils.retry_remove(path)
+        if all(msg.frame_info is None for msg in messages):
+            return
+        header,rows=self._get_frame_info_rows(messages,nsaved=nsaved)
+        streamer=table_stream.TableStreamFile(path,columns=header,header_prepend="")
+        if rows:
+            streamer.write_multiple_rows(rows)
+    def _get_frame_info_table(self, messages, nsaved=None):
+        """
+        Get frame info table for the given messages as a 2D numpy array.
+
+        Return tuple ``(header, table)``, where `header` is the list of column names, and `table` is the 2D array with the first column being the save index
+        (``None`` if there is no frame info). Unlike :meth:`_get_frame_info_rows`, chunked frame info is processed without splitting it into rows.
+        """
+        if nsaved is None:
+            nsaved=self.v["saved"]
+        header=None
+        for msg in messages:
+            header=msg.metainfo.get("frame_info_fields")
+            if header is not None:
+                header=["save_index"]+header
+                break
+        blocks=[]
+        for msg in messages:
+            if msg.frame_info is not None:
+                for f,r in zip(msg.frames,msg.frame_info):
+                    nfrm=(1 if f.ndim==2 else len(f))
+                    if r is not None:
+                        if isinstance(r,np.ndarray) and r.ndim==2:
+                            idx_col=np.arange(nsaved,nsaved+len(r),dtype=r.dtype if r.dtype.kind in "iuf" else "i8")
+                            blocks.append(np.concatenate([idx_col[:,None],r],axis=1))
+                        else:
+                            blocks.append(np.array([[nsaved]+list(r)]))
+                    nsaved+=nfrm
+            else:
+                nsaved+=msg.nframes()
+        if not blocks:
+            return header,None
+        table=np.concatenate(blocks,axis=0)
+        if header is None or len(header)!=table.shape[1]:
+            header=(header or ["save_index"])[:table.shape[1]]
+            header+=["info{}".format(i) for i in range(len(header)-1,table.shape[1]-1)]
+        return header,table
+    def _write_frame_info_hdf5(self, messages, nsaved=None):
+        """Write frame info into the ``"frame_info"`` dataset of the HDF5 file"""
+        if all(msg.frame_info is None for msg in messages):
+            return
+        header,table=self._get_frame_info_table(messages,nsaved=nsaved)
+        if table is not None:
+            self._hdf5_writer.write_frame_info(header,table)
+    def _write_frame_info_binary(self, messages, append=True, nsaved=None):
+        """Write frame info into the binary frame info file"""
+        if all(msg.frame_info is None for msg in messages):
+            return
+        header,table=self._get_frame_info_table(messages,nsaved=nsaved)
+        if table is None:
+            return
+        if self._frame_info_writer is None:
+            dtype="<f8" if table.dtype.kind=="f" else "<i8"
+            self._frame_info_writer=framefiles.FrameInfoWriter(self._get_frame_info_path(),header,dtype=dtype,append=append)
+        self._frame_info_writer.write(table)
 
 
 
-    def save_start(self, path, path_kind="pfx", batch_size=None, append=True, format="cam", filesplit=None, save_settings=False, perform_status_check=False, extra_settings=None):
+    def _promote_pretrigger(self):
+        """
+        Move the pretrigger frames spilled to the disk directly into the output file (see :class:`SpillingPretriggerBuffer`).
+
+        Only applies to the raw format without file splitting, striping, save-only preprocessing, or additional sinks; the rest of the pretrigger frames are scheduled as usual
+        (spilled frames are then written from the ring file and do not count towards the queue RAM, see :meth:`_get_queue_nbytes`).
+        """
+        buffer=self._pretrigger_buffer
+        if not (isinstance(buffer,SpillingPretriggerBuffer) and buffer.nspilled() and self._clear_pretrigger_on_write):
+            return
+        if self.format!="raw" or self.stripe_folders or self._active_sinks or self._preprocess is not None or self.filesplit is not None or (self.v["batch_size"] is not None and self.v["batch_size"]<buffer.nspilled()):
+            return
+        if buffer.spilled_dtype()!=self._get_raw_save_dtype(buffer.spilled_dtype()):
+            return
+        msgs=buffer.promote(self._make_path(),append=self.append)
+        if not msgs:
+            return
+        for msg in msgs:
+            if self._first_frame_recvd is None:
+                self._first_frame_recvd=msg.metainfo["creation_time"]
+                self._first_frame_idx=msg.first_frame_index()
+                self._first_frame_sid=msg.sid
+            self._last_frame_recvd=msg.metainfo["creation_time"]
+            self.v["missed"]+=msg.get_missing_frames_number(self._last_frame_idx if msg.first_frame_index() else None)
+            self._last_frame_idx=msg.last_frame_index()
+            self._last_frame_sid=msg.sid
+        nframes=sum([msg.nframes() for msg in msgs])
+        self._write_chunk_info(msgs,self.append,0)
+        self._last_frame=np.array(msgs[-1].frames[-1][-1])
+        self._dumped+=nframes
+        for v in ["received","scheduled","saved"]:
+            self.v[v]+=nframes
+        if self.v["batch_size"] and self.v["scheduled"]>=self.v["batch_size"]:
+            self.save_stop()
+    def _get_event_index_path(self):
+        """Generate save path for the event index file"""
+        return self._make_path(subpath="events",ext="dat")
+    def _add_event_frames(self, msg):
+        """Process frames in the event capture mode: schedule the frames in the current post-trigger window, and add the rest to the event ring"""
+        if not msg:
+            return
+        self._event_last_index=msg.last_frame_index()
+        n=msg.nframes()
+        if self._event_post_remaining>0:
+            head=msg
+            if n>self._event_post_remaining:
+                head=msg.copy()
+                head.cut_to_size(self._event_post_remaining)
+                msg.cut_to_size(n-self._event_post_remaining,from_end=True)
+            else:
+                msg=None
+            self._event_post_remaining-=head.nframes()
+            self._event_idle=0
+            self.schedule_message(head)
+            if self._event_post_remaining<=0:
+                self._flush_events()
+                if self._event_stop_after:
+                    self.save_stop()
+        if msg:
+            self._event_buffer.add_frame_message(msg)
+            self._event_idle+=msg.nframes()
+    def trigger_event(self, desc=None, stop_after=False):
+        """
+        Trigger an event in the event capture mode.
+
+        The event contains the pre-trigger frames currently in the event ring (ending with the last received frame) and the post-trigger frames received afterwards.
+        If the event overlaps with the previous one, the overlapping frames are saved only once, so back-to-back events produce a continuous stretch of frames.
+        The events are listed in the event index file (``_events.dat``) together with the save indices of their first frames and their lengths.
+        `desc` is an optional event description (number or string) stored in the index file.
+        If ``stop_after==True``, the saving is stopped as soon as all of the post-trigger frames of this event are scheduled.
+        Return ``True`` if the event has been triggered, and ``False`` if the saving is not running in the event capture mode.
+        """
+        if not (self._saving and not self._stopping and self._event_capture is not None):
+            return False
+        pre,post=self._event_capture
+        scheduled=self.v["scheduled"]
+        ring_frames=self._event_buffer.nframes()
+        if ring_frames==self._event_idle: # ring frames directly follow the last saved frames, which can be used as pre-trigger frames
+            start=max(scheduled-(pre-ring_frames),self._event_run_start)
+        else:
+            start=self._event_run_start=scheduled
+        while self._event_buffer.has_frames():
+            self.schedule_message(self._event_buffer.pop_frame_message())
+        self._event_idle=0
+        self._event_post_remaining=post
+        self._event_stop_after=stop_after
+        self._events_pending.append((self.v["events"],self._event_last_index,start,self.v["scheduled"]+post,time.time(),"" if desc is None else desc))
+        self.v["events"]+=1
+        if post<=0:
+            self._flush_events()
+            if stop_after:
+                self.save_stop()
+        return True
+    def _flush_events(self):
+        """Write all pending events into the event index file"""
+        if not self._events_pending:
+            return
+        rows=[(n,idx,start,min(end,self.v["scheduled"])-start,t,desc) for (n,idx,start,end,t,desc) in self._events_pending]
+        self._events_pending=[]
+        t0=time.perf_counter()
+        streamer=table_stream.TableStreamFile(self._get_event_index_path(),columns=["event","trigger_frame_index","start","nframes","trigger_time","description"],header_prepend="")
+        streamer.write_multiple_rows(rows)
+        self._write_stats.add("event_log",time.perf_counter()-t0)
+    def _finish_events(self):
+        """Finish the event capture mode"""
+        if self._event_capture is not None:
+            self._flush_events()
+            self._event_buffer.close()
+            self._event_buffer=None
+            self._event_capture=None
+    def save_start(self, path, path_kind="pfx", batch_size=None, append=True, format="cam", filesplit=None, save_settings=False, perform_status_check=False, extra_settings=None,
+            event_pre_frames=None, event_post_frames=0):
         """
         Start saving routine.
 
@@ -841,22 +2589,36 @@ class FrameSaveThread(controller.QTaskThread):
                 or ``"folder"`` (treat it as folder, main and aux files are stored inside)
             batch_size: maximal number of frames to save (by default, no limit)
             append (bool): if ``True`` and the destination file already exists, append data to it; otherwise, remove it before saving
-            format (str): file format; can be ``"cam"`` (.cam file), ``"raw"`` (raw binary in ``"<u2"`` format), or ``"tiff"`` (tiff format)
-            filesplit: maximal number of frames per file (by default, all frames are in one file); if defined, file names acquire numerical suffix
+            format (str): file format; can be ``"cam"`` (.cam file), ``"raw"`` (raw binary in ``"<u2"`` format),
+                ``"raw_mmap"`` (memory-mapped raw binary with an additional binary frame index), ``"tiff"`` (tiff format), ``"bigtiff"`` (BigTIFF format),
+                ``"compressed"`` (losslessly compressed blocks with an offset index, see :class:`.framefiles.CompressedFrameWriter`),
+                or ``"hdf5"`` (single HDF5 file containing frames, frame info, background, and settings; requires ``h5py``)
+            filesplit: maximal number of frames per file (by default, all frames are in one file); if defined, file names acquire numerical suffix;
+                ignored for ``"hdf5"`` format
             save_settings (bool): if ``True``, save all application setting to the file
             perform_status_check (bool): if ``True`` and frames have status line (applies only to Photon Focus cameras), check status line to ensure no missing frames
             extra_settings: can be a dictionary with additional settings to save to the settings file (saved in branch ``"extra"``)
+            event_pre_frames: if not ``None``, start saving in the event capture mode: the frames are only stored in the event ring of this size,
+                and on each :meth:`trigger_event` call the ring frames and the following `event_post_frames` frames are saved (the pretrigger buffer frames are used to fill the ring)
+            event_post_frames: number of post-trigger frames for each event in the event capture mode
         """
         if self._saving:
+            self._wait_written()
             self._finalize_saving()
             self.update_status("saving","stopped",text="Saving done")
         self.v["path"]=path
         funcargparse.check_parameter_range(path_kind,"path_kind",["pfx","folder"])
         self.v["path_kind"]=path_kind
         self.v["batch_size"]=batch_size
-        self.append=append or (filesplit is not None)
-        if format not in ["cam","raw","tiff","bigtiff"]:
+        if format not in ["cam","raw","raw_mmap","compressed","tiff","bigtiff","hdf5"]:
             raise ValueError("unrecognized format: {}".format(format))
+        if format=="hdf5":
+            if framefiles.h5py is None:
+                raise ValueError("HDF5 format requires h5py package")
+            filesplit=None
+        if format=="compressed" and self.compression_codec not in framefiles.get_compression_codecs():
+            raise ValueError("compression codec {} is not available".format(self.compression_codec))
+        self.append=append or (filesplit is not None)
         self.format=format
         self.filesplit=filesplit
         self.v["saved"]=0
@@ -864,6 +2626,14 @@ class FrameSaveThread(controller.QTaskThread):
         self.v["received"]=0
         self.v["missed"]=0
         self._save_queue=[]
+        self._dumped=0
+        self._journal_last=None
+        self._raw_flushed=0
+        self._write_failed=False
+        self._compression_stats=[0,0]
+        self._write_stats.reset()
+        self._queue_ram_peak=self.v["queue_ram_peak"]=0
+        self._setup_writer_pool()
         self._event_log_started=False
         self._start_time=time.time()
         self._first_frame_recvd=None
@@ -873,22 +2643,57 @@ class FrameSaveThread(controller.QTaskThread):
         self._last_frame_idx=None
         self._last_frame_sid=None
         self._last_chunk_start=0
+        self._last_chunk_size=0
+        self._overload_policy=None
+        self._overload_range=None
+        self._overflow_range=None
+        self.v["overload"]=None
+        self.v["overload_dropped"]=0
+        self._finishing_checksums=[c for c in self._finishing_checksums+[self._checksums] if c is not None and c.is_finishing()]
+        self._checksums=None
+        if self.checksum_algorithm is not None:
+            self._checksums=ChecksumCollector(self.checksum_algorithm,block_size=self.checksum_block_size,max_inflight=self.checksum_max_inflight)
+        self.v["checksums"]=self._checksums.get_status() if self._checksums else None
+        self._preprocess=self._get_preprocess()
+        self._preprocess_skipped=0
+        self._preprocess_shape=None
         self._update_queue_ram(0)
         self._stopping=False
         self._saving=True
         if self.single_shot:
             self._enable_garbage_collect(False)
         self._file_idx=0
+        self._active_sinks=list(self._sinks.values())
+        for sink in self._active_sinks:
+            sink.start(self.v["path"],self.v["path_kind"])
+        self.v["sinks"]={sink.name:sink.get_status() for sink in self._active_sinks}
+        self.v["events"]=0
+        self._events_pending=[]
+        self._event_post_remaining=0
+        self._event_stop_after=False
+        self._event_idle=0
+        self._event_run_start=0
+        self._event_last_index=None
+        if event_pre_frames is not None:
+            self._event_capture=(event_pre_frames,event_post_frames)
+            self._event_buffer=PretriggerBuffer(max(event_pre_frames,1))
         self.v["status_line_check"]="na" if perform_status_check else "off"
         self._last_frame_statusline_idx=None
         self._perform_status_check=perform_status_check
+        self._save_settings=save_settings
         try:
             file_utils.ensure_dir(os.path.split(self._make_path())[0])
             if filesplit is not None:
                 self._clean_path()
+            if event_pre_frames is not None and not self.append:
+                self._clean_path(subpath="events",ext="dat")
+            if format=="hdf5":
+                self._hdf5_writer=framefiles.HDF5FrameWriter(self._make_path(),append=self.append,
+                    chunk_frames=self.hdf5_chunk_frames,compression=self.hdf5_compression,compression_opts=self.hdf5_compression_opts)
             self.write_background()
             if save_settings:
                 self.write_settings(extra_settings=extra_settings)
+            self._start_journal()
             self.update_status("saving","in_progress",text="Saving in progress")
             self.update_status("result","in_progress",text="Saving in progress")
             self.signal_error()
@@ -896,10 +2701,19 @@ class FrameSaveThread(controller.QTaskThread):
             self.signal_error("write_os_error",desc=str(err))
             self.save_stop()
         if self._pretrigger_buffer is not None:
+            if self._saving and not self._stopping and self._event_capture is None:
+                try:
+                    self._promote_pretrigger()
+                except OSError as err:
+                    self.signal_error("write_os_error",desc=str(err))
+                    self.save_stop()
             if not self._clear_pretrigger_on_write:
                 old_buffer=self._pretrigger_buffer.copy()
             while self._pretrigger_buffer.has_frames():
                 msg=self._pretrigger_buffer.pop_frame_message()
+                if self._event_capture is not None:
+                    self._add_event_frames(msg)
+                    continue
                 scheduled=self.schedule_message(msg)
                 if not scheduled:
                     break
@@ -917,12 +2731,53 @@ class FrameSaveThread(controller.QTaskThread):
     def _append_queue(self, msg):
         """Append frames to the saving queue"""
         last_chunk=[]
-        if msg.metainfo["creation_time"]-self._last_chunk_start>self.chunk_period:
+        new_chunk=msg.metainfo["creation_time"]-self._last_chunk_start>self.chunk_period
+        if self.adaptive_chunking:
+            new_chunk=new_chunk or not self._save_queue or self._last_chunk_size>=self._get_chunk_target_size()
+        if new_chunk:
             self._last_chunk_start=msg.metainfo["creation_time"]
+            self._last_chunk_size=0
         elif self._save_queue:
             last_chunk=self._save_queue.pop()
         last_chunk.append(msg)
+        self._last_chunk_size+=msg.nbytes()
         self._save_queue.append(last_chunk)
+    def _chunk_pending(self):
+        """
+        Check if the writing of the saving queue should be postponed.
+
+        With adaptive chunking, a single partially filled chunk is kept in the queue until it reaches :attr:`chunk_target_size`
+        (but at most 1/8 of the queue RAM) or becomes older than :attr:`chunk_period`, so that the frames are written in larger blocks without delaying them for too long.
+        """
+        if not self.adaptive_chunking or self._stopping or self.single_shot or not self._save_queue or len(self._save_queue)!=1:
+            return False
+        return self._last_chunk_size<self._get_chunk_target_size() and time.time()-self._last_chunk_start<self.chunk_period
+    def _get_chunk_target_size(self):
+        """Get the target chunk size (limited to a fraction of the queue RAM, so that partially filled chunks do not overflow the queue)"""
+        return min(self.chunk_target_size,self.v["max_queue_ram"]//8)
+    def _pop_queue(self):
+        """
+        Pop the next write from the saving queue.
+
+        With adaptive chunking, several consecutive chunks are merged when the queue backs up:
+        the write size grows with the occupied queue RAM from :attr:`chunk_target_size` up to :attr:`chunk_max_size`
+        (the chunk sizes are counted in the same way as the queue RAM, i.e., without the spilled pretrigger frames).
+        """
+        if not self._save_queue:
+            return []
+        new_chunk=self._save_queue.pop(0)
+        if self.adaptive_chunking and self._save_queue:
+            write_size=min(max(self.chunk_target_size,self.v["queue_ram"]//4),self.chunk_max_size)
+            size=sum([self._get_queue_nbytes(msg) for msg in new_chunk])
+            while self._save_queue and size<write_size:
+                chunk=self._save_queue.pop(0)
+                new_chunk+=chunk
+                size+=sum([self._get_queue_nbytes(msg) for msg in chunk])
+        return new_chunk
+    @staticmethod
+    def _get_queue_nbytes(msg):
+        """Get the queue RAM occupied by the message (frames spilled by the pretrigger buffer are stored on the disk, so they are not counted)"""
+        return 0 if msg.metainfo.get("pretrigger_spilled") else msg.nbytes()
     def schedule_message(self, msg):
         """
         Add frame message to the saving queue.
@@ -940,15 +2795,22 @@ class FrameSaveThread(controller.QTaskThread):
                 if self._first_frame_recvd is None:
                     self._first_frame_recvd=msg.metainfo["creation_time"]
                 self._last_frame_recvd=msg.metainfo["creation_time"]
-                if self.v["queue_ram"]<=self.v["max_queue_ram"]:
-                    self._append_queue(msg)
-                    self._update_queue_ram(self.v["queue_ram"]+msg.nbytes())
+                self._update_overload()
+                last_frame_idx=msg.last_frame_index()
+                if self.v["queue_ram"]<=self.v["max_queue_ram"] or msg.metainfo.get("pretrigger_spilled"):
+                    self._flush_overflow_range()
                     self.v["missed"]+=msg.get_missing_frames_number(self._last_frame_idx if msg.first_frame_index() else None) # don't count reset as skip
-                    self.v["scheduled"]+=tot_frames
+                    if self._overload_policy is not None:
+                        self._degrade_message(msg)
+                    if msg.nframes():
+                        self._append_queue(msg)
+                        self._update_queue_ram(self.v["queue_ram"]+self._get_queue_nbytes(msg))
+                    self.v["scheduled"]+=msg.nframes()
                 else:
-                    self.v["missed"]+=msg.last_frame_index()-self._last_frame_idx if (self._last_frame_idx is not None) else msg.nframes()
+                    self.v["missed"]+=last_frame_idx-self._last_frame_idx if (self._last_frame_idx is not None) else msg.nframes()
+                    self._add_overflow_range(msg)
                     overflow=True
-                self._last_frame_idx=msg.last_frame_index()
+                self._last_frame_idx=last_frame_idx
                 self._last_frame_sid=msg.sid
                 self.v["received"]+=tot_frames
                 scheduled=True
@@ -958,10 +2820,337 @@ class FrameSaveThread(controller.QTaskThread):
             elif self.v["batch_size"] and self.v["scheduled"]>=self.v["batch_size"]:
                 self.save_stop()
         return scheduled
+    def _get_overload_policy(self):
+        """Get the overload policy applicable to the current saving format"""
+        policy=self.overload_policy
+        if policy=="compress" and self.format!="compressed":
+            return "decimate"
+        if policy=="roi" and (self.overload_roi is None or self.format not in ["cam","tiff","bigtiff"]):
+            return "decimate"
+        return policy
+    def _get_compression_level(self):
+        """Get the currently used compression level for ``"compressed"`` format"""
+        return self.overload_compression_level if self._overload_policy=="compress" else self.compression_level
+    def _describe_overload(self, policy):
+        """Get a text description of the overload policy"""
+        if policy=="decimate":
+            return "dropping frames with index divisible by {}".format(self.overload_decimation)
+        if policy=="compress":
+            return "compression level {}".format(self.overload_compression_level)
+        if policy=="roi":
+            return "saving ROI {}".format(self.overload_roi)
+        return "camera paused"
+    def _update_overload(self):
+        """Engage or release the overload policy depending on the queue RAM fill"""
+        fill=self.v["queue_ram"]/self.v["max_queue_ram"] if self.v["max_queue_ram"] else 0
+        if self._overload_policy is None:
+            policy=self._get_overload_policy()
+            if policy!="drop" and fill>=self.overload_threshold:
+                self._overload_policy=self.v["overload"]=policy
+                self._overload_range=[None,None,0,0] # first index, last index, frames, dropped frames
+                self.write_event_log("Overload policy '{}' engaged at {:.0f}% queue fill ({})".format(policy,fill*100,self._describe_overload(policy)))
+                self._apply_overload_policy(True)
+        elif fill<=self.overload_recover:
+            self._release_overload()
+    def _apply_overload_policy(self, engaged):
+        """Perform the policy-specific actions when the overload policy is engaged or released"""
+        if self._overload_policy=="pause": # with "compress" policy, the compression level is passed with each written chunk
+            self.send_multicast(tag="saving/overload",value="pause" if engaged else "resume")
+    def _release_overload(self):
+        """Release the overload policy and log the affected frames range"""
+        self._apply_overload_policy(False)
+        policy,self._overload_policy=self._overload_policy,None
+        self.v["overload"]=None
+        first,last,nframes,ndropped=self._overload_range
+        self._overload_range=None
+        if nframes:
+            self.write_event_log("Overload policy '{}' released: frames {}-{} affected ({} frames, {} dropped)".format(policy,first,last,nframes,ndropped))
+        else:
+            self.write_event_log("Overload policy '{}' released: no frames affected".format(policy))
+    def _degrade_message(self, msg):
+        """Apply the engaged overload policy to the message"""
+        nframes=msg.nframes()
+        rng=self._overload_range
+        if rng[0] is None:
+            rng[0]=msg.first_frame_index()
+        rng[1]=msg.last_frame_index()
+        rng[2]+=nframes
+        policy=self._overload_policy
+        if policy=="decimate":
+            k=self.overload_decimation
+            if msg.chunks:
+                keep=[np.asarray(idx)%k!=0 for idx in msg.indices]
+                msg.frames=[f[m] for f,m in zip(msg.frames,keep)]
+                msg.indices=[idx[m] for idx,m in zip(msg.indices,keep)]
+                if msg.frame_info is not None:
+                    msg.frame_info=[inf[m] for inf,m in zip(msg.frame_info,keep)]
+                nonempty=[i for i,f in enumerate(msg.frames) if len(f)]
+                msg.frames=[msg.frames[i] for i in nonempty]
+                msg.indices=[msg.indices[i] for i in nonempty]
+                if msg.frame_info is not None:
+                    msg.frame_info=[msg.frame_info[i] for i in nonempty]
+            else:
+                keep=[i for i,idx in enumerate(msg.indices) if idx%k!=0]
+                msg.frames=[msg.frames[i] for i in keep]
+                msg.indices=[msg.indices[i] for i in keep]
+                if msg.frame_info is not None:
+                    msg.frame_info=[msg.frame_info[i] for i in keep]
+            msg.metainfo.pop("status_line",None)
+        elif policy=="roi":
+            h0,h1,v0,v1=self.overload_roi
+            msg.frames=[np.ascontiguousarray(f[:,v0:v1,h0:h1] if msg.chunks else f[v0:v1,h0:h1]) for f in msg.frames]
+            msg.metainfo.pop("status_line",None)
+        ndropped=nframes-msg.nframes()
+        rng[3]+=ndropped
+        self.v["overload_dropped"]+=ndropped
+    def _add_overflow_range(self, msg):
+        """Add the message dropped because of the queue overflow to the current overflow range"""
+        if self._overflow_range is None:
+            self._overflow_range=[msg.first_frame_index(),None,0]
+        self._overflow_range[1]=msg.last_frame_index()
+        self._overflow_range[2]+=msg.nframes()
+    def _flush_overflow_range(self):
+        """Log the current overflow range"""
+        if self._overflow_range is not None:
+            first,last,nframes=self._overflow_range
+            self._overflow_range=None
+            self.write_event_log("Saving queue overflow: frames {}-{} dropped ({} frames)".format(first,last,nframes))
+    def _finish_overload(self):
+        """Release the overload policy and log the overflow at the end of saving"""
+        self._flush_overflow_range()
+        if self._overload_policy is not None:
+            self._release_overload()
+    def _update_receive_stats(self, msg):
+        """Update the received frames shape and rate (used to estimate the required saving throughput)"""
+        if not msg:
+            return
+        frame=msg.frames[-1]
+        self._recv_frame_desc=(frame.shape[1:] if msg.chunks else frame.shape,frame.dtype)
+        t=time.time()
+        t0,n=self._recv_rate_window
+        if t0 is None:
+            self._recv_rate_window=[t,0]
+        elif t-t0>1.:
+            self._recv_rate=(n+msg.nframes())/(t-t0)
+            self._recv_rate_window=[t,0]
+        else:
+            self._recv_rate_window[1]=n+msg.nframes()
+    def benchmark_disk(self, path, path_kind="pfx", frame_rate=None, frame_shape=None, dtype=None, total_size=2**30, max_time=5.):
+        """
+        Start the benchmark of the disk writing speed at the given saving destination and predict whether the saving queue overflows.
+
+        The test blocks have the size of a single saving chunk (frames received during :attr:`chunk_period`, but at most :attr:`chunk_target_size` with adaptive chunking and at most 64 Mb)
+        and are synced to the disk after each write.
+        `frame_rate`, `frame_shape`, and `dtype` describe the saved frames; by default, they are estimated from the received frames.
+        The benchmark runs in a helper thread for at most `max_time` seconds, so the saving thread keeps receiving frames (e.g., for the pretrigger buffer);
+        it can not be started while saving or another benchmark is in progress (return ``None`` in this case).
+        Return the current ``"benchmark"`` variable value, which has ``"status"`` equal to ``"running"`` until the benchmark is done.
+        Afterwards, the variable contains dictionary with the benchmark results (see :func:`.framefiles.benchmark_write`) complemented by the benchmark frame rate (``"fps"``),
+        the camera frame rate (``"camera_fps"``), the required throughput (``"required_throughput"``),
+        the maximal duration of a disk stall which the saving queue can absorb (``"queue_time"``),
+        the time until the saving queue overflows (``"overflow_time"``, ``None`` if the throughput is sufficient),
+        and the overall verdict (``"sustainable"``). The camera-related values are ``None`` if the frame rate is unknown.
+        If the benchmark could not be performed, the dictionary contains ``"status"`` equal to ``"error"`` and the error description.
+        """
+        if self._saving or self._benchmark is not None:
+            return None
+        if frame_shape is None or dtype is None:
+            if self._recv_frame_desc is None:
+                self.v["benchmark"]={"status":"error","error":"no frames received"}
+                return self.v["benchmark"]
+            frame_shape=frame_shape or self._recv_frame_desc[0]
+            dtype=dtype or self._recv_frame_desc[1]
+        if frame_rate is None:
+            frame_rate=self._recv_rate
+        frame_nbytes=np.dtype(dtype).itemsize*int(np.prod(frame_shape))
+        chunk_frames=max(int(self.chunk_period*frame_rate),1) if frame_rate else 1
+        if self.adaptive_chunking:
+            chunk_frames=min(chunk_frames,max(self.chunk_target_size//frame_nbytes,1))
+        chunk_frames=min(chunk_frames,max(2**26//frame_nbytes,1)) # limit the test block size to 64 Mb
+        bench_path=self.build_path(path,path_kind,subpath="benchmark",ext="tmp")
+        self.v["benchmark"]={"status":"running"}
+        executor=concurrent.futures.ThreadPoolExecutor(1)
+        future=executor.submit(self._run_benchmark,bench_path,frame_nbytes*chunk_frames,total_size,max_time)
+        executor.shutdown(wait=False)
+        self._benchmark=(future,frame_nbytes,chunk_frames,frame_rate)
+        return self.v["benchmark"]
+    @staticmethod
+    def _run_benchmark(path, block_nbytes, total_size, max_time):
+        """Run the disk benchmark (executed in a helper thread)"""
+        os.makedirs(os.path.dirname(os.path.abspath(path)),exist_ok=True)
+        return framefiles.benchmark_write(path,block_nbytes,total_nbytes=total_size,max_time=max_time)
+    def _update_benchmark(self):
+        """Publish the disk benchmark result if it is done"""
+        if self._benchmark is None or not self._benchmark[0].done():
+            return
+        (future,frame_nbytes,chunk_frames,frame_rate),self._benchmark=self._benchmark,None
+        try:
+            result=future.result()
+        except OSError as err:
+            self.v["benchmark"]={"status":"error","error":str(err)}
+            return
+        if not result["nbytes"]:
+            self.v["benchmark"]={"status":"error","error":"no data written"}
+            return
+        result["status"]="done"
+        result["fps"]=result["throughput"]/frame_nbytes
+        result["chunk_size"]=frame_nbytes*chunk_frames
+        result["camera_fps"]=frame_rate
+        if frame_rate:
+            required=frame_nbytes*frame_rate
+            max_queue_ram=self.v["max_queue_ram"]
+            result["required_throughput"]=required
+            result["queue_time"]=max_queue_ram/required
+            result["overflow_time"]=None if result["throughput"]>=required else max_queue_ram/(required-result["throughput"])
+            result["sustainable"]=result["overflow_time"] is None and result["latency/max"]<result["queue_time"]
+        else:
+            result.update({"required_throughput":None,"queue_time":None,"overflow_time":None,"sustainable":None})
+        self.v["benchmark"]=result
+    @staticmethod
+    def _get_received_message(msg):
+        """
+        Make a saver-owned version of the received message.
+
+        The message itself is copied, since it can be later cut by the saver, but ``FramesMessage.copy`` only copies the containing lists,
+        so the frame data is shared with the sender. To make sure it is never modified in-place along the save path (copy-on-write),
+        the frames are replaced by read-only views; any conversion is done only on writing and only if the saved dtype differs.
+        """
+        frames=[]
+        for f in msg.frames:
+            if isinstance(f,np.ndarray) and f.flags.writeable:
+                f=f.view()
+                f.flags.writeable=False
+            frames.append(f)
+        return msg.copy(frames=frames)
     def receive_frames(self, src, tag, msg):
         """Process frame receive signal"""
-        msg=msg.copy()
+        msg=self._get_received_message(msg)
+        self._update_receive_stats(msg)
+        if self._event_capture is not None and self._saving and not self._stopping:
+            self._add_event_frames(msg)
+            return
         scheduled=self.schedule_message(msg)
         if not scheduled and self._pretrigger_buffer is not None:
             self._pretrigger_buffer.add_frame_message(msg)
-            self.v["pretrigger_status"]=self._pretrigger_buffer.get_status() if self._pretrigger_buffer else None
\ No newline at end of file
+            self.v["pretrigger_status"]=self._pretrigger_buffer.get_status() if self._pretrigger_buffer else None
+
+
+
+
+########## Recovery ##########
+
+def _get_last_frame_info_index(path, binary):
+    """Get the frame index of the last row of the frame info file (``None`` if it is unavailable)"""
+    if binary:
+        _,records=framefiles.load_frame_info(path)
+        if len(records) and "frame_index" in records.dtype.names:
+            return int(records["frame_index"][-1])
+        return None
+    with open(path,"rb") as f:
+        lines=[line.split(b"\t") for line in f.read().splitlines() if line.strip()]
+    if len(lines)<2 or b"frame_index" not in lines[0]:
+        return None
+    try:
+        return int(float(lines[-1][lines[0].index(b"frame_index")]))
+    except (ValueError,IndexError):
+        return None
+def recover_recording(journal_path, force=False):
+    """
+    Recover a recording whose saving has been interrupted (e.g., by the application crash) using its saving journal.
+
+    The journal (suffix ``"_journal"``) is periodically updated by :class:`FrameSaveThread` with the number of frames committed to the current file
+    and the last frame index. The recovery removes partially written frames from the data files (repairing the IFD chain of TIFF files,
+    and restoring the blocks index of compressed files), removes the incomplete frame info rows,
+    and rebuilds the finalized part of the settings file (creating it, if it does not exist).
+    Frames written after the last journal update are kept, as long as they are complete (except for preallocated files, where they can not be distinguished from the empty space),
+    and frames which have not reached the file (e.g., still were in the coalesced write block) are subtracted from the saved frames number.
+    If the journal shows that the saving has been properly finished, nothing is done, unless ``force==True``.
+
+    Return dictionary with the recovery status (``"complete"`` if the recording has been properly finished, ``"recovered"``, or ``"unsupported"`` for HDF5 format),
+    number of saved frames, number of frames recovered beyond the last journal record, and the list of repaired files.
+    """
+    records=[]
+    with open(journal_path,"r") as f:
+        for line in f:
+            try:
+                records.append(json.loads(line))
+            except ValueError: # incomplete last record
+                break
+    starts=[i for i,r in enumerate(records) if r.get("event")=="start"]
+    if not starts:
+        raise IOError("journal {} does not contain a saving start record".format(journal_path))
+    start,session=records[starts[-1]],records[starts[-1]+1:]
+    commits=[r for r in session if r.get("event")=="commit"]
+    last=commits[-1] if commits else {"saved":0,"file_idx":0 if start["filesplit"] else None,"file_frames":0,"preallocated":False,
+        "frame_shape":None,"dtype":None,"first_frame_index":None,"last_frame_index":None}
+    if session and session[-1].get("event")=="stop" and not force:
+        return {"status":"complete","saved":session[-1]["saved"],"recovered":0,"files":[]}
+    if start["format"]=="hdf5":
+        return {"status":"unsupported","saved":last["saved"],"recovered":0,"files":[]}
+    base=os.path.join(os.path.dirname(os.path.abspath(journal_path)),start["rel_path"])
+    def make_path(subpath=None, idx=None, ext=None):
+        return FrameSaveThread.build_path(base,path_kind=start["path_kind"],subpath=subpath,idx=idx,ext=ext)
+    fmt=start["format"]
+    frame_nbytes=np.dtype(last["dtype"]).itemsize*int(np.prod(last["frame_shape"])) if last["frame_shape"] is not None else None
+    repaired=[]
+    extra=0
+    idx=last["file_idx"]
+    while True:
+        if start["striped"]:
+            path=make_path(subpath="stripes",idx=idx,ext="json")
+        else:
+            path=make_path(idx=idx)
+        if not os.path.exists(path):
+            break
+        current=idx==last["file_idx"]
+        committed=last["file_frames"] if current else 0
+        limit=(last.get("file_committed",committed) if current else 0) if last["preallocated"] else None
+        if fmt in ["tiff","bigtiff"]:
+            nframes=framefiles.repair_tiff_file(path)
+        elif fmt=="compressed":
+            nframes=framefiles.repair_compressed_file(path)
+        elif fmt=="cam":
+            nframes=framefiles.repair_cam_file(path,dtype=last["dtype"] or "<u2")
+        elif start["striped"]:
+            nframes=framefiles.repair_striped_file(path,nframes=limit)
+        elif frame_nbytes:
+            nframes=framefiles.repair_raw_file(path,frame_nbytes,nframes=committed if fmt=="raw_mmap" else limit)
+            if fmt=="raw_mmap" and os.path.exists(make_path(subpath="index",ext="bin")):
+                framefiles.repair_frame_index_file(make_path(subpath="index",ext="bin"))
+        else:
+            nframes=committed
+        if committed is not None:
+            extra+=nframes-committed
+        repaired.append(file_utils.normalize_path(path))
+        if idx is None:
+            break
+        idx+=1
+    saved=last["saved"]+extra
+    frame_info_binary=start["frame_info_format"]=="binary"
+    frame_info_path=make_path(subpath="frameinfo",ext="bin" if frame_info_binary else "dat")
+    last_frame_index=last["last_frame_index"] if extra>=0 else None # some of the journaled frames have been lost
+    if os.path.exists(frame_info_path):
+        if frame_info_binary:
+            framefiles.repair_frame_info_file(frame_info_path,saved)
+        else:
+            framefiles.repair_frame_info_text(frame_info_path,saved)
+        repaired.append(file_utils.normalize_path(frame_info_path))
+        last_frame_index=_get_last_frame_info_index(frame_info_path,frame_info_binary)
+        if last_frame_index is None and extra>=0:
+            last_frame_index=last["last_frame_index"]
+    settings_path=make_path(subpath="settings",ext="dat")
+    settings=loadfile.load_dict(settings_path) if os.path.exists(settings_path) else dictionary.Dictionary()
+    if "save" not in settings:
+        settings["save"]={"path":start["path"],"path_kind":start["path_kind"],"format":fmt,"append":start["append"],
+            "chunk_size":start["filesplit"],"frame_info_format":start["frame_info_format"]}
+    finalized={"saved":saved,"first_frame_index":last["first_frame_index"],"last_frame_index":last_frame_index,
+        "stop_timestamp":(session[-1]["time"] if session else start["time"]),"status/result":"recovered",
+        "recovery/time":time.time(),"recovery/journal_saved":last["saved"],"recovery/recovered":extra}
+    if last["frame_shape"] is not None:
+        finalized["frame/shape"]=tuple(last["frame_shape"])
+        finalized["frame/dtype"]=last["dtype"]
+    settings.update(finalized,"save")
+    savefile.save_dict(settings,settings_path)
+    with open(journal_path,"a") as f:
+        f.write(json.dumps({"event":"stop","time":time.time(),"saved":saved,"recovered":True})+"\n")
+    return {"status":"recovered","saved":saved,"recovered":extra,"files":repaired}